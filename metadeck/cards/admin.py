@@ -1,14 +1,104 @@
-from django.contrib import admin
+import zipfile
+from functools import partial
+
+from django import forms
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import path
+from django.utils.html import format_html, format_html_join
+
+from session.stats import card_summary, deck_summary, deck_top_cards
+from .jobs import new_job_id, save_upload, start_command
 from .models import Deck, Card
+from .sampler import bump_deck_version
+from .utils import thumbnail_url
+
+
+# карт на страницу в инлайне колоды (?cards_page=N)
+CARDS_PER_PAGE = 50
+
+
+def _thumbnail(card):
+    url = thumbnail_url(card.variants, card.image_preview, card.image_full, card.art_original)
+    if not url:
+        return "-"
+    return format_html('<img src="{}" alt="" loading="lazy" style="height:64px; border-radius:4px;">', url)
+
+
+def _cards_page(request) -> int:
+    try:
+        return max(1, int(request.GET.get("cards_page", 1)))
+    except ValueError:
+        return 1
+
+
+def _set_active(modeladmin, request, queryset, active: bool, deck_ids) -> None:
+    # update() без post_save: версии затронутых колод поднимаем сами, по разу
+    deck_ids = set(deck_ids)  # до update: фильтр списка может зависеть от is_active
+    updated = queryset.update(is_active=active)
+    for deck_id in deck_ids:
+        # после коммита (ATOMIC_REQUESTS): пул пересобирается уже из новых строк
+        transaction.on_commit(partial(bump_deck_version, deck_id))
+    state = "activated" if active else "deactivated"
+    modeladmin.message_user(request, f"{updated} {state}.", messages.SUCCESS)
+
+
+def _stats_table(summary: dict, fields: list[str]) -> str:
+    """Rollup summary (session/stats.py) as a small HTML table: by mode, last 30 days, total."""
+    rows = [(row["mode"], *(row[f] or 0 for f in fields)) for row in summary["by_mode"]]
+    rows.append(("last 30 days", *(summary["recent"][f] or 0 for f in fields)))
+    rows.append(("total", *(summary["total"][f] or 0 for f in fields)))
+
+    cells = "".join("<td>{}</td>" for _ in range(len(fields) + 1))
+    return format_html(
+        "<table><tr><th></th>{}</tr>{}</table>",
+        format_html_join("", "<th>{}</th>", ((f,) for f in fields)),
+        format_html_join("", "<tr>" + cells + "</tr>", rows),
+    )
+
+
+class ImportCardsForm(forms.Form):
+    archive = forms.FileField(help_text="ZIP with card images (png, jpg, webp).")
+    sidecar = forms.FileField(
+        required=False,
+        help_text="Optional cards.csv / cards.json (file, title, code, position); "
+        "a cards.csv/cards.json inside the archive is used otherwise.",
+    )
+    render = forms.BooleanField(required=False, help_text="Render card images after the import.")
 
 
 class CardInline(admin.TabularInline):
+    """
+    One page of the deck's cards (?cards_page=N), with thumbnails instead of
+    file widgets: a deck page renders and posts CARDS_PER_PAGE forms, not the
+    whole deck. Images are edited on the card page (show_change_link).
+    """
     model = Card
     extra = 0
-    fields = ("position", "title", "code", "image_preview", "image_full", "is_active")
-    ordering = ("position",)
+    fields = ("position", "thumbnail", "title", "code", "is_active")
+    readonly_fields = ("thumbnail",)
+    ordering = ("position", "id")
     show_change_link = True
 
+    def get_queryset(self, request):
+        qs = super().get_queryset(request).select_related("deck")
+        object_id = request.resolver_match.kwargs.get("object_id") if request.resolver_match else None
+        if not str(object_id or "").isdigit():
+            return qs
+        offset = (_cards_page(request) - 1) * CARDS_PER_PAGE
+        page_ids = list(
+            Card.objects.filter(deck_id=object_id)
+            .order_by("position", "id")
+            .values_list("id", flat=True)[offset:offset + CARDS_PER_PAGE]
+        )
+        return qs.filter(id__in=page_ids)
+
+    @admin.display(description="Preview")
+    def thumbnail(self, obj):
+        return _thumbnail(obj)
+
 
 @admin.register(Deck)
 class DeckAdmin(admin.ModelAdmin):
@@ -16,11 +106,182 @@ class DeckAdmin(admin.ModelAdmin):
     list_filter = ("is_active",)
     search_fields = ("title",)
     inlines = [CardInline]
+    readonly_fields = ("draw_stats", "top_cards")
+    actions = ["render_cards", "activate", "deactivate"]
+    change_form_template = "admin/cards/deck/change_form.html"
+
+    def get_urls(self):
+        urls = [
+            path(
+                "<path:object_id>/import/",
+                self.admin_site.admin_view(self.import_cards_view),
+                name="cards_deck_import",
+            ),
+            path(
+                "<path:object_id>/reorder/",
+                self.admin_site.admin_view(self.reorder_cards_view),
+                name="cards_deck_reorder",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def change_view(self, request, object_id, form_url="", extra_context=None):
+        # навигация по страницам инлайна карт: один COUNT, не зависит от размера колоды
+        total = Card.objects.filter(deck_id=object_id).count() if str(object_id).isdigit() else 0
+        paginator = Paginator(range(total), CARDS_PER_PAGE)
+        extra_context = {
+            **(extra_context or {}),
+            "cards_page": paginator.get_page(_cards_page(request)),
+        }
+        return super().change_view(request, object_id, form_url, extra_context)
+
+    @admin.action(description="Activate selected decks")
+    def activate(self, request, queryset):
+        _set_active(self, request, queryset, True, queryset.values_list("id", flat=True))
+
+    @admin.action(description="Deactivate selected decks")
+    def deactivate(self, request, queryset):
+        _set_active(self, request, queryset, False, queryset.values_list("id", flat=True))
+
+    def reorder_cards_view(self, request, object_id):
+        """Drag-and-drop order of the deck's cards, saved as one bulk_update of `position`."""
+        deck = get_object_or_404(Deck, pk=object_id)
+        if not self.has_change_permission(request, deck):
+            return redirect("admin:cards_deck_change", deck.pk)
+
+        cards = list(
+            Card.objects.filter(deck=deck)
+            .order_by("position", "id")
+            .only("id", "deck_id", "title", "code", "position", "is_active", "variants", "image_preview")
+        )
+
+        if request.method == "POST":
+            by_id = {str(c.id): c for c in cards}
+            order = [cid for cid in request.POST.get("order", "").split(",") if cid in by_id]
+            changed = []
+            for position, cid in enumerate(order, start=1):
+                card = by_id[cid]
+                if card.position != position:
+                    card.position = position
+                    changed.append(card)
+            Card.objects.bulk_update(changed, ["position"], batch_size=1000)
+            if changed:
+                transaction.on_commit(partial(bump_deck_version, deck.id))
+            self.message_user(request, f"Positions updated: {len(changed)}.", messages.SUCCESS)
+            return redirect("admin:cards_deck_change", deck.pk)
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "original": deck,
+            "title": f"Reorder cards of {deck.title}",
+            "cards": [(c, thumbnail_url(c.variants, c.image_preview)) for c in cards],
+        }
+        return render(request, "admin/cards/deck/reorder_cards.html", context)
+
+    def import_cards_view(self, request, object_id):
+        """
+        Upload a ZIP (+ optional sidecar) and import it into this deck in the
+        background: the files are saved to CARD_JOBS_DIR and `manage.py
+        import_deck` (cards/importer.py) is started on them (cards/jobs.py).
+        """
+        deck = get_object_or_404(Deck, pk=object_id)
+        if not self.has_change_permission(request, deck):
+            return redirect("admin:cards_deck_change", deck.pk)
+
+        form = ImportCardsForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            archive = form.cleaned_data["archive"]
+            if not zipfile.is_zipfile(archive):
+                form.add_error("archive", "Not a ZIP archive.")
+            else:
+                job_id = new_job_id("import_deck")
+                args = [save_upload(archive, job_id), "--deck", deck.pk, "--delete-source", "--verbosity", 2]
+                if form.cleaned_data["sidecar"]:
+                    args += ["--sidecar", save_upload(form.cleaned_data["sidecar"], job_id)]
+                if form.cleaned_data["render"]:
+                    args.append("--render")
+                log_path = start_command("import_deck", *args, job_id=job_id)
+                self.message_user(
+                    request,
+                    f"Importing {archive.name} in the background; log: {log_path}",
+                    messages.INFO,
+                )
+                return redirect("admin:cards_deck_change", deck.pk)
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "original": deck,
+            "title": f"Import cards into {deck.title}",
+            "form": form,
+        }
+        return render(request, "admin/cards/deck/import_cards.html", context)
+
+    @admin.action(description="Render card images (changed cards only)")
+    def render_cards(self, request, queryset):
+        # пул процессов — не в веб-воркере: запускаем `manage.py render_cards` отдельно (cards/jobs.py)
+        deck_ids = list(queryset.values_list("id", flat=True))
+        if not deck_ids:
+            return
+        args = [arg for deck_id in deck_ids for arg in ("--deck", deck_id)]
+        log_path = start_command("render_cards", *args, "--verbosity", 2)
+        self.message_user(
+            request,
+            f"Rendering {len(deck_ids)} deck(s) in the background; log: {log_path}",
+            messages.INFO,
+        )
+
+    @admin.display(description="Draw stats")
+    def draw_stats(self, obj):
+        if obj.pk is None:
+            return "-"
+        return _stats_table(deck_summary(obj.pk), ["draws", "cards_drawn", "flips", "resets"])
+
+    @admin.display(description="Most drawn cards")
+    def top_cards(self, obj):
+        if obj.pk is None:
+            return "-"
+        return format_html(
+            "<ol>{}</ol>",
+            format_html_join(
+                "",
+                "<li>{} — {} draws, {} flips</li>",
+                (
+                    (row["card__title"] or f"#{row['card_id']}", row["draws"], row["flips"])
+                    for row in deck_top_cards(obj.pk)
+                ),
+            ),
+        )
 
 
 @admin.register(Card)
 class CardAdmin(admin.ModelAdmin):
-    list_display = ("id", "deck", "position", "title", "code", "is_active", "created_at")
-    list_filter = ("deck", "is_active")
+    list_display = ("id", "thumbnail", "deck", "position", "title", "code", "is_active", "created_at")
+    list_display_links = ("id", "title")
+    list_filter = ("is_active", "deck")
+    list_select_related = ("deck",)
     search_fields = ("title", "code", "deck__title")
+    autocomplete_fields = ("deck",)
     ordering = ("deck", "position", "id")
+    readonly_fields = ("thumbnail", "draw_stats")
+    list_per_page = 100
+    actions = ["activate", "deactivate"]
+
+    @admin.display(description="Preview")
+    def thumbnail(self, obj):
+        return _thumbnail(obj)
+
+    @admin.action(description="Activate selected cards")
+    def activate(self, request, queryset):
+        _set_active(self, request, queryset, True, queryset.order_by().values_list("deck_id", flat=True).distinct())
+
+    @admin.action(description="Deactivate selected cards")
+    def deactivate(self, request, queryset):
+        _set_active(self, request, queryset, False, queryset.order_by().values_list("deck_id", flat=True).distinct())
+
+    @admin.display(description="Draw stats")
+    def draw_stats(self, obj):
+        if obj.pk is None:
+            return "-"
+        return _stats_table(card_summary(obj.pk), ["draws", "flips"])
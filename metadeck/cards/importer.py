@@ -0,0 +1,306 @@
+# metadeck/cards/importer.py
+"""
+Bulk deck import from a directory or ZIP archive of card art.
+
+An optional sidecar (cards.csv / cards.json at the top of the source, or
+passed explicitly) gives per-file title, code and position:
+
+    file,title,code,position            [{"file": "01.png", "title": "Sun",
+    01.png,Sun,sun,1                      "code": "sun", "position": 1}, ...]
+
+Files without a sidecar row (or without a position in it) get a title from
+the file name and the next free position: only those files are numbered,
+consecutively in name order, after the deck's current last position.
+
+Pipeline: the parent reads one file at a time (ZIP members are read one by
+one, the archive is never loaded whole), worker processes hash, decode and
+validate it (Pillow), the parent takes results back in name order, saves
+valid art to storage and collects Card rows that are `bulk_create`d in
+batches of `batch_size`, each batch in its own transaction.
+
+Idempotent and resumable: every card stores `art_hash` (sha256 of the file,
+unique per deck), so a re-run skips art that is already in the deck and
+continues where an interrupted run stopped. Codes already used in the deck
+are reported instead of violating `unique_card_code_in_deck`. Rows lost to a
+concurrent import of the same deck (IntegrityError on insert) are dropped
+from the batch and counted as skipped, and the batch is inserted again.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import posixpath
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from PIL import Image
+
+from .sampler import bump_deck_version
+
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
+SIDECAR_NAMES = ("cards.csv", "cards.json")
+# больше — почти наверняка не арт карты (или zip-бомба)
+MAX_FILE_BYTES = 50 * 1024 * 1024
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    skipped: int = 0
+    failed: list = field(default_factory=list)
+
+
+# ---------- sources ----------
+def _is_candidate(name: str) -> bool:
+    base = posixpath.basename(name)
+    return (
+        not base.startswith(".")
+        and not name.startswith("__MACOSX/")
+        and posixpath.splitext(base)[1].lower() in IMAGE_EXTENSIONS
+    )
+
+
+class DirectorySource:
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def entries(self) -> list[str]:
+        return sorted(
+            p.relative_to(self.root).as_posix()
+            for p in self.root.rglob("*")
+            if p.is_file() and _is_candidate(p.relative_to(self.root).as_posix())
+        )
+
+    def size(self, name: str) -> int:
+        return (self.root / name).stat().st_size
+
+    def read(self, name: str) -> bytes:
+        return (self.root / name).read_bytes()
+
+    def sidecar(self):
+        for name in SIDECAR_NAMES:
+            if (self.root / name).is_file():
+                return name, (self.root / name).read_bytes()
+        return None
+
+    def close(self) -> None:
+        pass
+
+
+class ZipSource:
+    def __init__(self, file):
+        # путь или seekable file-like (UploadedFile из админки): члены читаются по одному
+        self.zip = zipfile.ZipFile(file)
+
+    def entries(self) -> list[str]:
+        return sorted(
+            i.filename for i in self.zip.infolist() if not i.is_dir() and _is_candidate(i.filename)
+        )
+
+    def size(self, name: str) -> int:
+        return self.zip.getinfo(name).file_size
+
+    def read(self, name: str) -> bytes:
+        with self.zip.open(name) as f:
+            return f.read()
+
+    def sidecar(self):
+        names = set(self.zip.namelist())
+        for name in SIDECAR_NAMES:
+            if name in names:
+                return name, self.read(name)
+        return None
+
+    def close(self) -> None:
+        self.zip.close()
+
+
+def open_source(path_or_file):
+    """DirectorySource for a directory, ZipSource for a ZIP path or file; ValueError otherwise."""
+    if isinstance(path_or_file, (str, os.PathLike)) and Path(path_or_file).is_dir():
+        return DirectorySource(path_or_file)
+    if not zipfile.is_zipfile(path_or_file):
+        raise ValueError("Source must be a directory or a ZIP archive")
+    if hasattr(path_or_file, "seek"):
+        path_or_file.seek(0)
+    return ZipSource(path_or_file)
+
+
+# ---------- sidecar ----------
+def parse_sidecar(name: str, data: bytes) -> dict[str, dict]:
+    """{file: {"title", "code", "position"}} from CSV or JSON; ValueError on bad input."""
+    text = data.decode("utf-8-sig")
+    if name.lower().endswith(".json"):
+        parsed = json.loads(text)
+        rows = [{"file": k, **v} for k, v in parsed.items()] if isinstance(parsed, dict) else parsed
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+
+    meta = {}
+    for line, row in enumerate(rows, start=1):
+        file = str(row.get("file") or "").strip()
+        if not file:
+            raise ValueError(f"{name}: row {line} has no 'file'")
+        position = str(row.get("position") or "").strip()
+        if position and not position.isdigit():
+            raise ValueError(f"{name}: row {line}: bad position {position!r}")
+        meta[file] = {
+            "title": str(row.get("title") or "").strip(),
+            "code": str(row.get("code") or "").strip(),
+            "position": int(position) if position else None,
+        }
+    return meta
+
+
+def _lookup(meta: dict, name: str) -> dict:
+    # в sidecar можно писать и путь внутри архива, и просто имя файла
+    return meta.get(name) or meta.get(posixpath.basename(name)) or {}
+
+
+# ---------- worker ----------
+def inspect_task(name: str, data: bytes) -> tuple[str, str]:
+    """(name, sha256) if `data` is a fully decodable image; raises otherwise."""
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()  # полное декодирование: битый/обрезанный файл падает здесь
+    return name, hashlib.sha256(data).hexdigest()
+
+
+# ---------- import ----------
+def _drop_taken(deck, batch: list, result: ImportResult, storage) -> list:
+    """
+    Rows of `batch` ((name, Card) pairs) whose art and code are still free in
+    the deck after an insert conflict; the others are counted as skipped /
+    failed and their saved art is deleted.
+    """
+    Card = apps.get_model("cards", "Card")
+    in_deck = Card.objects.filter(deck=deck)
+    hashes = set(in_deck.filter(art_hash__in=[c.art_hash for _, c in batch]).values_list("art_hash", flat=True))
+    codes = set(in_deck.filter(code__in=[c.code for _, c in batch if c.code]).values_list("code", flat=True))
+
+    kept = []
+    for name, card in batch:
+        if card.art_hash in hashes:
+            result.skipped += 1
+        elif card.code and card.code in codes:
+            result.failed.append((name, f"code {card.code!r} is already used in this deck"))
+        else:
+            kept.append((name, card))
+            continue
+        # с ContentHashStorage файл общий с победившей строкой — delete() там no-op
+        storage.delete(card.art_original.name)
+    return kept
+
+
+def import_cards(deck, source, sidecar=None, workers=None, batch_size=200, log=None) -> ImportResult:
+    """
+    Import every image of `source` (open_source) into `deck`.
+    `sidecar` is (name, bytes) and overrides the one inside the source.
+    """
+    Card = apps.get_model("cards", "Card")
+    art_field = Card._meta.get_field("art_original")
+    result = ImportResult()
+
+    sidecar = sidecar or source.sidecar()
+    meta = parse_sidecar(*sidecar) if sidecar else {}
+
+    existing = Card.objects.filter(deck=deck)
+    hashes = set(existing.exclude(art_hash="").values_list("art_hash", flat=True))
+    codes = set(existing.exclude(code="").values_list("code", flat=True))
+    next_position = (existing.aggregate(m=Max("position"))["m"] or 0) + 1
+
+    names = source.entries()
+    if not names:
+        return result
+    rows = []
+
+    def flush():
+        batch = rows[:]
+        rows.clear()
+        while batch:
+            try:
+                with transaction.atomic():
+                    Card.objects.bulk_create([card for _, card in batch])
+                break
+            except IntegrityError:
+                # параллельный импорт той же колоды успел вставить часть этих карт — их выкидываем
+                kept = _drop_taken(deck, batch, result, art_field.storage)
+                if len(kept) == len(batch):
+                    raise  # не конфликт с параллельным импортом — ошибка как есть
+                batch = kept
+        result.created += len(batch)
+        if log and batch:
+            log(f"imported {result.created} cards")
+
+    workers = workers or getattr(settings, "CARD_RENDER_WORKERS", 0) or os.cpu_count() or 1
+    queue = list(names)
+    with ProcessPoolExecutor(max_workers=min(workers, len(names))) as pool:
+        pending = {}
+        # в полёте не больше 2×workers файлов: память не растёт с размером архива
+        while queue or pending:
+            while queue and len(pending) < 2 * workers:
+                name = queue.pop(0)
+                if source.size(name) > MAX_FILE_BYTES:
+                    result.failed.append((name, f"larger than {MAX_FILE_BYTES} bytes"))
+                    continue
+                data = source.read(name)
+                pending[pool.submit(inspect_task, name, data)] = (name, data)
+            if not pending:
+                break
+
+            # разбираем строго в порядке имён (pending упорядочен по отправке): ждём самый старый,
+            # заодно забираем уже готовые следом за ним
+            wait([next(iter(pending))])
+            while pending and next(iter(pending)).done():
+                future = next(iter(pending))
+                name, data = pending.pop(future)
+                try:
+                    _, digest = future.result()
+                except Exception as exc:
+                    result.failed.append((name, f"not a valid image: {exc}"))
+                    continue
+
+                if digest in hashes:
+                    result.skipped += 1
+                    continue
+                info = _lookup(meta, name)
+                code = info.get("code", "")
+                if code and code in codes:
+                    result.failed.append((name, f"code {code!r} is already used in this deck"))
+                    continue
+
+                base = posixpath.basename(name)
+                position = info.get("position")
+                if position is None:
+                    # нумеруем только файлы без позиции в sidecar
+                    position, next_position = next_position, next_position + 1
+                stored = art_field.storage.save(art_field.generate_filename(None, base), ContentFile(data))
+                rows.append(
+                    (name, Card(
+                        deck=deck,
+                        title=info.get("title") or posixpath.splitext(base)[0].replace("_", " "),
+                        code=code,
+                        position=position,
+                        art_original=stored,
+                        art_hash=digest,
+                    ))
+                )
+                hashes.add(digest)
+                if code:
+                    codes.add(code)
+                if len(rows) >= batch_size:
+                    flush()
+    flush()
+
+    # bulk_create без post_save: версию колоды поднимаем один раз
+    if result.created:
+        bump_deck_version(deck.id)
+    return result
@@ -0,0 +1,55 @@
+# metadeck/cards/jobs.py
+"""
+Background card jobs started from the admin.
+
+Rendering, importing and building image variants are CPU-heavy (a process
+pool, or seconds of AVIF encoding). They must not run inside a web worker:
+forking there copies its threads and DB connections, and the job is bounded
+by the request timeout. Instead the admin (and the Card/Deck save signals)
+only start the management command (render_cards / import_deck /
+build_variants) as a detached process; the admin reports where its log is
+written (CARD_JOBS_DIR).
+"""
+import subprocess
+import sys
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+
+
+def jobs_dir() -> Path:
+    path = Path(settings.CARD_JOBS_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def new_job_id(command: str) -> str:
+    return f"{datetime.now():%Y%m%d-%H%M%S}-{command}-{uuid.uuid4().hex[:8]}"
+
+
+def save_upload(upload, job_id: str) -> Path:
+    """Copy an uploaded file into CARD_JOBS_DIR (chunked) for a background job."""
+    path = jobs_dir() / f"{job_id}-{Path(upload.name).name}"
+    with open(path, "wb") as f:
+        for chunk in upload.chunks():
+            f.write(chunk)
+    return path
+
+
+def start_command(command: str, *args, job_id: str | None = None) -> Path:
+    """Start `manage.py <command> *args` detached from the caller; returns the path of its log."""
+    job_id = job_id or new_job_id(command)
+    log_path = jobs_dir() / f"{job_id}.log"
+    with open(log_path, "wb") as log:
+        # своя сессия: перезапуск/остановка веб-воркера задачу не убивает
+        subprocess.Popen(
+            [sys.executable, str(Path(settings.BASE_DIR) / "manage.py"), command, *map(str, args)],
+            cwd=settings.BASE_DIR,
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+    return log_path
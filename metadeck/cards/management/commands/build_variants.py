@@ -0,0 +1,82 @@
+# metadeck/cards/management/commands/build_variants.py
+from django.core.management.base import BaseCommand, CommandError
+
+from cards.models import Card, Deck
+from cards.variants import available_formats, build_many
+
+
+class Command(BaseCommand):
+    help = (
+        "Build responsive WebP/AVIF variants (several widths) of card images and "
+        "deck backs in a process pool. Only stale sets (new source file or new "
+        "VARIANTS_VERSION) are rebuilt unless --force. Started in the background by the "
+        "Card/Deck save signals (cards/signals.py) for the saved object."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--deck",
+            type=int,
+            action="append",
+            default=[],
+            help="Deck id (repeatable). Default: all decks.",
+        )
+        parser.add_argument(
+            "--card",
+            type=int,
+            action="append",
+            default=[],
+            help="Card id (repeatable): only these cards, no deck backs.",
+        )
+        parser.add_argument(
+            "--no-cards",
+            action="store_true",
+            help="Only the deck backs of the selected decks.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Rebuild every variant set, even if it is up to date.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Worker processes (default: CARD_RENDER_WORKERS, 0 = all cores).",
+        )
+
+    def handle(self, *args, **options):
+        decks = Deck.objects.order_by("id")
+        if options["card"]:
+            decks = decks.filter(cards__id__in=options["card"]).distinct()
+        elif options["deck"]:
+            decks = decks.filter(id__in=options["deck"])
+
+        self.stdout.write(f"Formats: {', '.join(available_formats())}")
+        failed = 0
+        for deck in decks:
+            cards = Card.objects.filter(deck=deck).only("id", "deck_id", "image_full", "variants")
+            if options["card"]:
+                objects = list(cards.filter(id__in=options["card"]))
+            elif options["no_cards"]:
+                objects = [deck]
+            else:
+                objects = [deck, *cards]
+            result = build_many(
+                objects,
+                force=options["force"],
+                workers=options["workers"] or None,
+                log=self.stdout.write if options["verbosity"] > 1 else None,
+            )
+            self.stdout.write(
+                f"deck {deck.id} «{deck.title}»: built {result['built']}, "
+                f"unchanged {result['unchanged']}, cleared {result['cleared']}, "
+                f"failed {len(result['failed'])}"
+            )
+            for (kind, pk), error in result["failed"]:
+                self.stderr.write(f"  {kind} {pk}: {error}")
+            failed += len(result["failed"])
+
+        if failed:
+            raise CommandError(f"{failed} image(s) failed.")
+        self.stdout.write(self.style.SUCCESS("Done."))
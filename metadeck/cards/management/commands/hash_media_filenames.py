@@ -0,0 +1,193 @@
+# metadeck/cards/management/commands/hash_media_filenames.py
+import posixpath
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from cards.models import Card, Deck
+from cards.rendering import render_hash
+from cards.sampler import bump_deck_version
+from cards.variants import is_current
+from metadeck.storage import ContentHashStorage, is_hashed_name
+
+
+# файловые поля и поле с метаданными вариантов (cards/variants.py) по модели
+FILE_FIELDS = {
+    Deck: ("back_preview", "back_full", "frame_overlay"),
+    Card: ("art_original", "image_preview", "image_full"),
+}
+VARIANT_FIELDS = {Deck: "back_variants", Card: "variants"}
+VARIANTS_DIR = "variants"
+
+
+class Command(BaseCommand):
+    help = (
+        "Move existing media files to content-addressed names (sha256 of the bytes, "
+        "see metadeck/storage.py) and point Deck/Card fields and stored variant sets at "
+        "them. Old files are kept, so cached room snapshots keep working; remove them "
+        "later with --prune, which deletes every media file no row references."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Rows per batch (default: 500).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report what would be renamed / deleted.",
+        )
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help=(
+                "Instead of renaming, delete media files not referenced by any Deck/Card "
+                "(run when no uploads/renders are in progress)."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentHashStorage):
+            raise CommandError(
+                "Default storage is not metadeck.storage.ContentHashStorage (MEDIA_CONTENT_HASH=0?)."
+            )
+        self.options = options
+
+        if options["prune"]:
+            self.prune()
+            return
+
+        # раньше переименования: старые имена входят в render_hash и в "source" вариантов
+        rendered = self.current_renders()
+
+        totals = {"renamed": 0, "missing": 0, "rows": 0}
+        decks = set()
+        for model in (Deck, Card):
+            for obj in self.iterate(model):
+                changes = self.rename_row(obj, totals)
+                if changes:
+                    totals["rows"] += 1
+                    decks.add(obj.pk if model is Deck else obj.deck_id)
+                    if not options["dry_run"]:
+                        model.objects.filter(pk=obj.pk).update(**changes)
+
+        if rendered and not options["dry_run"]:
+            # рендер не устарел от того, что файлы переехали — пересчитываем хэш по новым именам
+            for card in Card.objects.filter(id__in=rendered).select_related("deck"):
+                Card.objects.filter(pk=card.pk).update(render_hash=render_hash(card, card.deck))
+
+        if not options["dry_run"]:
+            for deck_id in decks:
+                bump_deck_version(deck_id)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Files renamed: {totals['renamed']} | rows updated: {totals['rows']} "
+                f"| missing files: {totals['missing']}"
+                + (" (dry-run)" if options["dry_run"] else "")
+            )
+        )
+
+    # ---------- rename ----------
+    def iterate(self, model):
+        # keyset по pk: без OFFSET, память ограничена батчем
+        last_pk = 0
+        while True:
+            batch = list(model.objects.filter(pk__gt=last_pk).order_by("pk")[: self.options["batch_size"]])
+            if not batch:
+                return
+            yield from batch
+            last_pk = batch[-1].pk
+
+    def current_renders(self) -> list[int]:
+        return [
+            card.pk
+            for card in Card.objects.exclude(render_hash="").select_related("deck").iterator(chunk_size=500)
+            if card.render_hash == render_hash(card, card.deck)
+        ]
+
+    def move(self, name: str, totals: dict) -> str:
+        """Content-addressed name for `name` (file copied unless dry-run); `name` if missing."""
+        if not name or is_hashed_name(name):
+            return name
+        if not default_storage.exists(name):
+            totals["missing"] += 1
+            self.stderr.write(f"missing: {name}")
+            return name
+        totals["renamed"] += 1
+        if self.options["dry_run"]:
+            return name
+        with default_storage.open(name, "rb") as f:
+            return default_storage.save(name, f)
+
+    def rename_row(self, obj, totals: dict) -> dict:
+        model = type(obj)
+        meta_field = VARIANT_FIELDS[model]
+        variants_current = is_current(obj)
+
+        changes = {}
+        for field_name in FILE_FIELDS[model]:
+            field_file = getattr(obj, field_name)
+            new = self.move(field_file.name, totals)
+            if new != field_file.name:
+                field_file.name = new
+                changes[field_name] = new
+
+        meta = getattr(obj, meta_field) or {}
+        if meta:
+            files = {
+                fmt: [[w, self.move(name, totals)] for w, name in items]
+                for fmt, items in meta.get("files", {}).items()
+            }
+            new_meta = {**meta, "files": files}
+            if variants_current:
+                source_field = "back_full" if model is Deck else "image_full"
+                new_meta["source"] = getattr(obj, source_field).name
+            if new_meta != meta:
+                changes[meta_field] = new_meta
+        return changes
+
+    # ---------- prune ----------
+    def referenced(self) -> set[str]:
+        names = set()
+        for model, fields in FILE_FIELDS.items():
+            meta_field = VARIANT_FIELDS[model]
+            for row in model.objects.values_list(*fields, meta_field).iterator(chunk_size=2000):
+                *files, meta = row
+                names.update(name for name in files if name)
+                for items in (meta or {}).get("files", {}).values():
+                    names.update(name for _, name in items)
+        return names
+
+    def walk(self, directory: str):
+        if not default_storage.exists(directory):
+            return
+        dirs, files = default_storage.listdir(directory)
+        for name in files:
+            yield posixpath.join(directory, name)
+        for sub in dirs:
+            yield from self.walk(posixpath.join(directory, sub))
+
+    def prune(self) -> None:
+        referenced = self.referenced()
+        roots = {VARIANTS_DIR}
+        for model, fields in FILE_FIELDS.items():
+            for field_name in fields:
+                roots.add(model._meta.get_field(field_name).upload_to.rstrip("/"))
+
+        deleted = 0
+        for root in sorted(roots):
+            for name in self.walk(root):
+                if name in referenced:
+                    continue
+                deleted += 1
+                if self.options["verbosity"] > 1:
+                    self.stdout.write(f"delete {name}")
+                if not self.options["dry_run"]:
+                    default_storage.delete_unreferenced(name)
+
+        suffix = " (dry-run)" if self.options["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(f"Unreferenced files deleted: {deleted}{suffix}"))
@@ -0,0 +1,103 @@
+# metadeck/cards/management/commands/import_deck.py
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cards.importer import import_cards, open_source
+from cards.models import Deck
+from cards.rendering import render_deck
+
+
+class Command(BaseCommand):
+    help = (
+        "Import card art from a directory or ZIP archive into a deck, with an optional "
+        "cards.csv / cards.json sidecar (file, title, code, position). Files are validated "
+        "in a process pool and inserted in batches; re-running skips art already in the "
+        "deck (sha256), so an interrupted import can simply be restarted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="Directory or .zip with card images.")
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument("--deck", type=int, help="Existing deck id.")
+        target.add_argument("--title", help="Deck title; created (inactive) if it does not exist.")
+        parser.add_argument(
+            "--sidecar",
+            help="CSV/JSON with file,title,code,position (default: cards.csv/cards.json in the source).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Worker processes (default: CARD_RENDER_WORKERS, 0 = all cores).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+            help="Cards per bulk insert / transaction (default: 200).",
+        )
+        parser.add_argument(
+            "--render",
+            action="store_true",
+            help="Render card images (render_cards) after the import.",
+        )
+        parser.add_argument(
+            "--delete-source",
+            action="store_true",
+            help="Delete the source (and sidecar) files after a finished import "
+            "(used for archives uploaded in the admin).",
+        )
+
+    def handle(self, *args, **options):
+        if options["deck"]:
+            deck = Deck.objects.filter(id=options["deck"]).first()
+            if deck is None:
+                raise CommandError(f"Deck {options['deck']} not found.")
+        else:
+            # новая колода выключена, пока её не проверили в админке
+            deck, created = Deck.objects.get_or_create(title=options["title"], defaults={"is_active": False})
+            if created:
+                self.stdout.write(f"Created deck {deck.id} «{deck.title}» (inactive)")
+
+        sidecar = None
+        if options["sidecar"]:
+            path = Path(options["sidecar"])
+            sidecar = (path.name, path.read_bytes())
+
+        try:
+            source = open_source(options["source"])
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+        try:
+            result = import_cards(
+                deck,
+                source,
+                sidecar=sidecar,
+                workers=options["workers"] or None,
+                batch_size=options["batch_size"],
+                log=self.stdout.write if options["verbosity"] > 1 else None,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        finally:
+            source.close()
+
+        if options["delete_source"]:
+            # только после завершённого импорта: прерванный можно перезапустить на тех же файлах
+            for path in (options["source"], options["sidecar"]):
+                if path and Path(path).is_file():
+                    Path(path).unlink()
+
+        for name, error in result.failed:
+            self.stderr.write(f"  {name}: {error}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"deck {deck.id}: created {result.created}, already imported {result.skipped}, "
+                f"failed {len(result.failed)}"
+            )
+        )
+
+        if options["render"]:
+            rendered = render_deck(deck, workers=options["workers"] or None)
+            self.stdout.write(f"rendered {rendered.rendered}, failed {len(rendered.failed)}")
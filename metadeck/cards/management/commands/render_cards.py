@@ -0,0 +1,66 @@
+# metadeck/cards/management/commands/render_cards.py
+from django.core.management.base import BaseCommand, CommandError
+
+from cards.models import Deck
+from cards.rendering import render_deck
+
+
+class Command(BaseCommand):
+    help = (
+        "Render image_full / image_preview of cards (art + deck frame overlay + colors "
+        "+ title) in a process pool. Incremental: cards whose inputs did not change "
+        "since the last render are skipped unless --force."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--deck",
+            type=int,
+            action="append",
+            default=[],
+            help="Deck id to render (repeatable).",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Render all active decks.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Re-render every card, even if its inputs did not change.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Worker processes (default: CARD_RENDER_WORKERS, 0 = all cores).",
+        )
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            decks = Deck.objects.filter(is_active=True).order_by("id")
+        elif options["deck"]:
+            decks = Deck.objects.filter(id__in=options["deck"]).order_by("id")
+        else:
+            raise CommandError("Pass --deck ID (repeatable) or --all.")
+
+        failed = 0
+        for deck in decks:
+            result = render_deck(
+                deck,
+                force=options["force"],
+                workers=options["workers"] or None,
+                log=self.stdout.write if options["verbosity"] > 1 else None,
+            )
+            self.stdout.write(
+                f"deck {deck.id} «{deck.title}»: rendered {result.rendered}, "
+                f"unchanged {result.unchanged}, no art {result.no_art}, failed {len(result.failed)}"
+            )
+            for card_id, error in result.failed:
+                self.stderr.write(f"  card {card_id}: {error}")
+            failed += len(result.failed)
+
+        if failed:
+            raise CommandError(f"{failed} card(s) failed to render.")
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,69 @@
+# metadeck/cards/manifest.py
+"""
+Per-deck asset manifest: card id -> image URL + variant srcsets, plus the
+deck back.
+
+Room messages carry only card ids and `manifest_version`; the client loads
+the manifest once per deck (cards.views.deck_manifest), renders from it and
+prefetches images before any card is drawn.
+
+The manifest is built once per deck version (Card/Deck signals bump it, see
+cards/sampler.py) and cached under a versioned key, so invalidation is
+automatic. `version` is a digest of the content: it doubles as the HTTP ETag
+and stays correct even if the cache (and the version counter) is lost.
+"""
+import hashlib
+import json
+
+from django.apps import apps
+from django.core.cache import cache
+from django.utils import timezone
+
+from .sampler import POOL_TTL_SECONDS, get_deck_version
+from .utils import file_url, srcsets
+
+
+def deck_manifest_key(deck_id: int, version: int) -> str:
+    return f"metadeck:deck:{deck_id}:manifest:{version}"
+
+
+def build_manifest(deck_id: int) -> dict | None:
+    """{"version", "last_modified", "body"} for the deck, None if it does not exist."""
+    Deck = apps.get_model("cards", "Deck")
+    Card = apps.get_model("cards", "Card")
+
+    deck = Deck.objects.filter(id=deck_id).only("id", "back_full", "back_variants").first()
+    if deck is None:
+        return None
+
+    # все карты, а не только активные: выключенная карта может лежать в текущей раздаче
+    content = {
+        "deck_id": deck.id,
+        "back": {"url": file_url(deck.back_full), "srcset": srcsets(deck.back_variants)},
+        "cards": {
+            str(c.id): {"url": file_url(c.image_full), "srcset": srcsets(c.variants)}
+            for c in Card.objects.filter(deck_id=deck_id).order_by().only("id", "image_full", "variants")
+        },
+    }
+    raw = json.dumps(content, sort_keys=True, separators=(",", ":"))
+    version = hashlib.sha256(raw.encode()).hexdigest()[:16]
+    return {
+        "version": version,
+        "last_modified": timezone.now().replace(microsecond=0),
+        "body": json.dumps({"version": version, **content}, separators=(",", ":")),
+    }
+
+
+def get_manifest(deck_id: int) -> dict | None:
+    key = deck_manifest_key(deck_id, get_deck_version(deck_id))
+    manifest = cache.get(key)
+    if manifest is None:
+        manifest = build_manifest(deck_id)
+        if manifest is not None:
+            cache.set(key, manifest, POOL_TTL_SECONDS)
+    return manifest
+
+
+def manifest_version(deck_id: int) -> str:
+    manifest = get_manifest(deck_id)
+    return manifest["version"] if manifest else ""
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-17 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0002_card_art_original_deck_frame_color_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='render_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-17 17:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0003_card_render_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='deck',
+            name='back_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0.1 on 2026-10-17 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0004_card_variants_deck_back_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='art_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name='card',
+            constraint=models.UniqueConstraint(condition=models.Q(('art_hash__gt', '')), fields=('deck', 'art_hash'), name='unique_card_art_in_deck'),
+        ),
+    ]
@@ -9,6 +9,8 @@ class Deck(models.Model):
     # рубашка
     back_preview = models.ImageField(upload_to="decks/back/preview/", blank=True, null=True)
     back_full = models.ImageField(upload_to="decks/back/full/", blank=True, null=True)
+    # WebP/AVIF-варианты рубашки по ширинам (cards/variants.py)
+    back_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     # рамка-оверлей (PNG с прозрачностью), одинаковая для колоды
     frame_overlay = models.ImageField(upload_to="decks/frame_overlay/", blank=True, null=True)
@@ -38,10 +40,16 @@ class Card(models.Model):
 
     # 1) исходный арт (без рамок)
     art_original = models.ImageField(upload_to="cards/art/original/", blank=True, null=True)
+    # sha256 арта: повторный импорт того же файла в колоду пропускается (cards/importer.py)
+    art_hash = models.CharField(max_length=64, blank=True, editable=False)
 
     # 2) готовая карточка (арт + рамка + стиль) в двух размерах
     image_preview = models.ImageField(upload_to="cards/render/preview/", blank=True, null=True)
     image_full = models.ImageField(upload_to="cards/render/full/", blank=True, null=True)
+    # хэш входов последнего рендера (cards/rendering.py): совпал — карту не перерисовываем
+    render_hash = models.CharField(max_length=64, blank=True, editable=False)
+    # WebP/AVIF-варианты image_full по ширинам (cards/variants.py)
+    variants = models.JSONField(default=dict, blank=True, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -55,7 +63,12 @@ class Card(models.Model):
                 fields=["deck", "code"],
                 name="unique_card_code_in_deck",
                 condition=models.Q(code__gt=""),
-            )
+            ),
+            models.UniqueConstraint(
+                fields=["deck", "art_hash"],
+                name="unique_card_art_in_deck",
+                condition=models.Q(art_hash__gt=""),
+            ),
         ]
 
     def __str__(self):
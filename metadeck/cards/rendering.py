@@ -0,0 +1,233 @@
+# metadeck/cards/rendering.py
+"""
+Card renderer: art + deck frame overlay + colors + title -> image_full / image_preview.
+
+Pillow compositing is CPU-bound, so a deck is rendered across a
+ProcessPoolExecutor (CARD_RENDER_WORKERS processes, default: all cores).
+Workers get plain bytes and return encoded images; all storage and DB work
+stays in the parent. The deck style (overlay, colors) is sent once per
+worker via the pool initializer, not with every card.
+
+Rendering is incremental: each card stores `render_hash`, a digest of
+everything the output depends on (art file, overlay file, colors, title,
+sizes, RENDER_VERSION). Cards whose hash matches are skipped, so changing a
+deck's frame re-renders every card, and touching one card re-renders one.
+Rows are written as each batch of finished cards comes back, and the old
+files are deleted only after that update commits: a room never points at a
+deleted file, and an interrupted run resumes where it stopped.
+Re-rendered cards get their responsive variants rebuilt (cards/variants.py).
+The admin action only starts `manage.py render_cards` in the background
+(cards/jobs.py); the pool never runs inside a web worker.
+"""
+import hashlib
+import io
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+from .sampler import bump_deck_version
+from .variants import build_many
+
+
+# поднять, если поменялась сама логика отрисовки — перерисуются все карты
+RENDER_VERSION = 1
+
+FULL_SIZE = (1000, 1500)
+PREVIEW_SIZE = (320, 480)
+JPEG_QUALITY = 88
+
+
+@dataclass
+class RenderResult:
+    rendered: int = 0
+    unchanged: int = 0
+    no_art: int = 0
+    failed: list = field(default_factory=list)
+
+
+# ---------- pure Pillow part (runs in worker processes) ----------
+_worker_style: dict = {}
+
+
+def _init_worker(overlay_bytes: bytes | None, style: dict) -> None:
+    global _worker_style
+    overlay = None
+    if overlay_bytes:
+        overlay = Image.open(io.BytesIO(overlay_bytes)).convert("RGBA")
+        overlay = overlay.resize(FULL_SIZE, Image.Resampling.LANCZOS)
+    _worker_style = {**style, "overlay": overlay}
+
+
+def _font(px: int):
+    path = getattr(settings, "CARD_RENDER_FONT", "")
+    if path:
+        return ImageFont.truetype(path, px)
+    return ImageFont.load_default(size=px)
+
+
+def _fit_title(draw, title: str, font, max_width: int) -> str:
+    if draw.textlength(title, font=font) <= max_width:
+        return title
+    while title and draw.textlength(title + "…", font=font) > max_width:
+        title = title[:-1]
+    return title + "…"
+
+
+def compose(art_bytes: bytes, title: str, style: dict) -> Image.Image:
+    """Full-size RGB card: frame color background, art (cover-fit), overlay, title band."""
+    width, height = FULL_SIZE
+    border = round(width * 0.06)
+    band = round(height * 0.12) if title else 0
+
+    card = Image.new("RGBA", FULL_SIZE, style["frame_color"])
+
+    art = Image.open(io.BytesIO(art_bytes))
+    art = ImageOps.exif_transpose(art).convert("RGBA")
+    box = (width - 2 * border, height - 2 * border - band)
+    card.alpha_composite(ImageOps.fit(art, box, Image.Resampling.LANCZOS), (border, border))
+
+    if style.get("overlay") is not None:
+        card.alpha_composite(style["overlay"])
+
+    if title:
+        draw = ImageDraw.Draw(card)
+        font = _font(round(band * 0.42))
+        text = _fit_title(draw, title, font, width - 2 * border)
+        center = (width // 2, height - border - band // 2)
+        draw.text(center, text, font=font, fill=style["text_color"], anchor="mm")
+
+    return card.convert("RGB")
+
+
+def _encode(image: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    image.save(buf, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buf.getvalue()
+
+
+def render_task(card_id: int, art_bytes: bytes, title: str) -> tuple[int, bytes, bytes]:
+    full = compose(art_bytes, title, _worker_style)
+    preview = full.resize(PREVIEW_SIZE, Image.Resampling.LANCZOS)
+    return card_id, _encode(full), _encode(preview)
+
+
+# ---------- orchestration (parent process) ----------
+def render_hash(card, deck) -> str:
+    parts = [
+        RENDER_VERSION,
+        FULL_SIZE,
+        PREVIEW_SIZE,
+        card.art_original.name or "",
+        deck.frame_overlay.name or "",
+        deck.frame_color,
+        deck.text_color,
+        card.title,
+    ]
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+def _read(field_file) -> bytes:
+    with field_file.open("rb") as f:
+        return f.read()
+
+
+def _replace(field_file, name: str, data: bytes, stale: list) -> None:
+    old = field_file.name
+    field_file.save(name, ContentFile(data), save=False)
+    if old and old != field_file.name:
+        stale.append((field_file.storage, old))
+
+
+def _delete(stale: list) -> None:
+    for storage, name in stale:
+        storage.delete(name)
+
+
+def _persist(cards: list) -> None:
+    """Write rendered cards' rows; their old files go only after the commit."""
+    Card = apps.get_model("cards", "Card")
+    stale = []
+    for card, full, preview in cards:
+        _replace(card.image_full, f"card_{card.id}.jpg", full, stale)
+        _replace(card.image_preview, f"card_{card.id}.jpg", preview, stale)
+    with transaction.atomic():
+        # bulk_update без post_save: версию колоды поднимаем один раз, а не на каждую карту
+        Card.objects.bulk_update([card for card, _, _ in cards], ["image_full", "image_preview", "render_hash"])
+        transaction.on_commit(partial(_delete, stale))
+
+
+def render_deck(deck, force: bool = False, workers: int | None = None, log=None) -> RenderResult:
+    """Render every card of `deck` whose inputs changed (all with force=True)."""
+    Card = apps.get_model("cards", "Card")
+    result = RenderResult()
+
+    todo = {}
+    for card in Card.objects.filter(deck=deck).order_by("position", "id"):
+        if not card.art_original:
+            result.no_art += 1
+        elif not force and card.render_hash == render_hash(card, deck):
+            result.unchanged += 1
+        else:
+            todo[card.id] = card
+    if not todo:
+        return result
+
+    workers = workers or getattr(settings, "CARD_RENDER_WORKERS", 0) or os.cpu_count() or 1
+    style = {"frame_color": deck.frame_color, "text_color": deck.text_color}
+    overlay = _read(deck.frame_overlay) if deck.frame_overlay else None
+
+    done = []
+    queue = list(todo.values())
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(todo)), initializer=_init_worker, initargs=(overlay, style)
+    ) as pool:
+        pending = {}
+        # в полёте не больше 2×workers задач: арты не копятся в памяти родителя
+        while queue or pending:
+            while queue and len(pending) < 2 * workers:
+                card = queue.pop(0)
+                try:
+                    future = pool.submit(render_task, card.id, _read(card.art_original), card.title)
+                except OSError as exc:
+                    result.failed.append((card.id, str(exc)))
+                    continue
+                pending[future] = card.id
+            if not pending:
+                break
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            batch = []
+            for future in finished:
+                card_id = pending.pop(future)
+                try:
+                    _, full, preview = future.result()
+                except Exception as exc:
+                    result.failed.append((card_id, str(exc)))
+                    continue
+
+                card = todo[card_id]
+                card.render_hash = render_hash(card, deck)
+                batch.append((card, full, preview))
+            if not batch:
+                continue
+
+            # строки — сразу, пачкой готовых карт: прерванный запуск продолжится с этого места
+            _persist(batch)
+            for card, _, _ in batch:
+                done.append(card)
+                if log:
+                    log(f"rendered card {card.id} ({len(done)}/{len(todo)})")
+
+    if done:
+        # новый image_full — пересобираем WebP/AVIF-варианты (тоже в пуле процессов)
+        build_many(done, workers=workers)
+        bump_deck_version(deck.id)
+    result.rendered = len(done)
+    return result
@@ -0,0 +1,93 @@
+# metadeck/cards/sampler.py
+"""
+Deck card-pool sampler and other per-deck caches.
+
+Each deck's active card ids are cached as one list, keyed by a per-deck
+version that Card/Deck signals bump once the saving transaction has
+committed (see cards/signals.py): bumped earlier, a concurrent draw would
+cache the pre-commit pool under the new version. Drawing k cards
+is then `random.sample` over the cached list — no ORDER BY RANDOM(), no
+full id scan per draw. The card image map (full URL + variant srcsets) uses
+the same versioning.
+
+All keys start with "metadeck:deck:" so the in-process L1 cache tier
+(metadeck/cache.py) serves them.
+"""
+import random
+
+from django.apps import apps
+from django.core.cache import cache
+
+from .utils import file_url, srcsets
+
+
+POOL_TTL_SECONDS = 60 * 60 * 24
+
+
+def deck_version_key(deck_id: int) -> str:
+    return f"metadeck:deck:{deck_id}:version"
+
+
+def deck_pool_key(deck_id: int, version: int) -> str:
+    return f"metadeck:deck:{deck_id}:pool:{version}"
+
+
+def deck_images_key(deck_id: int, version: int) -> str:
+    return f"metadeck:deck:{deck_id}:images:{version}"
+
+
+def get_deck_version(deck_id: int) -> int:
+    key = deck_version_key(deck_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, None)
+        version = cache.get(key, 1)
+    return version
+
+
+def bump_deck_version(deck_id: int) -> None:
+    """Invalidate the cached pool: старый ключ просто перестаёт читаться и истекает по TTL."""
+    key = deck_version_key(deck_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, None)
+
+
+def get_card_pool(deck_id: int) -> list[int]:
+    key = deck_pool_key(deck_id, get_deck_version(deck_id))
+    pool = cache.get(key)
+    if pool is None:
+        Card = apps.get_model("cards", "Card")
+        pool = list(
+            Card.objects.filter(deck_id=deck_id, is_active=True)
+            .order_by()
+            .values_list("id", flat=True)
+        )
+        cache.set(key, pool, POOL_TTL_SECONDS)
+    return pool
+
+
+def sample_cards(deck_id: int, k: int) -> list[int]:
+    """k distinct random active card ids of the deck (fewer if the deck is smaller)."""
+    pool = get_card_pool(deck_id)
+    return random.sample(pool, min(k, len(pool)))
+
+
+def card_image(card) -> dict:
+    """{front_url, front_srcset} of one card: full-size fallback + {fmt: srcset}."""
+    return {"front_url": file_url(card.image_full), "front_srcset": srcsets(card.variants)}
+
+
+def get_card_images(deck_id: int) -> dict[str, dict]:
+    """{card_id: card_image(...)} for the deck's active cards."""
+    key = deck_images_key(deck_id, get_deck_version(deck_id))
+    images = cache.get(key)
+    if images is None:
+        Card = apps.get_model("cards", "Card")
+        images = {
+            str(c.id): card_image(c)
+            for c in Card.objects.filter(deck_id=deck_id, is_active=True).only("id", "image_full", "variants")
+        }
+        cache.set(key, images, POOL_TTL_SECONDS)
+    return images
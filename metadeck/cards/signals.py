@@ -0,0 +1,47 @@
+# metadeck/cards/signals.py
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .jobs import start_command
+from .models import Card, Deck
+from .sampler import bump_deck_version
+from .variants import delete_files, is_current
+
+
+def _start_variants_job(instance) -> None:
+    # WebP/AVIF на 3 ширинах — секунды CPU: не в запросе админки, а фоновым build_variants
+    if isinstance(instance, Card):
+        start_command("build_variants", "--card", instance.pk)
+    else:
+        start_command("build_variants", "--deck", instance.pk, "--no-cards")
+
+
+def _schedule_variants(instance, signal, raw: bool = False, **kwargs) -> None:
+    # после коммита: файл уже в storage, строка видна; fixtures (raw) не трогаем
+    meta = instance.variants if isinstance(instance, Card) else instance.back_variants
+    if signal is post_delete:
+        if meta:
+            transaction.on_commit(partial(delete_files, meta))
+    elif not raw and not is_current(instance):
+        transaction.on_commit(partial(_start_variants_job, instance))
+
+
+def _bump_on_commit(deck_id: int) -> None:
+    # не внутри транзакции сохранения: другой воркер увидел бы новую версию, собрал бы пул
+    # из ещё старых строк и закэшировал бы его под новой версией на POOL_TTL_SECONDS
+    transaction.on_commit(partial(bump_deck_version, deck_id))
+
+
+@receiver([post_save, post_delete], sender=Card)
+def card_changed(sender, instance, **kwargs):
+    _bump_on_commit(instance.deck_id)
+    _schedule_variants(instance, **kwargs)
+
+
+@receiver([post_save, post_delete], sender=Deck)
+def deck_changed(sender, instance, **kwargs):
+    _bump_on_commit(instance.id)
+    _schedule_variants(instance, **kwargs)
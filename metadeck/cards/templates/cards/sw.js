@@ -0,0 +1,44 @@
+// metadeck/cards/templates/cards/sw.js
+// Service worker (включается CARD_SERVICE_WORKER): cache-first для content-hashed медиа.
+// Имя такого файла = sha256 содержимого (metadeck/storage.py), поэтому закэшированная
+// копия никогда не устаревает: повторная раздача той же колоды рисуется без сети.
+const CACHE_NAME = "metadeck-media-v1";
+const MAX_ENTRIES = 600;
+const HASHED_MEDIA = /^\/media\/.+\/[0-9a-f]{2}\/[0-9a-f]{2}\/[0-9a-f]{64}(\.[A-Za-z0-9]+)?$/;
+
+self.addEventListener("install", () => self.skipWaiting());
+
+self.addEventListener("activate", (event) => {
+  event.waitUntil(
+    caches
+      .keys()
+      .then((names) => Promise.all(names.filter((n) => n !== CACHE_NAME).map((n) => caches.delete(n))))
+      .then(() => self.clients.claim())
+  );
+});
+
+async function trim(cache) {
+  // keys() в порядке добавления: выкидываем самые старые
+  const keys = await cache.keys();
+  await Promise.all(keys.slice(0, Math.max(0, keys.length - MAX_ENTRIES)).map((k) => cache.delete(k)));
+}
+
+async function cacheFirst(request) {
+  const cache = await caches.open(CACHE_NAME);
+  const hit = await cache.match(request);
+  if (hit) return hit;
+
+  const response = await fetch(request);
+  if (response.ok) {
+    await cache.put(request, response.clone());
+    trim(cache);
+  }
+  return response;
+}
+
+self.addEventListener("fetch", (event) => {
+  const url = new URL(event.request.url);
+  if (event.request.method !== "GET" || url.origin !== self.location.origin) return;
+  if (!HASHED_MEDIA.test(url.pathname)) return;
+  event.respondWith(cacheFirst(event.request));
+});
@@ -0,0 +1,48 @@
+# metadeck/cards/templatetags/card_images.py
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from cards.utils import MIME_TYPES, file_url, srcsets
+
+
+register = template.Library()
+
+# `sizes` по раскладке: сетка колод (.card-grid в base.html) и комната
+# (.grid в room.css; то же значение в room.js CARD_SIZES)
+SIZES = {
+    "decks": "(max-width: 600px) 50vw, 240px",
+    "room": "(max-width: 820px) 50vw, (max-width: 1100px) 25vw, 17vw",
+}
+
+
+@register.simple_tag
+def picture(image, variants, alt="", sizes="decks"):
+    """
+    <picture> for an ImageField + its stored variant metadata:
+
+        {% picture deck.back_full deck.back_variants alt="deck back" %}
+    """
+    return picture_url(file_url(image), srcsets(variants), alt, sizes)
+
+
+@register.simple_tag
+def picture_url(url, srcset_map, alt="", sizes="decks"):
+    """
+    Same from a plain URL + {fmt: srcset} (snapshot cards, see session/state.py):
+    one <source> per format (AVIF, WebP), the original file as <img> fallback.
+    `sizes` is a SIZES preset name or a literal sizes attribute.
+    """
+    if not url:
+        return ""
+    sizes = SIZES.get(sizes, sizes)
+    sources = format_html_join(
+        "",
+        '<source type="{}" srcset="{}" sizes="{}">',
+        ((MIME_TYPES[fmt], srcset, sizes) for fmt, srcset in (srcset_map or {}).items()),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" alt="{}" loading="lazy" decoding="async"></picture>',
+        sources,
+        url,
+        alt,
+    )
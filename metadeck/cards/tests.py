@@ -1,3 +1,241 @@
-from django.test import TestCase
+# metadeck/cards/tests.py
+import hashlib
+import io
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from .importer import DirectorySource, ZipSource, import_cards
+from .models import Card, Deck
+from .rendering import render_deck
+
+
+# без Redis: пулы/версии колод — в памяти процесса
+LOCAL_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+def png(color) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8), color).save(buf, "PNG")
+    return buf.getvalue()
+
+
+class MediaTestCase(TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        settings_override = override_settings(
+            CACHES=LOCAL_CACHE, MEDIA_ROOT=self.tmp / "media", CARD_JOBS_DIR=str(self.tmp / "jobs")
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class ImporterTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.deck = Deck.objects.create(title="Import deck")
+        self.source = self.tmp / "source"
+        self.source.mkdir()
+        for name, color in (("a.png", "red"), ("b.png", "green"), ("c_card.png", "blue"), ("d.png", "white")):
+            (self.source / name).write_bytes(png(color))
+        (self.source / "broken.png").write_bytes(b"not an image")
+        (self.source / "cards.csv").write_text("file,title,code,position\nb.png,Sun,sun,10\n")
+
+    def run_import(self, source=None, **kwargs):
+        return import_cards(self.deck, source or DirectorySource(self.source), workers=2, **kwargs)
+
+    def test_import_and_rerun(self):
+        result = self.run_import()
+        self.assertEqual((result.created, result.skipped), (4, 0))
+        self.assertEqual([name for name, _ in result.failed], ["broken.png"])
+
+        cards = {c.title: c for c in Card.objects.filter(deck=self.deck)}
+        self.assertEqual(cards["Sun"].code, "sun")
+        # позиции получают только файлы без позиции в sidecar — подряд, по имени
+        self.assertEqual(
+            {title: c.position for title, c in cards.items()},
+            {"a": 1, "Sun": 10, "c card": 2, "d": 3},
+        )
+
+        # повторный запуск (или продолжение прерванного) ничего не дублирует
+        again = self.run_import()
+        self.assertEqual((again.created, again.skipped), (0, 4))
+        self.assertEqual(Card.objects.filter(deck=self.deck).count(), 4)
+
+    def test_positions_continue_after_existing_cards(self):
+        Card.objects.create(deck=self.deck, title="old", position=7)
+        self.run_import()
+        positions = dict(Card.objects.filter(deck=self.deck).values_list("title", "position"))
+        self.assertEqual(positions, {"old": 7, "a": 8, "Sun": 10, "c card": 9, "d": 10})
+
+    def test_zip_source_and_small_batches(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            for path in sorted(self.source.iterdir()):
+                zf.write(path, f"deck/{path.name}")
+            zf.writestr("__MACOSX/deck/._a.png", b"junk")
+        source = ZipSource(archive)
+        try:
+            # sidecar внутри архива лежит не в корне — передаём явно
+            result = self.run_import(source, sidecar=("cards.csv", (self.source / "cards.csv").read_bytes()), batch_size=1)
+        finally:
+            source.close()
+        self.assertEqual((result.created, len(result.failed)), (4, 1))
+        self.assertEqual(Card.objects.get(deck=self.deck, code="sun").position, 10)
+
+    def test_concurrent_import_of_the_same_art(self):
+        storage = Card._meta.get_field("art_original").storage
+        save = storage.save
+
+        def save_and_race(name, content, max_length=None):
+            stored = save(name, content, max_length)
+            # "другой импорт" успевает вставить первую же карту раньше нас
+            if not Card.objects.filter(deck=self.deck).exists():
+                content.seek(0)
+                digest = hashlib.sha256(content.read()).hexdigest()
+                Card.objects.create(deck=self.deck, title="racer", art_hash=digest, art_original=stored)
+            return stored
+
+        with mock.patch.object(storage, "save", side_effect=save_and_race):
+            result = self.run_import()
+
+        self.assertEqual((result.created, result.skipped), (3, 1))
+        self.assertEqual(Card.objects.filter(deck=self.deck).count(), 4)
+
+
+class AdminTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        user = get_user_model().objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(user)
+        self.deck = Deck.objects.create(title="Admin deck")
+        self.add_cards(self.deck, 3)
+
+    @staticmethod
+    def add_cards(deck, n: int) -> None:
+        start = Card.objects.filter(deck=deck).count()
+        Card.objects.bulk_create(
+            Card(deck=deck, title=f"card {i}", code=f"card-{i}", position=i) for i in range(start, start + n)
+        )
+
+    def assertQueriesDoNotGrow(self, url: str, add) -> None:
+        self.client.get(url)  # первый запрос после логина пишет сессию
+        with CaptureQueriesContext(connection) as baseline:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        add()
+        with self.assertNumQueries(len(baseline)):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_card_changelist(self):
+        def more():
+            for i in range(5):
+                self.add_cards(Deck.objects.create(title=f"deck {i}"), 5)
+
+        self.assertQueriesDoNotGrow(reverse("admin:cards_card_changelist"), more)
+
+    def test_deck_changelist(self):
+        self.assertQueriesDoNotGrow(
+            reverse("admin:cards_deck_changelist"),
+            lambda: Deck.objects.bulk_create(Deck(title=f"deck {i}") for i in range(20)),
+        )
+
+    def test_deck_page_with_card_inline(self):
+        url = reverse("admin:cards_deck_change", args=[self.deck.pk])
+        self.assertQueriesDoNotGrow(url, lambda: self.add_cards(self.deck, 80))
+        # инлайн показывает одну страницу карт
+        response = self.client.get(url, {"cards_page": 2})
+        self.assertEqual(response.context["inline_admin_formsets"][0].formset.total_form_count(), 33)
+
+    def test_render_action_starts_a_job(self):
+        with mock.patch("cards.admin.start_command", return_value=self.tmp / "job.log") as start:
+            self.client.post(
+                reverse("admin:cards_deck_changelist"),
+                {"action": "render_cards", "_selected_action": [self.deck.pk]},
+            )
+        start.assert_called_once_with("render_cards", "--deck", self.deck.pk, "--verbosity", 2)
+
+    def test_import_view_starts_a_job(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("a.png", png("red"))
+
+        with mock.patch("cards.admin.start_command", return_value=self.tmp / "job.log") as start:
+            response = self.client.post(
+                reverse("admin:cards_deck_import", args=[self.deck.pk]),
+                {"archive": SimpleUploadedFile("deck.zip", archive.getvalue()), "render": "on"},
+            )
+        self.assertRedirects(response, reverse("admin:cards_deck_change", args=[self.deck.pk]))
+
+        command, saved, *args = start.call_args.args
+        self.assertEqual(command, "import_deck")
+        self.assertEqual(saved.read_bytes(), archive.getvalue())
+        self.assertEqual(args, ["--deck", self.deck.pk, "--delete-source", "--verbosity", 2, "--render"])
+        # импорт — в фоне: в запросе карты не создаются
+        self.assertEqual(Card.objects.filter(deck=self.deck).count(), 3)
+
+    def test_import_view_rejects_non_zip(self):
+        with mock.patch("cards.admin.start_command") as start:
+            response = self.client.post(
+                reverse("admin:cards_deck_import", args=[self.deck.pk]),
+                {"archive": SimpleUploadedFile("deck.zip", b"not a zip")},
+            )
+        self.assertContains(response, "Not a ZIP archive.")
+        start.assert_not_called()
+
+
+class VariantsSignalTests(MediaTestCase):
+    def test_new_image_starts_a_background_job(self):
+        deck = Deck.objects.create(title="Variants deck")
+        with mock.patch("cards.signals.start_command") as start:
+            with self.captureOnCommitCallbacks(execute=True):
+                card = Card.objects.create(
+                    deck=deck, title="sun", image_full=SimpleUploadedFile("sun.png", png("yellow"))
+                )
+            # кодирование — не в запросе, а в фоновом build_variants
+            start.assert_called_once_with("build_variants", "--card", card.pk)
+            self.assertEqual(Card.objects.get(pk=card.pk).variants, {})
+
+    def test_build_variants_command_limited_to_cards(self):
+        deck = Deck.objects.create(title="Variants deck")
+        cards = [
+            Card.objects.create(deck=deck, title=str(i), image_full=SimpleUploadedFile(f"{i}.png", png("red")))
+            for i in range(2)
+        ]
+        call_command("build_variants", "--card", cards[0].pk, stdout=io.StringIO())
+        self.assertTrue(Card.objects.get(pk=cards[0].pk).variants)
+        self.assertEqual(Card.objects.get(pk=cards[1].pk).variants, {})
+
+
+@override_settings(STORAGES={"default": {"BACKEND": "django.core.files.storage.FileSystemStorage"}})
+class RenderTests(MediaTestCase):
+    def test_old_files_are_deleted_after_the_rows_commit(self):
+        deck = Deck.objects.create(title="Render deck")
+        card = Card.objects.create(deck=deck, title="sun", art_original=SimpleUploadedFile("sun.png", png("red")))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(render_deck(deck, workers=1).rendered, 1)
+        old = Card.objects.get(pk=card.pk)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(render_deck(deck, force=True, workers=1).rendered, 1)
+        new = Card.objects.get(pk=card.pk)
+        self.assertNotEqual(new.image_full.name, old.image_full.name)
+        # до коммита строки старые файлы ещё на месте
+        self.assertTrue(old.image_full.storage.exists(old.image_full.name))
+
+        for callback in callbacks:
+            callback()
+        self.assertFalse(old.image_full.storage.exists(old.image_full.name))
+        self.assertFalse(old.image_preview.storage.exists(old.image_preview.name))
+        self.assertTrue(new.image_full.storage.exists(new.image_full.name))
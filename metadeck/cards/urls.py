@@ -6,4 +6,6 @@ app_name = "cards"
 urlpatterns = [
     path("", views.home, name="home"),
     path("deck/<int:deck_id>/", views.deck_modes, name="deck_modes"),
+    path("deck/<int:deck_id>/manifest.json", views.deck_manifest, name="deck_manifest"),
+    path("sw.js", views.service_worker, name="service_worker"),
 ]
@@ -0,0 +1,41 @@
+# metadeck/cards/utils.py
+from django.core.files.storage import default_storage
+
+
+MIME_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+
+
+def file_url(field) -> str:
+    """URL of an ImageField/FileField value, "" if empty or storage can't build it."""
+    if not field:
+        return ""
+    try:
+        return field.url
+    except Exception:
+        return ""
+
+
+def srcsets(meta: dict | None) -> dict[str, str]:
+    """
+    {fmt: "url 320w, url 640w, ..."} from stored variant metadata
+    (Card.variants / Deck.back_variants, see cards/variants.py), best format first.
+    """
+    if not meta:
+        return {}
+    return {
+        fmt: ", ".join(f"{default_storage.url(name)} {w}w" for w, name in items)
+        for fmt, items in meta.get("files", {}).items()
+        if items
+    }
+
+
+def thumbnail_url(variants: dict | None, *fallbacks) -> str:
+    """Smallest pre-generated WebP variant, else the first non-empty fallback file's URL."""
+    items = (variants or {}).get("files", {}).get("webp") or []
+    if items:
+        return default_storage.url(items[0][1])
+    for field in fallbacks:
+        url = file_url(field)
+        if url:
+            return url
+    return ""
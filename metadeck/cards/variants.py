@@ -0,0 +1,219 @@
+# metadeck/cards/variants.py
+"""
+Responsive image variants: several widths in modern formats (AVIF, WebP)
+built from a card's image_full and a deck's back_full.
+
+Variant metadata (source name, size, and the storage name of every
+width/format) is stored on the row itself (Card.variants,
+Deck.back_variants), so turning it into `srcset` strings at request time is
+string formatting only (cards/utils.py `srcsets`): no storage listing, no
+file probing. A variant set is stale when its recorded source name or
+VARIANTS_VERSION differs.
+
+Builders:
+    update_variants(obj)  — one object, inline
+    build_many(objects)   — many objects across a process pool (build_variants
+                            command, render_deck after a render)
+
+Saving a Card/Deck with a new image never encodes in the request: the
+post_save signal starts `manage.py build_variants --card ID` (or
+`--deck ID --no-cards`) in the background on commit (cards/jobs.py).
+
+AVIF is produced only if this Pillow build has an AVIF encoder; clients
+fall back to WebP, then to the original file (`<picture>`, see
+cards/templatetags/card_images.py and room.js).
+"""
+import io
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+from metadeck import metrics
+from .sampler import bump_deck_version
+
+
+# поднять при смене ширин/качества — все наборы пересоберутся
+VARIANTS_VERSION = 1
+
+WIDTHS = (320, 640, 1000)
+QUALITY = {"avif": 55, "webp": 80}
+
+# (исходное поле, поле с метаданными, папка) по модели
+SOURCES = {
+    "card": ("image_full", "variants", "cards"),
+    "deck": ("back_full", "back_variants", "decks"),
+}
+
+
+def available_formats() -> tuple[str, ...]:
+    """Formats in client preference order; AVIF only if Pillow can encode it."""
+    return ("avif", "webp") if features.check("avif") else ("webp",)
+
+
+# ---------- pure Pillow part (also runs in worker processes) ----------
+def target_widths(source_width: int) -> list[int]:
+    # не увеличиваем: самая широкая вариация — не больше исходника
+    widths = [w for w in WIDTHS if w < source_width]
+    widths.append(min(source_width, WIDTHS[-1]))
+    return sorted(set(widths))
+
+
+def encode_variants(data: bytes, formats: tuple[str, ...]) -> dict:
+    """{"width", "height", "files": {fmt: {width: bytes}}} for one source image."""
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+    width, height = image.size
+
+    files = {fmt: {} for fmt in formats}
+    for w in target_widths(width):
+        resized = image if w == width else image.resize(
+            (w, round(height * w / width)), Image.Resampling.LANCZOS
+        )
+        for fmt in formats:
+            buf = io.BytesIO()
+            resized.save(buf, fmt.upper(), quality=QUALITY[fmt])
+            files[fmt][w] = buf.getvalue()
+    return {"width": width, "height": height, "files": files}
+
+
+def _encode_task(key, data: bytes, formats: tuple[str, ...]):
+    return key, encode_variants(data, formats)
+
+
+# ---------- metadata ----------
+def _source(obj):
+    kind = "deck" if obj._meta.model_name == "deck" else "card"
+    source_field, meta_field, folder = SOURCES[kind]
+    return kind, getattr(obj, source_field), meta_field, folder
+
+
+def is_current(obj) -> bool:
+    _, source, meta_field, _ = _source(obj)
+    meta = getattr(obj, meta_field) or {}
+    if not source:
+        return not meta
+    return meta.get("source") == source.name and meta.get("version") == VARIANTS_VERSION
+
+
+def _stored_names(meta: dict | None) -> set[str]:
+    return {name for items in (meta or {}).get("files", {}).values() for _, name in items}
+
+
+def delete_files(meta: dict | None) -> None:
+    for name in _stored_names(meta):
+        default_storage.delete(name)
+
+
+def _store(obj, encoded: dict | None) -> None:
+    """Save encoded files, point the row at them, delete the previous set."""
+    kind, source, meta_field, folder = _source(obj)
+    old = getattr(obj, meta_field) or {}
+
+    meta = {}
+    if encoded is not None:
+        meta = {
+            "source": source.name,
+            "version": VARIANTS_VERSION,
+            "width": encoded["width"],
+            "height": encoded["height"],
+            "files": {
+                fmt: [
+                    [w, default_storage.save(f"variants/{folder}/{obj.pk}-{w}.{fmt}", ContentFile(data))]
+                    for w, data in sorted(by_width.items())
+                ]
+                for fmt, by_width in encoded["files"].items()
+            },
+        }
+
+    # update(), а не save(): без post_save — сигнал не перезапускает сборку
+    type(obj).objects.filter(pk=obj.pk).update(**{meta_field: meta})
+    setattr(obj, meta_field, meta)
+
+    for name in _stored_names(old) - _stored_names(meta):
+        default_storage.delete(name)
+
+
+def _read(field_file) -> bytes:
+    with field_file.open("rb") as f:
+        return f.read()
+
+
+def _deck_id(obj) -> int:
+    return obj.pk if obj._meta.model_name == "deck" else obj.deck_id
+
+
+# ---------- builders ----------
+def update_variants(obj, force: bool = False) -> bool:
+    """Rebuild one object's variants inline if stale. Returns True if anything changed."""
+    if not force and is_current(obj):
+        return False
+    _, source, _, _ = _source(obj)
+    _store(obj, encode_variants(_read(source), available_formats()) if source else None)
+    bump_deck_version(_deck_id(obj))
+    return True
+
+
+def build_many(objects, force: bool = False, workers: int | None = None, log=None) -> dict:
+    """Rebuild stale variants of Cards/Decks in a process pool. Returns counters."""
+    result = {"built": 0, "unchanged": 0, "cleared": 0, "failed": []}
+    todo = {}
+    decks = set()
+    for obj in objects:
+        _, source, _, _ = _source(obj)
+        if not force and is_current(obj):
+            result["unchanged"] += 1
+        elif not source:
+            _store(obj, None)
+            decks.add(_deck_id(obj))
+            result["cleared"] += 1
+        else:
+            todo[(obj._meta.model_name, obj.pk)] = obj
+    if todo:
+        _encode_in_pool(todo, result, decks, workers, log)
+
+    for deck_id in decks:
+        bump_deck_version(deck_id)
+    if result["failed"]:
+        metrics.incr("variants.failed", len(result["failed"]))
+    return result
+
+
+def _encode_in_pool(todo: dict, result: dict, decks: set, workers: int | None, log) -> None:
+    workers = workers or getattr(settings, "CARD_RENDER_WORKERS", 0) or os.cpu_count() or 1
+    formats = available_formats()
+
+    queue = list(todo.items())
+    with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+        pending = {}
+        # как в rendering.py: в полёте не больше 2×workers исходников
+        while queue or pending:
+            while queue and len(pending) < 2 * workers:
+                key, obj = queue.pop(0)
+                try:
+                    data = _read(_source(obj)[1])
+                except OSError as exc:
+                    result["failed"].append((key, str(exc)))
+                    continue
+                pending[pool.submit(_encode_task, key, data, formats)] = key
+            if not pending:
+                break
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                key = pending.pop(future)
+                try:
+                    _, encoded = future.result()
+                except Exception as exc:
+                    result["failed"].append((key, str(exc)))
+                    continue
+                obj = todo[key]
+                _store(obj, encoded)
+                decks.add(_deck_id(obj))
+                result["built"] += 1
+                if log:
+                    log(f"variants for {key[0]} {key[1]} ({result['built']}/{len(todo)})")
+
@@ -1,4 +1,10 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404, render
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_GET
+
+from .manifest import get_manifest
 from .models import Deck
 from session.models import SessionMode
 
@@ -11,3 +17,37 @@ def home(request):
 def deck_modes(request, deck_id):
     deck = get_object_or_404(Deck, id=deck_id, is_active=True)
     return render(request, "cards/deck_modes.html", {"deck": deck, "modes": SessionMode.choices})
+
+
+def _manifest_etag(request, deck_id):
+    manifest = get_manifest(deck_id)
+    return manifest["version"] if manifest else None
+
+
+def _manifest_last_modified(request, deck_id):
+    manifest = get_manifest(deck_id)
+    return manifest["last_modified"] if manifest else None
+
+
+@require_GET
+@condition(etag_func=_manifest_etag, last_modified_func=_manifest_last_modified)
+def deck_manifest(request, deck_id):
+    """Deck asset manifest (cards/manifest.py); 304 if the client's ETag/date still match."""
+    manifest = get_manifest(deck_id)
+    if manifest is None:
+        raise Http404("Deck not found")
+    response = HttpResponse(manifest["body"], content_type="application/json")
+    # кэшировать можно, но перед использованием — условный запрос (ETag → 304)
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+@require_GET
+def service_worker(request):
+    """Optional service worker (CARD_SERVICE_WORKER) caching immutable deck media."""
+    if not settings.CARD_SERVICE_WORKER:
+        raise Http404("Service worker disabled")
+    response = render(request, "cards/sw.js", content_type="application/javascript")
+    # сам скрипт воркера всегда проверяем заново, иначе обновление застрянет
+    patch_cache_control(response, no_cache=True)
+    return response
@@ -0,0 +1,256 @@
+# metadeck/metadeck/cache.py
+"""
+Shared Redis cache with an optional in-process L1 tier.
+
+Keys that start with one of L1["PREFIXES"] (read-mostly data: deck pools,
+card URLs, ...) are also kept in process memory for L1["TIMEOUT"] seconds.
+Any write/delete of such a key through this backend publishes the key on a
+Redis pub/sub channel; every process evicts it from its L1, so staleness is
+bounded by pub/sub latency (or the short TTL if a message is lost).
+
+Hits/misses are counted per tier in metadeck.metrics
+("cache.l1.hit", "cache.l1.miss", "cache.l2.hit", "cache.l2.miss").
+
+`set_if_newer` is a compare-and-set for versioned values (session
+snapshots, see session/state.py): value and version are written together
+only if the cached version is not newer.
+
+    CACHES = {
+        "default": {
+            "BACKEND": "metadeck.cache.TieredRedisCache",
+            "LOCATION": "redis://redis:6379/1",
+            "OPTIONS": {...},  # passed to redis connection pool
+            "L1": {"PREFIXES": ["metadeck:deck:"], "TIMEOUT": 5, "MAX_ENTRIES": 2000},
+        }
+    }
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.redis import RedisCache
+
+from . import metrics
+
+
+_MISSING = object()
+DEFAULT_CHANNEL = "metadeck:cache:l1:invalidate"
+
+# версия хранится как число (RedisSerializer не пиклит int) — её видит и cache.get
+SET_IF_NEWER_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[2]))
+if current and current > tonumber(ARGV[1]) then
+    return 0
+end
+if ARGV[3] == '' then
+    redis.call('SET', KEYS[2], ARGV[1])
+    redis.call('SET', KEYS[1], ARGV[2])
+else
+    redis.call('SET', KEYS[2], ARGV[1], 'EX', ARGV[3])
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+end
+return 1
+"""
+
+
+class L1Store:
+    """Bounded TTL dict shared by all threads of the process (one per channel)."""
+
+    def __init__(self, timeout: float, max_entries: int):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.subscriber = None
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+# django.core.cache.caches создаёт backend на каждый поток — L1 держим на уровне процесса
+_stores: dict[str, L1Store] = {}
+_stores_lock = threading.Lock()
+
+
+def _get_store(channel: str, timeout: float, max_entries: int) -> L1Store:
+    with _stores_lock:
+        store = _stores.get(channel)
+        if store is None:
+            store = _stores[channel] = L1Store(timeout, max_entries)
+        return store
+
+
+class TieredRedisCache(RedisCache):
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        l1 = params.get("L1") or {}
+        self.l1_prefixes = tuple(l1.get("PREFIXES", ()))
+        self.l1_channel = l1.get("CHANNEL", DEFAULT_CHANNEL)
+        self._l1 = _get_store(self.l1_channel, l1.get("TIMEOUT", 5), l1.get("MAX_ENTRIES", 2000))
+
+    # ---------- L1 helpers ----------
+    def _in_l1(self, key) -> bool:
+        return bool(self.l1_prefixes) and str(key).startswith(self.l1_prefixes)
+
+    def _ensure_subscriber(self) -> None:
+        if self._l1.subscriber is not None:
+            return
+        with _stores_lock:
+            if self._l1.subscriber is None:
+                thread = threading.Thread(
+                    target=self._listen, name="metadeck-cache-l1", daemon=True
+                )
+                self._l1.subscriber = thread
+                thread.start()
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                pubsub = self._cache.get_client(write=False).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.l1_channel)
+                # пока не были подписаны, могли пропустить инвалидации
+                self._l1.clear()
+                for message in pubsub.listen():
+                    full_key = message["data"].decode()
+                    if full_key == "*":
+                        self._l1.clear()
+                    else:
+                        self._l1.pop(full_key)
+            except Exception:
+                self._l1.clear()
+                time.sleep(1)
+
+    def _invalidate(self, keys, version=None) -> None:
+        full_keys = [self.make_key(k, version=version) for k in keys if self._in_l1(k)]
+        if not full_keys:
+            return
+        for full_key in full_keys:
+            self._l1.pop(full_key)
+        client = self._cache.get_client(write=True)
+        pipe = client.pipeline(transaction=False)
+        for full_key in full_keys:
+            pipe.publish(self.l1_channel, full_key)
+        pipe.execute()
+
+    # ---------- reads ----------
+    def get(self, key, default=None, version=None):
+        if self._in_l1(key):
+            self._ensure_subscriber()
+            full_key = self.make_key(key, version=version)
+            value = self._l1.get(full_key)
+            if value is not _MISSING:
+                metrics.incr("cache.l1.hit")
+                return value
+            metrics.incr("cache.l1.miss")
+
+        value = super().get(key, _MISSING, version=version)
+        if value is _MISSING:
+            metrics.incr("cache.l2.miss")
+            return default
+
+        metrics.incr("cache.l2.hit")
+        if self._in_l1(key):
+            self._l1.set(self.make_key(key, version=version), value)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        remote = []
+        for key in keys:
+            if self._in_l1(key):
+                self._ensure_subscriber()
+                value = self._l1.get(self.make_key(key, version=version))
+                if value is not _MISSING:
+                    metrics.incr("cache.l1.hit")
+                    found[key] = value
+                    continue
+                metrics.incr("cache.l1.miss")
+            remote.append(key)
+
+        if remote:
+            fetched = super().get_many(remote, version=version)
+            metrics.incr("cache.l2.hit", len(fetched))
+            metrics.incr("cache.l2.miss", len(remote) - len(fetched))
+            for key, value in fetched.items():
+                if self._in_l1(key):
+                    self._l1.set(self.make_key(key, version=version), value)
+            found.update(fetched)
+        return found
+
+    # ---------- writes: write-through + invalidate L1 everywhere ----------
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        super().set(key, value, timeout=timeout, version=version)
+        self._invalidate([key], version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = super().add(key, value, timeout=timeout, version=version)
+        if added:
+            self._invalidate([key], version)
+        return added
+
+    def set_if_newer(self, key, value, version_key, revision: int, timeout=DEFAULT_TIMEOUT, version=None) -> bool:
+        """Atomically store `value` and `revision` unless `version_key` already holds a newer one."""
+        keys = [self.make_and_validate_key(k, version=version) for k in (key, version_key)]
+        ttl = self.get_backend_timeout(timeout)
+        client = self._cache.get_client(write=True)
+        stored = client.eval(
+            SET_IF_NEWER_SCRIPT,
+            2,
+            *keys,
+            int(revision),
+            self._cache._serializer.dumps(value),
+            "" if ttl is None else int(ttl),
+        )
+        if stored:
+            self._invalidate([key, version_key], version)
+        return bool(stored)
+
+    def delete(self, key, version=None):
+        deleted = super().delete(key, version=version)
+        self._invalidate([key], version)
+        return deleted
+
+    def incr(self, key, delta=1, version=None):
+        value = super().incr(key, delta, version=version)
+        self._invalidate([key], version)
+        return value
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = super().set_many(data, timeout=timeout, version=version)
+        self._invalidate(list(data), version)
+        return failed
+
+    def delete_many(self, keys, version=None):
+        super().delete_many(keys, version=version)
+        self._invalidate(list(keys), version)
+
+    def clear(self):
+        result = super().clear()
+        self._l1.clear()
+        self._cache.get_client(write=True).publish(self.l1_channel, "*")
+        return result
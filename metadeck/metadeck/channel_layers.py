@@ -0,0 +1,51 @@
+# metadeck/metadeck/channel_layers.py
+"""
+Redis channel layer sharded over CHANNEL_REDIS_HOSTS by a consistent-hash ring.
+
+channels_redis maps a group/channel name to a host by cutting crc32 into
+len(hosts) equal ranges: adding or removing a host moves most groups to
+another host. Here every host owns RING_POINTS points on a ring, placed by
+a hash of its address (not of its position in the list); a name belongs to
+the first point clockwise of its own hash. Changing the list moves only the
+names of the added/removed host (~1/N), and the rest of session_{id}
+groups stay where they are.
+
+    CHANNEL_LAYERS = {"default": {"BACKEND": "metadeck.channel_layers.HashRingChannelLayer", ...}}
+"""
+import bisect
+import hashlib
+
+from channels_redis.core import RedisChannelLayer
+
+
+# виртуальных точек на хост: чем больше, тем ровнее доли хостов
+RING_POINTS = 160
+
+
+def ring_hash(value: bytes) -> int:
+    # не hash(): он рандомизирован по процессам, а кольцо у всех воркеров должно совпадать
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), "big")
+
+
+def host_key(host: dict) -> str:
+    return str(host.get("address") or f"{host.get('host')}:{host.get('port')}")
+
+
+class HashRingChannelLayer(RedisChannelLayer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        ring = sorted(
+            (ring_hash(f"{host_key(host)}#{i}".encode()), index)
+            for index, host in enumerate(self.hosts)
+            for i in range(RING_POINTS)
+        )
+        self._ring_points = [point for point, _ in ring]
+        self._ring_hosts = [index for _, index in ring]
+
+    def consistent_hash(self, value) -> int:
+        if self.ring_size == 1:
+            return 0
+        if isinstance(value, str):
+            value = value.encode("utf8")
+        i = bisect.bisect(self._ring_points, ring_hash(value)) % len(self._ring_points)
+        return self._ring_hosts[i]
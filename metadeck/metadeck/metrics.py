@@ -0,0 +1,22 @@
+# metadeck/metadeck/metrics.py
+"""Process-local counters (cache tier hits, throttling, ...), cheap enough for hot paths."""
+import threading
+from collections import Counter
+
+_counters: Counter = Counter()
+_lock = threading.Lock()
+
+
+def incr(name: str, amount: int = 1) -> None:
+    with _lock:
+        _counters[name] += amount
+
+
+def snapshot() -> dict:
+    with _lock:
+        return dict(_counters)
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
@@ -0,0 +1,11 @@
+# metadeck/metadeck/redis_client.py
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+
+
+@lru_cache(maxsize=None)
+def get_redis() -> redis.Redis:
+    """Process-wide Redis client (shared connection pool) for REDIS_URL."""
+    return redis.Redis.from_url(settings.REDIS_URL)
@@ -35,13 +35,92 @@ CSRF_TRUSTED_ORIGINS = [x.strip() for x in os.getenv("DJANGO_CSRF_TRUSTED_ORIGIN
 #         },
 #     }
 # }
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_URL = os.getenv("REDIS_URL", f"redis://{REDIS_HOST}:{REDIS_PORT}/0")
+
+# Шардирование channel layer: CHANNEL_REDIS_HOSTS="redis1:6379,redis2:6379".
+# Группы/каналы раскладываются по хостам кольцом consistent hashing
+# (metadeck/channel_layers.py), а не диапазонами crc32 из channels_redis: при
+# добавлении/удалении хоста переезжает только его доля групп (~1/N). Воркеры со
+# старым и новым списком на время выкатки расходятся именно в этой доле.
+CHANNEL_REDIS_HOSTS = [
+    (host, int(port or 6379))
+    for host, _, port in (
+        x.strip().partition(":") for x in os.getenv("CHANNEL_REDIS_HOSTS", "").split(",") if x.strip()
+    )
+] or [(REDIS_HOST, REDIS_PORT)]
+
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {"hosts": [(os.getenv("REDIS_HOST", "redis"), int(os.getenv("REDIS_PORT", "6379")))]},
+        "BACKEND": "metadeck.channel_layers.HashRingChannelLayer",
+        "CONFIG": {"hosts": CHANNEL_REDIS_HOSTS},
     }
 }
 
+# Общий кэш (snapshot комнат, пулы колод, ...) — тот же Redis, что у channel layer, отдельная БД.
+# L1: ключи колод читаются часто и меняются редко — держим их ещё и в памяти процесса,
+# инвалидация через Redis pub/sub (см. metadeck/cache.py)
+CACHES = {
+    "default": {
+        "BACKEND": "metadeck.cache.TieredRedisCache",
+        "LOCATION": os.getenv("CACHE_REDIS_URL", f"redis://{REDIS_HOST}:{REDIS_PORT}/1"),
+        "OPTIONS": {
+            "pool_class": "redis.BlockingConnectionPool",
+            "max_connections": int(os.getenv("CACHE_MAX_CONNECTIONS", "50")),
+            "timeout": 5,
+        },
+        "L1": {
+            "PREFIXES": ["metadeck:deck:"],
+            "TIMEOUT": int(os.getenv("CACHE_L1_TIMEOUT", "5")),
+            "MAX_ENTRIES": 2000,
+        },
+    }
+}
+if os.getenv("CACHE_BACKEND") == "locmem":
+    # dev/тесты без Redis (один процесс!)
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+# Горячее состояние комнат (flips, журнал событий): "redis" или "local" (in-process, для тестов/dev без Redis)
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "redis")
+# Сколько последних событий комнаты хранить для resume по last_seq
+SESSION_EVENT_BUFFER = int(os.getenv("SESSION_EVENT_BUFFER", "64"))
+# Окно склейки flips в один broadcast, мс (0 — слать каждый flip сразу)
+SESSION_FLIP_COALESCE_MS = int(os.getenv("SESSION_FLIP_COALESCE_MS", "30"))
+
+# Token-bucket лимиты действий в комнате: (токенов в секунду, burst)
+# "connection" — на одно WS-соединение (в памяти), "session" — на комнату (общий, в Redis)
+SESSION_RATE_LIMITS = {
+    "draw": {"connection": (1, 3), "session": (2, 5)},
+    "reset": {"connection": (1, 3), "session": (2, 5)},
+    "flip": {"connection": (10, 20), "session": (20, 40)},
+    "resync": {"connection": (1, 5)},
+}
+
+# Heartbeat: сервер шлёт ping каждые N секунд (меньше proxy_read_timeout в nginx),
+# соединение без сообщений от клиента дольше TIMEOUT закрывается
+SESSION_HEARTBEAT_SECONDS = int(os.getenv("SESSION_HEARTBEAT_SECONDS", "25"))
+SESSION_HEARTBEAT_TIMEOUT_SECONDS = int(os.getenv("SESSION_HEARTBEAT_TIMEOUT_SECONDS", "60"))
+
+# Admission control на connect: сколько handshakes с загрузкой состояния одновременно
+# на процесс и сколько ждать слота, прежде чем отказать (клиент переподключится с backoff)
+SESSION_CONNECT_CONCURRENCY = int(os.getenv("SESSION_CONNECT_CONCURRENCY", "32"))
+SESSION_CONNECT_WAIT_SECONDS = float(os.getenv("SESSION_CONNECT_WAIT_SECONDS", "5"))
+
+# Потоки (= DB-соединения) на воркер для БД-работы SessionConsumer (session/repository.py);
+# 0 — старый режим через единственный thread-sensitive поток
+SESSION_DB_WORKERS = int(os.getenv("SESSION_DB_WORKERS", "8"))
+
+# Аудит событий комнат (session/audit.py): "redis" (переживает падение воркера),
+# "memory" (теряется при падении процесса) или "sync" (вставка сразу, без очереди)
+SESSION_AUDIT_BACKEND = os.getenv("SESSION_AUDIT_BACKEND", "redis")
+SESSION_AUDIT_BATCH_SIZE = int(os.getenv("SESSION_AUDIT_BATCH_SIZE", "500"))
+SESSION_AUDIT_FLUSH_SECONDS = float(os.getenv("SESSION_AUDIT_FLUSH_SECONDS", "1"))
+# Верхняя граница очереди: при отставании БД старые события выкидываются
+SESSION_AUDIT_MAX_QUEUE = int(os.getenv("SESSION_AUDIT_MAX_QUEUE", "100000"))
+# После стольких неудачных вставок событие уходит в dead-letter (manage.py audit_queue)
+SESSION_AUDIT_MAX_ATTEMPTS = int(os.getenv("SESSION_AUDIT_MAX_ATTEMPTS", "5"))
+
 
 # Application definition
 
@@ -144,5 +223,26 @@ USE_TZ = True
 STATIC_URL = 'static/'
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+# Медиа с именами по sha256 содержимого (metadeck/storage.py): URL файла не меняется никогда,
+# nginx отдаёт такие пути с Cache-Control: immutable. MEDIA_CONTENT_HASH=0 — обычные имена.
+STORAGES = {
+    "default": {
+        "BACKEND": (
+            "metadeck.storage.ContentHashStorage"
+            if os.getenv("MEDIA_CONTENT_HASH", "1") == "1"
+            else "django.core.files.storage.FileSystemStorage"
+        ),
+    },
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
 STATIC_ROOT = BASE_DIR / "staticfiles"
 ASGI_APPLICATION = "metadeck.asgi.application"
+
+# Рендер карт (cards/rendering.py): процессов на колоду (0 — все ядра) и TTF-шрифт заголовка
+CARD_RENDER_WORKERS = int(os.getenv("CARD_RENDER_WORKERS", "0"))
+CARD_RENDER_FONT = os.getenv("CARD_RENDER_FONT", "")
+# Фоновые задачи админки (cards/jobs.py): логи render_cards / import_deck и загруженные архивы
+CARD_JOBS_DIR = os.getenv("CARD_JOBS_DIR", str(BASE_DIR / "jobs"))
+
+# Service worker (/sw.js): кэширует content-hashed медиа колоды в браузере для мгновенных раздач
+CARD_SERVICE_WORKER = os.getenv("CARD_SERVICE_WORKER", "0") == "1"
@@ -0,0 +1,74 @@
+# metadeck/metadeck/storage.py
+"""
+Content-addressed media storage.
+
+Every saved file is named by the SHA-256 of its bytes, inside the directory
+the field asked for:
+
+    cards/render/full/card_12.jpg  ->  cards/render/full/ab/cd/abcd…(64 hex).jpg
+
+A name therefore never changes meaning: re-uploading or re-rendering gives a
+new name (new URL), identical content gives the same name and is stored once
+(de-duplication). nginx serves such paths with `Cache-Control: immutable`
+for a year (nginx/metadeck.conf).
+
+Because one file may back several rows, `delete()` is a no-op here;
+unreferenced files are removed by `manage.py hash_media_filenames --prune`.
+
+    STORAGES = {"default": {"BACKEND": "metadeck.storage.ContentHashStorage"}, ...}
+"""
+import hashlib
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+HASHED_NAME_RE = re.compile(r"(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[A-Za-z0-9]+)?$")
+
+
+def is_hashed_name(name: str) -> bool:
+    return bool(name and HASHED_NAME_RE.search(name))
+
+
+def content_digest(content) -> str:
+    digest = hashlib.sha256()
+    if hasattr(content, "seek"):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def hashed_name(name: str, digest: str) -> str:
+    directory, filename = posixpath.split(name.replace("\\", "/"))
+    ext = posixpath.splitext(filename)[1].lower()
+    return posixpath.join(directory, digest[:2], digest[2:4], digest + ext)
+
+
+class ContentHashStorage(FileSystemStorage):
+    def __init__(self, **kwargs):
+        # имя = хэш содержимого: занятое имя означает тот же файл, суффиксы не нужны
+        kwargs.setdefault("allow_overwrite", True)
+        super().__init__(**kwargs)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+
+        name = hashed_name(name, content_digest(content))
+        # такой контент уже лежит — дедупликация, второй копии не пишем
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def delete(self, name):
+        # файл может принадлежать нескольким строкам; чистит `hash_media_filenames --prune`
+        pass
+
+    def delete_unreferenced(self, name):
+        super().delete(name)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Session, SessionEvent
+from .models import DrawnCard, Session, SessionEvent, SessionState
 
 
 @admin.register(Session)
@@ -8,12 +8,45 @@ class SessionAdmin(admin.ModelAdmin):
     list_filter = ("mode", "is_active", "deck")
     search_fields = ("id", "title", "deck__title")
     ordering = ("-created_at",)
+    list_select_related = ("deck",)
+    autocomplete_fields = ("deck",)
+
+
+class DrawnCardInline(admin.TabularInline):
+    model = DrawnCard
+    extra = 0
+    fields = ("position", "card")
+    readonly_fields = ("position", "card")
+    ordering = ("position",)
+    can_delete = False
+
+    def get_queryset(self, request):
+        # str(card) читает deck.title — без этого запрос на каждую строку
+        return super().get_queryset(request).select_related("card__deck")
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(SessionEvent)
 class SessionEventAdmin(admin.ModelAdmin):
     list_display = ("id", "session", "event_type", "chosen_card", "created_at")
     list_filter = ("event_type", "session__deck", "session__mode")
-    search_fields = ("session__id",)
+    # "события, где выпала карта X": точный код -> id карт -> индекс DrawnCard(card, event);
+    # icontains по join'у индекс не использует
+    search_fields = ("session__id", "=drawn_cards__card__code")
+    inlines = [DrawnCardInline]
     ordering = ("-created_at",)
-    filter_horizontal = ("cards",)
+    list_select_related = ("session", "chosen_card__deck")
+    # виджеты со всеми картами/сессиями на странице заменены поиском
+    autocomplete_fields = ("session", "chosen_card", "cards")
+    # точный COUNT(*) по журналу событий дорог
+    show_full_result_count = False
+
+
+@admin.register(SessionState)
+class SessionStateAdmin(admin.ModelAdmin):
+    list_display = ("session", "revision", "updated_at")
+    list_select_related = ("session",)
+    search_fields = ("session__id",)
+    readonly_fields = ("session", "card_ids", "revision", "updated_at")
@@ -0,0 +1,456 @@
+# metadeck/session/audit.py
+"""
+Write-behind audit log of room events (draw, reset, flip, join, leave).
+
+The consumer only enqueues an event (`record`, called off the event loop via
+session/repository.py), a background thread `bulk_create`s SessionEvent rows
+when SESSION_AUDIT_BATCH_SIZE events are queued or every
+SESSION_AUDIT_FLUSH_SECONDS, and flushes the rest on interpreter exit.
+SESSION_AUDIT_BACKEND picks the durability trade-off:
+
+    "memory" — per-process deque; events queued in a process that crashes
+               are lost (at most one flush window / batch)
+    "redis"  — shared Redis list; survives worker crashes and restarts,
+               any process's flusher drains it
+    "sync"   — insert inline (old behaviour, for debugging)
+
+Both queues are bounded by SESSION_AUDIT_MAX_QUEUE: when the DB cannot keep
+up the oldest events are dropped ("audit.dropped" in metadeck.metrics)
+instead of growing memory without limit.
+
+With Redis a taken batch is not popped but moved to an in-flight list with a
+lease (BATCH_LEASE_SECONDS): it is deleted after the insert commits, and a
+batch whose flusher died is put back at the head of the queue by the next
+flush anywhere. A failed batch is retried with backoff; events that failed
+SESSION_AUDIT_MAX_ATTEMPTS times go to a dead-letter list (logged, counted
+as "audit.dead_lettered") instead of blocking the queue forever —
+inspect/replay them with `manage.py audit_queue`.
+
+Draw events get their cards as DrawnCard rows (same transaction). The
+queued event carries them as payload["drawn_ids"], but the stored payload
+does not: DrawnCard is the only copy. Events written before that still have
+drawn_ids in their payload; `backfill_drawn_cards` converts them and they
+age out with retention (cleanup_sessions / partition_events drop), after
+which nothing reads payload["drawn_ids"] any more.
+Current room state does not depend on this log (see SessionState).
+"""
+import atexit
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from metadeck import metrics
+
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = "metadeck:audit:queue"
+DEAD_KEY = "metadeck:audit:dead"
+INFLIGHT_KEY = "metadeck:audit:inflight"
+BATCH_KEY_PREFIX = "metadeck:audit:batch:"
+# батч дольше этого «в полёте» считается брошенным (процесс умер) и возвращается в очередь
+BATCH_LEASE_SECONDS = 300
+# пауза флашера после неудачи: flush_seconds * 2**n, не больше
+MAX_BACKOFF_SECONDS = 60
+
+# RPUSH + обрезка до N последних одним round-trip; возвращает, сколько выкинули
+PUSH_SCRIPT = """
+local size = redis.call('RPUSH', KEYS[1], unpack(ARGV, 2))
+local limit = tonumber(ARGV[1])
+if size > limit then
+    redis.call('LTRIM', KEYS[1], size - limit, -1)
+    return size - limit
+end
+return 0
+"""
+
+# до N событий из головы очереди -> в список батча + lease в in-flight zset
+TAKE_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items == 0 then
+    return items
+end
+redis.call('LTRIM', KEYS[1], #items, -1)
+redis.call('RPUSH', KEYS[3], unpack(items))
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[3])
+return items
+"""
+
+# батчи с истёкшим lease — обратно в голову очереди (в исходном порядке)
+RECOVER_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+local moved = 0
+for _, id in ipairs(ids) do
+    local key = ARGV[2] .. id
+    local items = redis.call('LRANGE', key, 0, -1)
+    for i = #items, 1, -1 do
+        redis.call('LPUSH', KEYS[1], items[i])
+    end
+    moved = moved + #items
+    redis.call('DEL', key)
+    redis.call('ZREM', KEYS[2], id)
+end
+return moved
+"""
+
+
+def make_event(session_id: str, event_type: str, payload: dict | None = None) -> dict:
+    return {
+        "session_id": str(session_id),
+        "event_type": event_type,
+        "payload": payload or {},
+        "created_at": timezone.now().isoformat(),
+    }
+
+
+class LocalAuditQueue:
+    def __init__(self, max_size: int):
+        self._items: deque = deque()
+        self._dead: deque = deque(maxlen=max_size)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    def put(self, events: list[dict]) -> int:
+        dropped = 0
+        with self._lock:
+            self._items.extend(events)
+            while len(self._items) > self.max_size:
+                self._items.popleft()
+                dropped += 1
+            return dropped
+
+    def take(self, n: int) -> tuple[None, list[dict]]:
+        # в памяти процесса «в полёте» не нужен: умрёт процесс — умрёт и очередь
+        with self._lock:
+            return None, [self._items.popleft() for _ in range(min(n, len(self._items)))]
+
+    def ack(self, token) -> None:
+        pass
+
+    def release(self, token, retry: list[dict], dead: list[dict]) -> None:
+        with self._lock:
+            # назад в голову, но без превышения лимита
+            room = max(0, self.max_size - len(self._items))
+            self._items.extendleft(reversed(retry[-room:] if room else []))
+            self._dead.extend(dead)
+
+    def recover(self) -> int:
+        return 0
+
+    def dead(self) -> list[dict]:
+        with self._lock:
+            return list(self._dead)
+
+    def replay_dead(self) -> int:
+        with self._lock:
+            events = [{**e, "attempts": 0} for e in self._dead]
+            self._dead.clear()
+        self.put(events)
+        return len(events)
+
+    def purge_dead(self) -> int:
+        with self._lock:
+            count = len(self._dead)
+            self._dead.clear()
+            return count
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+
+class RedisAuditQueue:
+    def __init__(self, client, max_size: int, key: str = QUEUE_KEY, lease: int = BATCH_LEASE_SECONDS):
+        self.client = client
+        self.max_size = max_size
+        self.key = key
+        self.lease = lease
+        self._push = client.register_script(PUSH_SCRIPT)
+        self._take = client.register_script(TAKE_SCRIPT)
+        self._recover = client.register_script(RECOVER_SCRIPT)
+
+    def put(self, events: list[dict]) -> int:
+        return int(
+            self._push(keys=[self.key], args=[self.max_size, *(json.dumps(e) for e in events)])
+        )
+
+    def take(self, n: int) -> tuple[str | None, list[dict]]:
+        """(batch token, events); the batch stays in Redis until `ack` / `release`."""
+        token = uuid.uuid4().hex
+        items = self._take(
+            keys=[self.key, INFLIGHT_KEY, BATCH_KEY_PREFIX + token],
+            args=[n, time.time() + self.lease, token],
+        )
+        if not items:
+            return None, []
+        return token, [json.loads(item) for item in items]
+
+    def ack(self, token) -> None:
+        if token is None:
+            return
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(BATCH_KEY_PREFIX + token)
+        pipe.zrem(INFLIGHT_KEY, token)
+        pipe.execute()
+
+    def release(self, token, retry: list[dict], dead: list[dict]) -> None:
+        pipe = self.client.pipeline(transaction=True)
+        if retry:
+            pipe.lpush(self.key, *(json.dumps(e) for e in reversed(retry)))
+        if dead:
+            pipe.rpush(DEAD_KEY, *(json.dumps(e) for e in dead))
+            pipe.ltrim(DEAD_KEY, -self.max_size, -1)
+        if token is not None:
+            pipe.delete(BATCH_KEY_PREFIX + token)
+            pipe.zrem(INFLIGHT_KEY, token)
+        pipe.execute()
+
+    def recover(self) -> int:
+        """Requeue batches of flushers that died mid-insert; returns events moved."""
+        return int(self._recover(keys=[self.key, INFLIGHT_KEY], args=[time.time(), BATCH_KEY_PREFIX]))
+
+    def dead(self) -> list[dict]:
+        return [json.loads(item) for item in self.client.lrange(DEAD_KEY, 0, -1)]
+
+    def replay_dead(self) -> int:
+        pipe = self.client.pipeline(transaction=True)
+        pipe.lrange(DEAD_KEY, 0, -1)
+        pipe.delete(DEAD_KEY)
+        items, _ = pipe.execute()
+        if items:
+            self.put([{**json.loads(item), "attempts": 0} for item in items])
+        return len(items)
+
+    def purge_dead(self) -> int:
+        pipe = self.client.pipeline(transaction=True)
+        pipe.llen(DEAD_KEY)
+        pipe.delete(DEAD_KEY)
+        count, _ = pipe.execute()
+        return int(count)
+
+    def in_flight(self) -> int:
+        return int(self.client.zcard(INFLIGHT_KEY))
+
+    def __len__(self) -> int:
+        return int(self.client.llen(self.key))
+
+
+class AuditWriter:
+    def __init__(self, queue, batch_size: int, flush_seconds: float, max_attempts: int = 5):
+        self.queue = queue
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_attempts = max_attempts
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._pending = 0
+
+    def record(self, session_id: str, event_type: str, payload: dict | None = None) -> None:
+        self._ensure_started()
+        dropped = self.queue.put([make_event(session_id, event_type, payload)])
+        if dropped:
+            metrics.incr("audit.dropped", dropped)
+
+        # счётчик приблизительный (без лока) — нужен только как триггер по размеру
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self._pending = 0
+            self._wake.set()
+
+    # ---------- flusher ----------
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="metadeck-audit", daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self) -> None:
+        failures = 0
+        while not self._stopping:
+            delay = self.flush_seconds
+            if failures:
+                # после ошибок — экспоненциальная пауза, а не долбёжка БД каждую секунду
+                delay = min(self.flush_seconds * 2**failures, MAX_BACKOFF_SECONDS)
+            self._wake.wait(delay)
+            self._wake.clear()
+            try:
+                self.flush()
+                failures = 0
+            except Exception:
+                failures += 1
+                metrics.incr("audit.flush_failed")
+                logger.exception("audit flush failed (%d in a row)", failures)
+            finally:
+                close_old_connections()
+
+    def flush(self) -> int:
+        """Write everything queued right now; returns the number of rows inserted."""
+        recovered = self.queue.recover()
+        if recovered:
+            metrics.incr("audit.recovered", recovered)
+            logger.warning("requeued %d audit events of an abandoned batch", recovered)
+
+        written = 0
+        while True:
+            token, events = self.queue.take(self.batch_size)
+            if not events:
+                return written
+            try:
+                written += _insert(events)
+            except Exception:
+                self._fail(token, events)
+                raise
+            self.queue.ack(token)
+            metrics.incr("audit.written", len(events))
+
+    def _fail(self, token, events: list[dict]) -> None:
+        retry, dead = [], []
+        for event in events:
+            event["attempts"] = event.get("attempts", 0) + 1
+            (dead if event["attempts"] >= self.max_attempts else retry).append(event)
+        self.queue.release(token, retry, dead)
+        if dead:
+            metrics.incr("audit.dead_lettered", len(dead))
+            logger.error(
+                "%d audit events failed %d times, moved to the dead-letter list (manage.py audit_queue)",
+                len(dead),
+                self.max_attempts,
+            )
+
+    def stop(self) -> None:
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_seconds + 5)
+        try:
+            self.flush()
+        except Exception:
+            metrics.incr("audit.flush_failed")
+            logger.exception("final audit flush failed")
+        finally:
+            close_old_connections()
+
+
+class SyncAuditWriter:
+    """Inline insert, no queue (SESSION_AUDIT_BACKEND = "sync"); must be called off the event loop."""
+
+    def record(self, session_id: str, event_type: str, payload: dict | None = None) -> None:
+        _insert([make_event(session_id, event_type, payload)])
+
+    def flush(self) -> int:
+        return 0
+
+    def stop(self) -> None:
+        pass
+
+
+def drawn_cards_for(events) -> list:
+    """
+    DrawnCard rows for (event_id, payload) pairs of draw events, in table
+    order; ids of cards that no longer exist are skipped.
+    """
+    Card = apps.get_model("cards", "Card")
+    DrawnCard = apps.get_model("session", "DrawnCard")
+
+    events = list(events)
+    wanted = {
+        int(cid)
+        for _, payload in events
+        for cid in (payload or {}).get("drawn_ids", [])
+        if str(cid).isdigit()
+    }
+    existing = set(Card.objects.filter(id__in=wanted).values_list("id", flat=True)) if wanted else set()
+
+    rows = []
+    for event_id, payload in events:
+        for position, cid in enumerate((payload or {}).get("drawn_ids", [])):
+            if str(cid).isdigit() and int(cid) in existing:
+                rows.append(DrawnCard(event_id=event_id, card_id=int(cid), position=position))
+    return rows
+
+
+def _stored_payload(payload: dict) -> dict:
+    # карты раздачи хранятся только в DrawnCard — второй копии в JSON не держим
+    return {k: v for k, v in payload.items() if k != "drawn_ids"}
+
+
+def _write(events: list[dict]) -> int:
+    SessionEvent = apps.get_model("session", "SessionEvent")
+    DrawnCard = apps.get_model("session", "DrawnCard")
+
+    with transaction.atomic():
+        created = SessionEvent.objects.bulk_create(
+            [
+                SessionEvent(
+                    session_id=e["session_id"],
+                    event_type=e["event_type"],
+                    payload=_stored_payload(e["payload"]),
+                    created_at=datetime.fromisoformat(e["created_at"]),
+                )
+                for e in events
+            ]
+        )
+        # карты раздачи — в индексируемую таблицу (ids событий вернул bulk_create)
+        DrawnCard.objects.bulk_create(
+            drawn_cards_for(
+                (obj.pk, e["payload"]) for obj, e in zip(created, events) if obj.event_type == "draw"
+            )
+        )
+    return len(created)
+
+
+def _insert(events: list[dict]) -> int:
+    Session = apps.get_model("session", "Session")
+
+    try:
+        return _write(events)
+    except IntegrityError:
+        # сессию успели удалить (cleanup) — её события выкидываем, остальные пишем
+        existing = {
+            str(pk)
+            for pk in Session.objects.filter(
+                id__in={e["session_id"] for e in events}
+            ).values_list("id", flat=True)
+        }
+        kept = [e for e in events if e["session_id"] in existing]
+        metrics.incr("audit.orphaned", len(events) - len(kept))
+        return _write(kept)
+
+
+@lru_cache(maxsize=None)
+def get_audit_writer():
+    backend = settings.SESSION_AUDIT_BACKEND
+    if backend == "sync":
+        return SyncAuditWriter()
+
+    if backend == "redis":
+        from metadeck.redis_client import get_redis
+
+        queue = RedisAuditQueue(get_redis(), settings.SESSION_AUDIT_MAX_QUEUE)
+    else:
+        queue = LocalAuditQueue(settings.SESSION_AUDIT_MAX_QUEUE)
+    return AuditWriter(
+        queue,
+        settings.SESSION_AUDIT_BATCH_SIZE,
+        settings.SESSION_AUDIT_FLUSH_SECONDS,
+        settings.SESSION_AUDIT_MAX_ATTEMPTS,
+    )
+
+
+def record(session_id: str, event_type: str, payload: dict | None = None) -> None:
+    get_audit_writer().record(session_id, event_type, payload)
@@ -0,0 +1,64 @@
+# metadeck/session/coalesce.py
+"""
+Per-session flip coalescing.
+
+Flips are still written to the flip store immediately, but their broadcast
+is delayed by SESSION_FLIP_COALESCE_MS: everything flipped in that window
+(in this process) goes out as one "flips" delta {card_id: flipped}, last
+value per card winning. A burst of clicks costs one journal append and one
+group_send instead of one per click.
+
+A failed flush (e.g. Redis down) is logged and counted as
+"flips.flush_failed" in metadeck.metrics; those flips stay in the flip store
+and reach clients with the next state/resync.
+"""
+import asyncio
+import functools
+import logging
+
+from metadeck import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class FlipCoalescer:
+    def __init__(self, window_ms: int, flush):
+        """`flush(session_id, flips)` is an async callable that broadcasts the batch."""
+        self.window = window_ms / 1000
+        self.flush = flush
+        self._pending: dict[str, dict] = {}
+        self._handles: dict[str, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def add(self, session_id: str, card_id: str, flipped: bool) -> None:
+        self._pending.setdefault(session_id, {})[card_id] = flipped
+        if session_id not in self._handles:
+            loop = asyncio.get_running_loop()
+            self._handles[session_id] = loop.call_later(self.window, self._fire, session_id)
+
+    def discard(self, session_id: str) -> None:
+        """Drop pending flips (new draw/reset made them irrelevant)."""
+        self._pending.pop(session_id, None)
+        handle = self._handles.pop(session_id, None)
+        if handle is not None:
+            handle.cancel()
+
+    def _fire(self, session_id: str) -> None:
+        self._handles.pop(session_id, None)
+        flips = self._pending.pop(session_id, None)
+        if not flips:
+            return
+        task = asyncio.ensure_future(self.flush(session_id, flips))
+        self._tasks.add(task)
+        task.add_done_callback(functools.partial(self._done, session_id))
+
+    def _done(self, session_id: str, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if task.cancelled():
+            return
+        # забираем исключение сами: иначе оно всплывёт только как "exception never retrieved"
+        exc = task.exception()
+        if exc is not None:
+            metrics.incr("flips.flush_failed")
+            logger.error("flip broadcast for session %s failed", session_id, exc_info=exc)
@@ -0,0 +1,76 @@
+# metadeck/session/codecs.py
+"""
+WebSocket frame codecs.
+
+A client picks one via the WebSocket subprotocol ("metadeck.msgpack",
+"metadeck.json"); clients that don't negotiate get JSON (ujson when
+available). Broadcasts are encoded once per codec by the sender
+(`encode_all`) and recipients just forward their frame.
+
+Only codecs the browser can decode are negotiable: msgpack has a client
+decoder (session/static/session/js/msgpack.js, checked against fixtures from
+`bench_codecs --js-fixtures`). CBOR has none and is kept for `bench_codecs`
+comparisons only.
+"""
+import json
+
+import cbor2
+import msgpack
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+
+
+def _json_dumps(payload) -> str:
+    if ujson is not None:
+        return ujson.dumps(payload, ensure_ascii=False)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def _json_loads(data):
+    if ujson is not None:
+        return ujson.loads(data)
+    return json.loads(data)
+
+
+class Codec:
+    def __init__(self, name: str, dumps, loads, binary: bool):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+        self.binary = binary
+
+    @property
+    def subprotocol(self) -> str:
+        return f"metadeck.{self.name}"
+
+    def encode(self, payload: dict):
+        return self.dumps(payload)
+
+    def decode(self, data) -> dict:
+        return self.loads(data)
+
+
+JSON = Codec("json", _json_dumps, _json_loads, binary=False)
+MSGPACK = Codec("msgpack", msgpack.packb, msgpack.unpackb, binary=True)
+CBOR = Codec("cbor", cbor2.dumps, cbor2.loads, binary=True)
+
+# согласуемые кодеки: каждый broadcast кодируется в каждый из них
+CODECS = {c.name: c for c in (JSON, MSGPACK)}
+SUBPROTOCOLS = {c.subprotocol: c for c in CODECS.values()}
+
+
+def negotiate(offered) -> tuple[Codec, str | None]:
+    """(codec, subprotocol to accept) for the client's offered subprotocols."""
+    for proto in offered or []:
+        codec = SUBPROTOCOLS.get(proto)
+        if codec is not None:
+            return codec, proto
+    return JSON, None
+
+
+def encode_all(payload: dict) -> dict:
+    """Frame per codec name — done once per broadcast by the sender."""
+    return {name: codec.encode(payload) for name, codec in CODECS.items()}
@@ -1,86 +1,189 @@
 # metadeck/session/consumers.py
-import json
-import random
+import asyncio
+import time
+from functools import lru_cache
+from urllib.parse import parse_qs
 
-from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from django.apps import apps
-from django.core.cache import cache
+from channels.layers import get_channel_layer
+from django.conf import settings
 
+from metadeck import metrics
+from . import repository
+from .codecs import JSON, encode_all, negotiate
+from .coalesce import FlipCoalescer
+from .throttle import ActionThrottle
+from .state import draw_delta, flip_delta, flips_delta, reset_delta
 
-CACHE_TTL_SECONDS = 60 * 60 * 6  # 6 часов
 
+def group_name_for(session_id: str) -> str:
+    return f"session_{session_id}"
 
-def flips_cache_key(session_id: str) -> str:
-    return f"metadeck:session:{session_id}:flips"
 
+async def broadcast(session_id: str, message: dict, channel_layer=None):
+    """Assign the next seq, journal the delta and send it to the room group."""
+    message["seq"] = await repository.append_journal(str(session_id), message)
+    await (channel_layer or get_channel_layer()).group_send(
+        group_name_for(session_id),
+        {"type": "session.message", "frames": encode_all(message)},
+    )
 
-class SessionConsumer(AsyncWebsocketConsumer):
-    """
-    WebSocket consumer for a session room.
 
-    - Lazy model loading via apps.get_model
-    - DB calls wrapped with sync_to_async
-    - Broadcasts full "state" payload after each action
-    - Syncs flip state:
-        action: "flip" {card_id, flipped}
-        server stores flips in cache + broadcasts flip to group
-        state includes flips so reconnect/new join sees correct side
-    """
+async def broadcast_flips(session_id: str, flips: dict):
+    await broadcast(session_id, flips_delta(flips))
 
-    # ---------- model getters (lazy) ----------
-    @staticmethod
-    def _Session():
-        return apps.get_model("session", "Session")
 
-    @staticmethod
-    def _SessionEvent():
-        return apps.get_model("session", "SessionEvent")
+@lru_cache(maxsize=None)
+def get_flip_coalescer() -> FlipCoalescer | None:
+    if settings.SESSION_FLIP_COALESCE_MS <= 0:
+        return None
+    return FlipCoalescer(settings.SESSION_FLIP_COALESCE_MS, broadcast_flips)
 
-    @staticmethod
-    def _Card():
-        return apps.get_model("cards", "Card")
 
-    # ---------- cache helpers (sync is ok here) ----------
-    def get_flips(self) -> dict:
-        return cache.get(flips_cache_key(str(self.session_id)), {}) or {}
+@lru_cache(maxsize=None)
+def get_connect_semaphore() -> asyncio.Semaphore:
+    return asyncio.Semaphore(settings.SESSION_CONNECT_CONCURRENCY)
 
-    def set_flips(self, flips: dict) -> None:
-        cache.set(flips_cache_key(str(self.session_id)), flips or {}, CACHE_TTL_SECONDS)
 
-    def set_flip(self, card_id: str, flipped: bool) -> dict:
-        flips = self.get_flips()
-        flips[str(card_id)] = bool(flipped)
-        self.set_flips(flips)
-        return flips
+class SessionConsumer(AsyncWebsocketConsumer):
+    """
+    WebSocket consumer for a session room.
 
-    def clear_flips(self) -> None:
-        self.set_flips({})
+    - DB and Redis work goes through session/repository.py: one hop per
+      action into a bounded pool of SESSION_DB_WORKERS threads, not the
+      single thread-sensitive executor shared by all sockets; the event
+      loop itself never blocks on a round trip
+    - Room state (mode, back, drawn cards) is read from the cached snapshot
+      (see session/state.py); DB is touched only on draw/reset or cache miss
+    - Sequenced delta protocol (session/journal.py):
+        every broadcast (draw / reset / flip) carries a per-session "seq"
+        and is kept in a bounded buffer; a client reconnects with
+        ?last_seq=N (or sends action "resync") and gets only missed deltas,
+        full "state" only when it fell out of the buffer
+    - Frame encoding negotiated via subprotocol (session/codecs.py):
+        metadeck.msgpack (binary) or JSON by default;
+        broadcasts are encoded once by the sender, not per recipient
+    - Syncs flip state:
+        action: "flip" {card_id, flipped}
+        server stores flips in a per-session Redis hash (session/flips.py),
+        in the same hop as the drawn-card check and the audit push
+        + broadcasts them to group as one coalesced "flips" delta per
+        SESSION_FLIP_COALESCE_MS window (session/coalesce.py)
+        state includes flips so reconnect/new join sees correct side
+    - Actions are rate-limited per connection and per session
+      (session/throttle.py); excess ones are dropped and answered with
+      {"type": "throttled", "action", "retry_after"}
+    - Audit trail (draw, reset, flip, join, leave) is queued from the DB
+      pool (never on the event loop) and written in batches by
+      session/audit.py, off the hot path
+    - Heartbeat: server sends {"type": "ping"} every SESSION_HEARTBEAT_SECONDS,
+      client answers action "pong"; silent sockets are closed (and leave the
+      group) after SESSION_HEARTBEAT_TIMEOUT_SECONDS
+    - Connect admission: at most SESSION_CONNECT_CONCURRENCY handshakes per
+      process load state at once; the rest wait, then get rejected so a
+      restart stampede is smoothed by client backoff
+    """
 
-    def prune_flips(self, allowed_ids: list[str]) -> dict:
-        allowed = {str(x) for x in (allowed_ids or [])}
-        current = self.get_flips()
-        pruned = {cid: bool(current.get(cid, False)) for cid in allowed}
-        self.set_flips(pruned)
-        return pruned
+    heartbeat_task = None
 
     async def connect(self):
         self.session_id = self.scope["url_route"]["kwargs"]["session_id"]
-        self.group_name = f"session_{self.session_id}"
+        self.group_name = group_name_for(self.session_id)
+
+        self.codec, subprotocol = negotiate(self.scope.get("subprotocols"))
+        self.throttle = ActionThrottle(self.session_id)
+
+        semaphore = get_connect_semaphore()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), settings.SESSION_CONNECT_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            # отказ до accept — дёшево; клиент переподключится с backoff + jitter
+            metrics.incr("connect.rejected")
+            await self.close()
+            return
 
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.accept()
+        try:
+            await self.channel_layer.group_add(self.group_name, self.channel_name)
+            await self.accept(subprotocol=subprotocol)
 
-        payload = await self.build_state_payload()
-        await self.send_json(payload)
+            query = parse_qs(self.scope.get("query_string", b"").decode())
+            if not await self.send_resume((query.get("last_seq") or [None])[0]):
+                await self.close()
+                return
+        finally:
+            semaphore.release()
+
+        self.last_seen = time.monotonic()
+        self.heartbeat_task = asyncio.ensure_future(self.heartbeat())
+        await repository.record_event(self.session_id, "join", {"channel": self.channel_name})
 
     async def disconnect(self, close_code):
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        if self.heartbeat_task is not None:
+            await repository.record_event(
+                self.session_id, "leave", {"channel": self.channel_name, "code": close_code}
+            )
 
-    async def receive(self, text_data):
-        data = json.loads(text_data or "{}")
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(settings.SESSION_HEARTBEAT_SECONDS)
+            if time.monotonic() - self.last_seen > settings.SESSION_HEARTBEAT_TIMEOUT_SECONDS:
+                # мёртвый сокет: close -> disconnect -> group_discard
+                metrics.incr("heartbeat.reaped")
+                await self.close(code=4408)
+                return
+            await self.send_json({"type": "ping"})
+
+    async def send_resume(self, last_seq) -> bool:
+        """
+        Catch the client up: missed deltas if they are still buffered,
+        otherwise a full state. False if the session does not exist.
+        """
+        messages = await repository.resume(self.session_id, last_seq)
+        if messages is None:
+            return False
+        for message in messages:
+            await self.send_json(message)
+        return True
+
+    async def broadcast(self, message: dict):
+        await broadcast(str(self.session_id), message, self.channel_layer)
+
+    def discard_pending_flips(self) -> None:
+        coalescer = get_flip_coalescer()
+        if coalescer is not None:
+            coalescer.discard(str(self.session_id))
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            if bytes_data is not None:
+                data = self.codec.decode(bytes_data)
+            else:
+                data = JSON.decode(text_data or "{}")
+        except ValueError:
+            return
+        if not isinstance(data, dict):
+            return
+
+        self.last_seen = time.monotonic()
         action = data.get("action")
 
+        if action == "pong":
+            return
+
+        if action == "ping":
+            await self.send_json({"type": "pong"})
+            return
+
+        retry_after = await self.throttle.take(action)
+        if retry_after:
+            await self.send_json(
+                {"type": "throttled", "action": action, "retry_after": round(retry_after, 3)}
+            )
+            return
+
         if action == "draw_one":
             await self.draw_and_broadcast(count=1)
             return
@@ -97,6 +200,10 @@ class SessionConsumer(AsyncWebsocketConsumer):
             await self.reset_and_broadcast()
             return
 
+        if action == "resync":
+            await self.send_resume(data.get("last_seq"))
+            return
+
         if action == "flip":
             card_id = data.get("card_id")
             flipped = data.get("flipped")
@@ -106,157 +213,46 @@ class SessionConsumer(AsyncWebsocketConsumer):
             card_id = str(card_id)
             flipped = bool(flipped)
 
-            # ✅ ВАЖНО: flip разрешаем только для текущих drawn_ids
-            drawn_ids = await self.get_current_drawn_ids()
-            if card_id not in set(map(str, drawn_ids)):
+            # ✅ ВАЖНО: flip разрешаем только для текущих drawn_ids (проверка, запись и аудит — один hop)
+            if not await repository.flip(self.session_id, card_id, flipped):
                 return
 
-            self.set_flip(card_id, flipped)
-
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    "type": "flip.message",
-                    "card_id": card_id,
-                    "flipped": flipped,
-                },
-            )
+            coalescer = get_flip_coalescer()
+            if coalescer is None:
+                await self.broadcast(flip_delta(card_id, flipped))
+            else:
+                coalescer.add(str(self.session_id), card_id, flipped)
             return
 
     async def draw_and_broadcast(self, count: int):
-        drawn_ids = await self.draw_cards(count=count)
-        await self.save_draw_event(drawn_ids)
+        # ✅ flips обрезаются под новую раздачу в том же hop
+        drawn = await repository.draw(self.session_id, count)
+        if drawn is None:
+            return
 
-        # ✅ очищаем/обрезаем flips под новую раздачу
-        self.prune_flips(drawn_ids)
+        snapshot, flips = drawn
+        self.discard_pending_flips()
 
-        payload = await self.build_state_payload()
-        await self.channel_layer.group_send(
-            self.group_name,
-            {"type": "session.message", "payload": payload},
-        )
+        await self.broadcast(draw_delta(snapshot, flips))
 
     async def reset_and_broadcast(self):
-        await self.save_draw_event([])
-        self.clear_flips()
+        snapshot = await repository.reset(self.session_id)
+        if snapshot is None:
+            return
 
-        payload = await self.build_state_payload()
-        await self.channel_layer.group_send(
-            self.group_name,
-            {"type": "session.message", "payload": payload},
-        )
+        self.discard_pending_flips()
 
-    async def session_message(self, event):
-        await self.send_json(event["payload"])
+        await self.broadcast(reset_delta(snapshot))
 
-    async def flip_message(self, event):
-        await self.send_json(
-            {
-                "type": "flip",
-                "card_id": event["card_id"],
-                "flipped": event["flipped"],
-            }
-        )
+    async def session_message(self, event):
+        await self.send_frame(event["frames"][self.codec.name])
 
     async def send_json(self, payload: dict):
-        await self.send(text_data=json.dumps(payload))
-
-    # ---------- DB helpers ----------
-    @sync_to_async
-    def draw_cards(self, count: int):
-        Session = self._Session()
-        Card = self._Card()
-
-        session = Session.objects.select_related("deck").get(id=self.session_id)
-
-        ids = list(
-            Card.objects.filter(deck=session.deck, is_active=True).values_list("id", flat=True)
-        )
-        random.shuffle(ids)
-        return [str(i) for i in ids[:count]]
-
-    @sync_to_async
-    def save_draw_event(self, drawn_ids):
-        Session = self._Session()
-        SessionEvent = self._SessionEvent()
-
-        session = Session.objects.get(id=self.session_id)
-        return SessionEvent.objects.create(
-            session=session,
-            event_type="draw",
-            payload={"drawn_ids": drawn_ids},
-        )
-
-    @sync_to_async
-    def get_current_drawn_ids(self) -> list[str]:
-        """Нужен для валидации flip (flip только по текущим картам)."""
-        Session = self._Session()
-        SessionEvent = self._SessionEvent()
-
-        session = Session.objects.get(id=self.session_id)
-        last = (
-            SessionEvent.objects.filter(session=session, event_type="draw")
-            .order_by("-created_at")
-            .first()
-        )
-        return (last.payload.get("drawn_ids", []) if last else [])
-
-    @sync_to_async
-    def build_state_payload(self):
-        Session = self._Session()
-        SessionEvent = self._SessionEvent()
-        Card = self._Card()
-
-        session = Session.objects.select_related("deck").get(id=self.session_id)
-        deck = session.deck
-
-        last = (
-            SessionEvent.objects.filter(session=session, event_type="draw")
-            .order_by("-created_at")
-            .first()
-        )
-        drawn_ids = (last.payload.get("drawn_ids", []) if last else [])
-
-        cards = list(Card.objects.filter(id__in=drawn_ids))
-        cards_map = {str(c.id): c for c in cards}
-
-        back_url = ""
-        if getattr(deck, "back_full", None):
-            try:
-                back_url = deck.back_full.url
-            except Exception:
-                back_url = ""
-
-        items = []
-        for cid in drawn_ids:
-            c = cards_map.get(str(cid))
-            if not c:
-                continue
-
-            front_url = ""
-            if getattr(c, "image_full", None):
-                try:
-                    front_url = c.image_full.url
-                except Exception:
-                    front_url = ""
-
-            items.append(
-                {
-                    "id": str(cid),
-                    "front_url": front_url,
-                    "back_url": back_url,
-                }
-            )
+        await self.send_frame(self.codec.encode(payload))
+
+    async def send_frame(self, frame):
+        if self.codec.binary:
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
 
-        # ✅ flips: берём из cache, режем по drawn_ids и ПИШЕМ ОБРАТНО (чтобы cache не разрастался)
-        flips = cache.get(flips_cache_key(str(self.session_id)), {}) or {}
-        allowed = {str(x) for x in drawn_ids}
-        flips_pruned = {cid: bool(flips.get(cid, False)) for cid in allowed}
-        cache.set(flips_cache_key(str(self.session_id)), flips_pruned, CACHE_TTL_SECONDS)
-
-        return {
-            "type": "state",
-            "mode": session.mode,
-            "cards": items,
-            "flips": flips_pruned,
-        }
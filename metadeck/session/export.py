@@ -0,0 +1,204 @@
+# metadeck/session/export.py
+"""
+Streaming export of sessions and their event history (NDJSON or CSV).
+
+Rows come from `.values().iterator(chunk_size=...)` (server-side cursor on
+PostgreSQL, no model instances), are processed one chunk at a time and
+serialized line by line, so memory stays flat whatever the export size.
+Drawn cards come from DrawnCard with one JOIN query per chunk. Used by the staff-only `session:export` view and `export_sessions`.
+"""
+import csv
+import json
+from datetime import datetime
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+KINDS = ("events", "sessions")
+
+EVENT_FIELDS = [
+    "event_id", "session_id", "deck_id", "mode", "event_type", "created_at", "payload", "drawn_cards",
+]
+SESSION_FIELDS = ["session_id", "deck_id", "mode", "title", "is_active", "created_at", "events"]
+
+
+def parse_filters(params) -> dict:
+    """deck / mode / since / until from a QueryDict or options dict; ValueError on bad input."""
+    filters = {}
+    if params.get("deck"):
+        filters["deck_id"] = int(params["deck"])
+    if params.get("mode"):
+        filters["mode"] = params["mode"]
+    for name in ("since", "until"):
+        raw = params.get(name)
+        if not raw:
+            continue
+        value = parse_datetime(str(raw))
+        if value is None:
+            day = parse_date(str(raw))
+            if day is None:
+                raise ValueError(f"Bad {name}: {raw!r} (use YYYY-MM-DD or ISO datetime)")
+            value = datetime(day.year, day.month, day.day)
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        filters[name] = value
+    return filters
+
+
+def _chunks(iterable, size: int):
+    it = iter(iterable)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+def _drawn_cards(event_ids) -> dict[int, list[dict]]:
+    """{event_id: [{id, title, code}, ...]} in table order, one JOIN query for the whole chunk."""
+    DrawnCard = apps.get_model("session", "DrawnCard")
+    drawn: dict[int, list[dict]] = {}
+    for row in (
+        DrawnCard.objects.filter(event_id__in=event_ids)
+        .order_by("event_id", "position")
+        .values("event_id", "card_id", "card__title", "card__code")
+    ):
+        drawn.setdefault(row["event_id"], []).append(
+            {"id": row["card_id"], "title": row["card__title"], "code": row["card__code"]}
+        )
+    return drawn
+
+
+def event_rows(filters: dict, chunk_size: int = 2000):
+    SessionEvent = apps.get_model("session", "SessionEvent")
+
+    qs = SessionEvent.objects.all()
+    if "deck_id" in filters:
+        qs = qs.filter(session__deck_id=filters["deck_id"])
+    if "mode" in filters:
+        qs = qs.filter(session__mode=filters["mode"])
+    if "since" in filters:
+        qs = qs.filter(created_at__gte=filters["since"])
+    if "until" in filters:
+        qs = qs.filter(created_at__lt=filters["until"])
+
+    rows = (
+        qs.order_by("created_at", "id")
+        .values("id", "session_id", "session__deck_id", "session__mode", "event_type", "created_at", "payload")
+        .iterator(chunk_size=chunk_size)
+    )
+
+    for chunk in _chunks(rows, chunk_size):
+        # одна выборка карт на пачку, а не на строку
+        drawn = _drawn_cards([row["id"] for row in chunk if row["event_type"] == "draw"])
+        for row in chunk:
+            yield {
+                "event_id": row["id"],
+                "session_id": str(row["session_id"]),
+                "deck_id": row["session__deck_id"],
+                "mode": row["session__mode"],
+                "event_type": row["event_type"],
+                "created_at": row["created_at"],
+                "payload": row["payload"],
+                "drawn_cards": drawn.get(row["id"], []),
+            }
+
+
+def session_rows(filters: dict, chunk_size: int = 2000):
+    Session = apps.get_model("session", "Session")
+
+    qs = Session.objects.all()
+    if "deck_id" in filters:
+        qs = qs.filter(deck_id=filters["deck_id"])
+    if "mode" in filters:
+        qs = qs.filter(mode=filters["mode"])
+    if "since" in filters:
+        qs = qs.filter(created_at__gte=filters["since"])
+    if "until" in filters:
+        qs = qs.filter(created_at__lt=filters["until"])
+
+    rows = (
+        qs.order_by("created_at", "id")
+        .values("id", "deck_id", "mode", "title", "is_active", "created_at")
+        .iterator(chunk_size=chunk_size)
+    )
+
+    SessionEvent = apps.get_model("session", "SessionEvent")
+    for chunk in _chunks(rows, chunk_size):
+        # счётчики событий — тоже одним запросом на пачку
+        counts = {}
+        for session_id, event_type in SessionEvent.objects.filter(
+            session_id__in=[row["id"] for row in chunk]
+        ).values_list("session_id", "event_type").iterator(chunk_size=chunk_size):
+            per_session = counts.setdefault(session_id, {})
+            per_session[event_type] = per_session.get(event_type, 0) + 1
+
+        for row in chunk:
+            yield {
+                "session_id": str(row["id"]),
+                "deck_id": row["deck_id"],
+                "mode": row["mode"],
+                "title": row["title"],
+                "is_active": row["is_active"],
+                "created_at": row["created_at"],
+                "events": counts.get(row["id"], {}),
+            }
+
+
+def export_rows(kind: str, filters: dict, chunk_size: int = 2000):
+    if kind == "sessions":
+        return session_rows(filters, chunk_size), SESSION_FIELDS
+    return event_rows(filters, chunk_size), EVENT_FIELDS
+
+
+# ---------- serializers ----------
+def _dumps(value) -> str:
+    return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+class _Echo:
+    """File-like object for csv.writer that just returns the written line."""
+
+    def write(self, value):
+        return value
+
+
+def to_ndjson(rows):
+    for row in rows:
+        yield _dumps(row) + "\n"
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return _dumps(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def to_csv(rows, fields: list[str]):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([_csv_value(row[f]) for f in fields])
+
+
+def serialize(fmt: str, rows, fields: list[str]):
+    return to_csv(rows, fields) if fmt == "csv" else to_ndjson(rows)
+
+
+async def aiter_sync(iterable, batch: int = 200):
+    """
+    Async iterator over a sync (DB-backed) iterator, `batch` items per thread hop.
+    Under ASGI a sync iterator given to StreamingHttpResponse is read into a
+    list first; this keeps the stream incremental. thread_sensitive keeps every
+    step in one thread, as the server-side cursor requires.
+    """
+    it = iter(iterable)
+    take = sync_to_async(lambda: list(islice(it, batch)), thread_sensitive=True)
+    while parts := await take():
+        for part in parts:
+            yield part
@@ -0,0 +1,114 @@
+# metadeck/session/flips.py
+"""
+Per-session flip state ({card_id: flipped}).
+
+RedisFlipStore keeps one Redis hash per session so a flip is a single HSET
+(no read-modify-write, no lost updates when two participants flip at once).
+LocalFlipStore is an in-process stand-in with the same semantics for tests
+and local runs without Redis (SESSION_STORE_BACKEND = "local").
+"""
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+
+from .state import CACHE_TTL_SECONDS
+
+
+def flips_cache_key(session_id: str) -> str:
+    return f"metadeck:session:{session_id}:flips"
+
+
+# Атомарно: оставить в hash только allowed ids (сохраняя их текущие значения) + TTL
+REPLACE_SCRIPT = """
+local kept = {}
+for i = 2, #ARGV do
+  local v = redis.call('HGET', KEYS[1], ARGV[i])
+  table.insert(kept, ARGV[i])
+  table.insert(kept, v or '0')
+end
+redis.call('DEL', KEYS[1])
+if #kept > 0 then
+  redis.call('HSET', KEYS[1], unpack(kept))
+  redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return kept
+"""
+
+
+def _decode(raw: dict) -> dict:
+    return {
+        (k.decode() if isinstance(k, bytes) else k): v in (b"1", "1")
+        for k, v in raw.items()
+    }
+
+
+class RedisFlipStore:
+    def __init__(self, client, ttl: int = CACHE_TTL_SECONDS):
+        self.client = client
+        self.ttl = ttl
+        self._replace = client.register_script(REPLACE_SCRIPT)
+
+    def get(self, session_id: str) -> dict:
+        return _decode(self.client.hgetall(flips_cache_key(session_id)))
+
+    def set(self, session_id: str, card_id: str, flipped: bool) -> None:
+        key = flips_cache_key(session_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(key, str(card_id), "1" if flipped else "0")
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def replace(self, session_id: str, allowed_ids) -> dict:
+        allowed = [str(x) for x in (allowed_ids or [])]
+        kept = self._replace(keys=[flips_cache_key(session_id)], args=[self.ttl, *allowed])
+        return _decode(dict(zip(kept[::2], kept[1::2])))
+
+    def clear(self, session_id: str) -> None:
+        self.client.delete(flips_cache_key(session_id))
+
+
+class LocalFlipStore:
+    def __init__(self, ttl: int = CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._data: dict[str, tuple[float, dict]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, session_id: str) -> dict:
+        expires_at, flips = self._data.get(session_id, (0, {}))
+        if expires_at < time.monotonic():
+            self._data.pop(session_id, None)
+            return {}
+        return flips
+
+    def get(self, session_id: str) -> dict:
+        with self._lock:
+            return dict(self._live(session_id))
+
+    def set(self, session_id: str, card_id: str, flipped: bool) -> None:
+        with self._lock:
+            flips = self._live(session_id)
+            flips[str(card_id)] = bool(flipped)
+            self._data[session_id] = (time.monotonic() + self.ttl, flips)
+
+    def replace(self, session_id: str, allowed_ids) -> dict:
+        with self._lock:
+            current = self._live(session_id)
+            pruned = {str(cid): bool(current.get(str(cid), False)) for cid in (allowed_ids or [])}
+            self._data[session_id] = (time.monotonic() + self.ttl, pruned)
+            return dict(pruned)
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._data.pop(session_id, None)
+
+
+@lru_cache(maxsize=None)
+def get_flip_store():
+    if settings.SESSION_STORE_BACKEND == "local":
+        return LocalFlipStore()
+
+    from metadeck.redis_client import get_redis
+
+    return RedisFlipStore(get_redis())
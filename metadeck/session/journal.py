@@ -0,0 +1,124 @@
+# metadeck/session/journal.py
+"""
+Per-session sequence number + bounded buffer of recent delta messages.
+
+Every broadcast (draw, reset, flip) gets the next `seq` of its session and is
+kept in a ring buffer of the last SESSION_EVENT_BUFFER messages. A client
+that reconnects with `last_seq` gets only the missed deltas; `since()`
+returns None when it fell out of the buffer and needs a full snapshot.
+"""
+import json
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+from django.conf import settings
+
+from .state import CACHE_TTL_SECONDS
+
+
+def seq_cache_key(session_id: str) -> str:
+    return f"metadeck:session:{session_id}:seq"
+
+
+def log_cache_key(session_id: str) -> str:
+    return f"metadeck:session:{session_id}:log"
+
+
+# INCR seq + ZADD в буфер + обрезка до N последних + TTL — одним вызовом
+APPEND_SCRIPT = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('ZADD', KEYS[2], seq, seq .. ':' .. ARGV[1])
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -(tonumber(ARGV[2]) + 1))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return seq
+"""
+
+
+def _missed(events: list[dict], current: int, last_seq: int) -> list[dict] | None:
+    """Deltas after last_seq, or None if they are not all in the buffer."""
+    if last_seq > current:
+        # счётчик сбросился (TTL/flush) — клиент живёт в другой "эпохе"
+        return None
+    if last_seq == current:
+        return []
+    if not events or events[0]["seq"] != last_seq + 1:
+        return None
+    return events
+
+
+class RedisJournal:
+    def __init__(self, client, size: int, ttl: int = CACHE_TTL_SECONDS):
+        self.client = client
+        self.size = size
+        self.ttl = ttl
+        self._append = client.register_script(APPEND_SCRIPT)
+
+    def append(self, session_id: str, message: dict) -> int:
+        return int(
+            self._append(
+                keys=[seq_cache_key(session_id), log_cache_key(session_id)],
+                args=[json.dumps(message), self.size, self.ttl],
+            )
+        )
+
+    def current_seq(self, session_id: str) -> int:
+        return int(self.client.get(seq_cache_key(session_id)) or 0)
+
+    def since(self, session_id: str, last_seq: int) -> list[dict] | None:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(seq_cache_key(session_id))
+        pipe.zrangebyscore(log_cache_key(session_id), f"({int(last_seq)}", "+inf")
+        current, members = pipe.execute()
+
+        events = []
+        for member in members:
+            seq, _, body = member.decode().partition(":")
+            message = json.loads(body)
+            message["seq"] = int(seq)
+            events.append(message)
+        return _missed(events, int(current or 0), int(last_seq))
+
+
+class LocalJournal:
+    def __init__(self, size: int, ttl: int = CACHE_TTL_SECONDS):
+        self.size = size
+        self.ttl = ttl
+        self._data: dict[str, tuple[float, int, deque]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, session_id: str) -> tuple[int, deque]:
+        expires_at, seq, buf = self._data.get(session_id, (0, 0, None))
+        if expires_at < time.monotonic():
+            return 0, deque(maxlen=self.size)
+        return seq, buf
+
+    def append(self, session_id: str, message: dict) -> int:
+        with self._lock:
+            seq, buf = self._live(session_id)
+            seq += 1
+            buf.append({**message, "seq": seq})
+            self._data[session_id] = (time.monotonic() + self.ttl, seq, buf)
+            return seq
+
+    def current_seq(self, session_id: str) -> int:
+        with self._lock:
+            return self._live(session_id)[0]
+
+    def since(self, session_id: str, last_seq: int) -> list[dict] | None:
+        with self._lock:
+            current, buf = self._live(session_id)
+            events = [dict(m) for m in buf if m["seq"] > last_seq]
+        return _missed(events, current, int(last_seq))
+
+
+@lru_cache(maxsize=None)
+def get_journal():
+    if settings.SESSION_STORE_BACKEND == "local":
+        return LocalJournal(settings.SESSION_EVENT_BUFFER)
+
+    from metadeck.redis_client import get_redis
+
+    return RedisJournal(get_redis(), settings.SESSION_EVENT_BUFFER)
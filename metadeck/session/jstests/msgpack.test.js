@@ -0,0 +1,37 @@
+// metadeck/session/jstests/msgpack.test.js
+// Декодер msgpack.js против кадров, упакованных серверным кодеком (session/codecs.py).
+// Запуск: node --test session/jstests/
+// Фикстуры обновляются: python manage.py bench_codecs --js-fixtures session/jstests/msgpack_fixtures.json
+const assert = require("node:assert/strict");
+const path = require("node:path");
+const test = require("node:test");
+
+require(path.join(__dirname, "..", "static", "session", "js", "msgpack.js"));
+const fixtures = require("./msgpack_fixtures.json");
+const { decode } = globalThis.MetadeckMsgpack;
+
+function fromHex(hex) {
+  return Uint8Array.from(hex.match(/../g) || [], (b) => parseInt(b, 16));
+}
+
+for (const { name, payload, hex } of fixtures) {
+  test(`decodes ${name}`, () => {
+    assert.deepEqual(decode(fromHex(hex)), payload);
+  });
+}
+
+test("decodes from an ArrayBuffer (WebSocket binaryType)", () => {
+  const { payload, hex } = fixtures[0];
+  assert.deepEqual(decode(fromHex(hex).buffer), payload);
+});
+
+test("decodes a frame at a non-zero offset", () => {
+  const { payload, hex } = fixtures[0];
+  const bytes = fromHex("00" + hex);
+  assert.deepEqual(decode(bytes.subarray(1)), payload);
+});
+
+test("rejects unsupported types", () => {
+  // 0xc1 — "never used" в спецификации msgpack
+  assert.throws(() => decode(Uint8Array.of(0xc1)), /unsupported type/);
+});
@@ -0,0 +1,47 @@
+# metadeck/session/management/commands/audit_queue.py
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from session.audit import get_audit_writer
+
+
+class Command(BaseCommand):
+    help = (
+        "Inspect the shared audit queue (SESSION_AUDIT_BACKEND=redis): queued, in-flight and "
+        "dead-lettered events. Dead letters are events whose insert failed "
+        "SESSION_AUDIT_MAX_ATTEMPTS times; after fixing the cause (e.g. a missing partition) "
+        "put them back with --replay or drop them with --purge."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--replay",
+            action="store_true",
+            help="Move dead-lettered events back to the queue (attempts reset).",
+        )
+        parser.add_argument(
+            "--purge",
+            action="store_true",
+            help="Delete dead-lettered events.",
+        )
+
+    def handle(self, *args, **options):
+        if settings.SESSION_AUDIT_BACKEND != "redis":
+            # очередь "memory" живёт в памяти воркера — из другого процесса её не видно
+            raise CommandError("Only the shared redis audit queue can be inspected from a command.")
+        if options["replay"] and options["purge"]:
+            raise CommandError("Use either --replay or --purge.")
+
+        queue = get_audit_writer().queue
+        dead = queue.dead()
+        self.stdout.write(f"queued: {len(queue)} | in flight batches: {queue.in_flight()} | dead: {len(dead)}")
+        by_type = Counter((e["event_type"], e["created_at"][:7]) for e in dead)
+        for (event_type, month), count in sorted(by_type.items()):
+            self.stdout.write(f"  dead {event_type} {month}: {count}")
+
+        if options["replay"]:
+            self.stdout.write(self.style.SUCCESS(f"Replayed: {queue.replay_dead()}"))
+        elif options["purge"]:
+            self.stdout.write(self.style.SUCCESS(f"Purged: {queue.purge_dead()}"))
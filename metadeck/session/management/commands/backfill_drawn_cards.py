@@ -0,0 +1,46 @@
+# metadeck/session/management/commands/backfill_drawn_cards.py
+from django.core.management.base import BaseCommand
+
+from session.audit import drawn_cards_for
+from session.models import DrawnCard, SessionEvent
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill DrawnCard rows from payload['drawn_ids'] of draw events written before "
+        "DrawnCard existed (keyset by event id, idempotent: already converted events are "
+        "skipped; newer events have no drawn_ids in their payload)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Events per batch (default: 2000).",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        last_id = 0
+        events_done = rows_done = 0
+
+        while True:
+            batch = list(
+                SessionEvent.objects.filter(event_type="draw", id__gt=last_id)
+                .order_by("id")
+                .values_list("id", "payload")[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+
+            rows = drawn_cards_for(batch)
+            # unique (event, position): повторный запуск ничего не дублирует
+            DrawnCard.objects.bulk_create(rows, ignore_conflicts=True)
+
+            events_done += len(batch)
+            rows_done += len(rows)
+            self.stdout.write(f"events {events_done} | drawn cards {rows_done} (up to id {last_id})")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {events_done} draw events, {rows_done} drawn cards."))
@@ -0,0 +1,71 @@
+# metadeck/session/management/commands/backfill_session_state.py
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Q, Subquery
+
+from session.models import Session, SessionEvent, SessionState
+
+
+class Command(BaseCommand):
+    help = (
+        "Create SessionState rows for sessions that do not have one yet, from their latest "
+        "draw event. Safe to re-run and to run while rooms are live (existing rows win)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Sessions per batch (default: 1000).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only print how many sessions would be backfilled.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        missing = Session.objects.filter(state__isnull=True)
+
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING(f"Dry-run: {missing.count()} sessions without state."))
+            return
+
+        last_draw = (
+            SessionEvent.objects.filter(session=OuterRef("pk"), event_type="draw")
+            .order_by("-created_at")
+            .values("payload")[:1]
+        )
+        qs = (
+            missing.order_by("pk")
+            .annotate(
+                last_payload=Subquery(last_draw),
+                draws=Count("events", filter=Q(events__event_type="draw")),
+            )
+            .values_list("pk", "last_payload", "draws")
+        )
+
+        total = 0
+        last_pk = None
+        while True:
+            # keyset по pk: строки, которые не вставились (конфликт), не крутятся по кругу
+            batch = list((qs.filter(pk__gt=last_pk) if last_pk else qs)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+
+            states = [
+                SessionState(
+                    session_id=pk,
+                    card_ids=[str(cid) for cid in (payload or {}).get("drawn_ids", [])],
+                    revision=draws,
+                )
+                for pk, payload, draws in batch
+            ]
+            # живые draw могли успеть создать строку — их состояние новее, не трогаем
+            SessionState.objects.bulk_create(states, ignore_conflicts=True)
+            total += len(states)
+            self.stdout.write(f"backfilled {total} sessions")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {total} sessions backfilled."))
@@ -0,0 +1,132 @@
+# metadeck/session/management/commands/bench_codecs.py
+import json
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from session.codecs import CBOR, CODECS, MSGPACK
+
+
+def sample_messages() -> dict:
+    """Typical frames: full state of a 6-card spread, a draw delta and a flip delta."""
+    ids = [str(1000 + i) for i in range(6)]
+    return {
+        "state": {
+            "type": "state",
+            "seq": 1234,
+            "version": 57,
+            "mode": "pick_one_of_six",
+            "manifest_version": "3f9a1c07be52d4e8",
+            "cards": ids,
+            "flips": {cid: i % 2 == 0 for i, cid in enumerate(ids)},
+        },
+        "draw": {
+            "type": "draw",
+            "seq": 1235,
+            "version": 58,
+            "manifest_version": "3f9a1c07be52d4e8",
+            "cards": ids[:3],
+            "flips": {cid: False for cid in ids[:3]},
+        },
+        "flip": {"type": "flip", "seq": 1236, "card_id": "1003", "flipped": True},
+    }
+
+
+def js_fixtures() -> list[dict]:
+    """
+    [{name, payload, hex}] frames packed by the server msgpack codec; the browser
+    decoder (session/static/session/js/msgpack.js) must turn `hex` back into `payload`.
+    """
+    cases = dict(sample_messages())
+    # все ширины int/str/array/map, которые может выдать msgpack.packb
+    cases.update(
+        {
+            "ints": [0, 127, 128, 255, 256, 65535, 65536, 2**32 - 1, 2**32, 2**53 - 1,
+                     -1, -32, -33, -128, -129, -32768, -32769, -(2**31), -(2**31) - 1, -(2**53) + 1],
+            "floats": [0.5, -1.25, 3.141592653589793],
+            "strings": ["", "a" * 31, "b" * 32, "c" * 255, "d" * 256, "карта ✓"],
+            "nil_bool": [None, True, False],
+            "array16": list(range(16)),
+            "map16": {str(i): i for i in range(16)},
+            "nested": {"flips": {"1": True}, "cards": [["1", "2"], []], "seq": 70000},
+        }
+    )
+    return [
+        {"name": name, "payload": payload, "hex": MSGPACK.encode(payload).hex()}
+        for name, payload in cases.items()
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark of WebSocket frame codecs: bytes per frame and encode/decode cost. "
+        "--js-fixtures PATH writes the msgpack frames the JS decoder tests replay."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--number",
+            type=int,
+            default=20000,
+            help="Iterations per measurement (default: 20000).",
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Print results as JSON instead of a table.",
+        )
+        parser.add_argument(
+            "--js-fixtures",
+            metavar="PATH",
+            help="Write msgpack round-trip fixtures for the JS decoder to PATH and exit.",
+        )
+
+    def handle(self, *args, **options):
+        if options["js_fixtures"]:
+            with open(options["js_fixtures"], "w", encoding="utf-8") as f:
+                json.dump(js_fixtures(), f, ensure_ascii=False, indent=1)
+                f.write("\n")
+            self.stdout.write(self.style.SUCCESS(f"Fixtures written to {options['js_fixtures']}"))
+            return
+
+        number = options["number"]
+        results = []
+
+        for message_name, payload in sample_messages().items():
+            baseline = json.dumps(payload)
+            results.append(self.measure(message_name, "stdlib-json", payload, json.dumps, json.loads, number))
+
+            # CBOR не согласуется с браузером, но остаётся для сравнения
+            for codec in (*CODECS.values(), CBOR):
+                results.append(
+                    self.measure(message_name, codec.name, payload, codec.encode, codec.decode, number)
+                )
+
+            for row in results:
+                if row["message"] == message_name:
+                    row["size_vs_stdlib"] = round(row["bytes"] / len(baseline), 3)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f"{'message':<8} {'codec':<12} {'bytes':>6} {'vs json':>8} {'enc µs':>8} {'dec µs':>8}")
+        for row in results:
+            self.stdout.write(
+                f"{row['message']:<8} {row['codec']:<12} {row['bytes']:>6} "
+                f"{row['size_vs_stdlib']:>8} {row['encode_us']:>8} {row['decode_us']:>8}"
+            )
+
+    @staticmethod
+    def measure(message_name, codec_name, payload, dumps, loads, number) -> dict:
+        frame = dumps(payload)
+        size = len(frame.encode() if isinstance(frame, str) else frame)
+        encode_s = timeit.timeit(lambda: dumps(payload), number=number)
+        decode_s = timeit.timeit(lambda: loads(frame), number=number)
+        return {
+            "message": message_name,
+            "codec": codec_name,
+            "bytes": size,
+            "encode_us": round(encode_s / number * 1e6, 3),
+            "decode_us": round(decode_s / number * 1e6, 3),
+        }
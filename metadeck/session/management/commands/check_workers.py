@@ -0,0 +1,105 @@
+# metadeck/session/management/commands/check_workers.py
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cards.models import Deck
+from session.models import Session, SessionMode
+from session.wsclient import WSClient
+
+
+class Command(BaseCommand):
+    help = (
+        "Verify cross-process broadcasts and flips: connect one client to each of two workers, "
+        "draw on the first, expect the draw on the second, flip on the second, expect the flip "
+        "on the first, then reconnect with last_seq. Example (docker compose, 4 workers):\n"
+        "  python manage.py check_workers --url ws://web:8000 --url ws://web:8001 --deck 1"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            action="append",
+            required=True,
+            help="Worker base URL, e.g. ws://127.0.0.1:8000 (give exactly two).",
+        )
+        parser.add_argument("--session", help="Existing session id to use.")
+        parser.add_argument("--deck", type=int, help="Create a temporary session for this deck.")
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=5,
+            help="Seconds to wait for each expected message (default: 5).",
+        )
+
+    def handle(self, *args, **options):
+        urls = options["url"]
+        if len(urls) != 2:
+            raise CommandError("Give exactly two --url values (two different workers).")
+
+        temp_session = None
+        if options["session"]:
+            session_id = options["session"]
+        elif options["deck"]:
+            deck = Deck.objects.filter(id=options["deck"]).first()
+            if deck is None:
+                raise CommandError(f"Deck {options['deck']} not found.")
+            temp_session = Session.objects.create(deck=deck, mode=SessionMode.RANDOM_ONE)
+            session_id = str(temp_session.id)
+        else:
+            raise CommandError("Give --session or --deck.")
+
+        try:
+            asyncio.run(self.check(urls, session_id, options["timeout"]))
+        finally:
+            if temp_session is not None:
+                temp_session.delete()
+
+        self.stdout.write(self.style.SUCCESS("Cross-process broadcasts and flips work."))
+
+    async def check(self, urls, session_id, timeout):
+        path = f"/ws/s/{session_id}/"
+        host = await WSClient.connect(urls[0].rstrip("/") + path)
+        peer = await WSClient.connect(urls[1].rstrip("/") + path)
+
+        try:
+            await self.expect(host, "state", timeout)
+            await self.expect(peer, "state", timeout)
+
+            await host.send_json({"action": "draw_one"})
+            drawn = await self.expect(peer, "draw", timeout)
+            if not drawn.get("cards"):
+                raise CommandError("Draw reached the peer but with no cards (empty deck?).")
+            self.stdout.write(f"draw seq={drawn['seq']} delivered across workers")
+
+            card_id = drawn["cards"][0]
+            await peer.send_json({"action": "flip", "card_id": card_id, "flipped": True})
+            flip = await self.expect(host, ("flip", "flips"), timeout)
+            flipped = flip.get("flipped") if flip["type"] == "flip" else flip["flips"].get(card_id)
+            if flipped is not True:
+                raise CommandError(f"Unexpected flip message: {flip}")
+            self.stdout.write(f"flip seq={flip['seq']} delivered across workers")
+
+            # peer переподключается к другому воркеру с last_seq — должен получить только дельты
+            last_seq = drawn["seq"]
+            await peer.close()
+            peer = await WSClient.connect(f"{urls[0].rstrip('/')}{path}?last_seq={last_seq}")
+            resumed = await self.expect(peer, ("flip", "flips", "state"), timeout)
+            if resumed["type"] == "state":
+                self.stderr.write("resume fell back to a full state (buffer too small?)")
+            else:
+                self.stdout.write(f"resume from seq={last_seq} replayed seq={resumed['seq']}")
+        finally:
+            await host.close()
+            await peer.close()
+
+    @staticmethod
+    async def expect(client, types, timeout) -> dict:
+        types = (types,) if isinstance(types, str) else types
+        try:
+            while True:
+                message = await client.recv_json(timeout)
+                if message.get("type") in types:
+                    return message
+        except asyncio.TimeoutError:
+            raise CommandError(f"Timed out waiting for {'/'.join(types)}.")
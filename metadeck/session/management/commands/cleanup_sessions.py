@@ -1,14 +1,25 @@
 # metadeck/session/management/commands/cleanup_sessions.py
+import time
 from datetime import timedelta
 
 from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from django.db.models import Q
 from django.utils import timezone
 
-from session.models import Session, SessionEvent
+from session.models import DrawnCard, Session, SessionEvent, SessionState
 
 
 class Command(BaseCommand):
-    help = "Delete sessions and session events older than N days (default: 5)."
+    help = (
+        "Delete sessions and session events older than N days (default: 5), in small "
+        "batches: keyset pagination by (created_at, pk); set-based DELETEs (no rows loaded "
+        "into Python) of drawn cards, M2M rows and events before state and sessions, at most "
+        "--batch-size events per short transaction with lock/statement timeouts, however long "
+        "the sessions are. Interrupting is safe: every finished transaction is committed and "
+        "a re-run continues with what is left. If events are partitioned "
+        "(partition_events convert), old events go faster with `partition_events drop`."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -27,11 +38,40 @@ class Command(BaseCommand):
             action="store_true",
             help="Do not delete anything, only print what would be deleted.",
         )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Sessions per batch, and at most this many events per transaction (default: 500).",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.1,
+            help="Seconds to pause between batches to let other writers in (default: 0.1).",
+        )
+        parser.add_argument(
+            "--lock-timeout",
+            default="2s",
+            help="Postgres lock_timeout per batch (default: 2s).",
+        )
+        parser.add_argument(
+            "--statement-timeout",
+            default="30s",
+            help="Postgres statement_timeout per batch (default: 30s).",
+        )
+        parser.add_argument(
+            "--max-retries",
+            type=int,
+            default=5,
+            help="Retries of a batch that hit a timeout before giving up (default: 5).",
+        )
 
     def handle(self, *args, **options):
         days = options["days"]
         only_inactive = options["only_inactive"]
         dry_run = options["dry_run"]
+        self.options = options
 
         cutoff = timezone.now() - timedelta(days=days)
 
@@ -41,24 +81,132 @@ class Command(BaseCommand):
 
         events_qs = SessionEvent.objects.filter(created_at__lt=cutoff)
 
-        sessions_count = sessions_qs.count()
-        events_count = events_qs.count()
-
-        self.stdout.write(
-            self.style.NOTICE(
-                f"Cutoff: {cutoff.isoformat()} | sessions: {sessions_count} | events: {events_count}"
-            )
-        )
-
         if dry_run:
+            self.stdout.write(
+                self.style.NOTICE(
+                    f"Cutoff: {cutoff.isoformat()} | sessions: {sessions_qs.count()} "
+                    f"| events: {events_qs.count()}"
+                )
+            )
             self.stdout.write(self.style.WARNING("Dry-run: nothing deleted."))
             return
 
-        # 1) Удаляем старые сессии (events удалятся каскадом)
-        deleted_sessions = sessions_qs.delete()
+        self.stdout.write(self.style.NOTICE(f"Cutoff: {cutoff.isoformat()}"))
+
+        # 1) Старые сессии вместе со всем, что на них ссылается
+        deleted_sessions = self.run_batches("sessions", sessions_qs, self.delete_sessions)
 
-        # 2) На всякий случай удаляем оставшиеся старые events
-        deleted_events = events_qs.delete()
+        # 2) Старые events оставшихся (долгих) сессий
+        deleted_events = self.run_batches("events", events_qs, self.delete_events)
 
         self.stdout.write(self.style.SUCCESS(f"Deleted sessions: {deleted_sessions}"))
         self.stdout.write(self.style.SUCCESS(f"Deleted events: {deleted_events}"))
+
+    # ---------- engine ----------
+    def run_batches(self, label, qs, delete_batch) -> dict:
+        batch_size = self.options["batch_size"]
+        totals: dict[str, int] = {}
+        cursor = None
+        started = time.monotonic()
+        batch_no = 0
+
+        while True:
+            page = qs.order_by("created_at", "pk")
+            if cursor is not None:
+                created_at, pk = cursor
+                page = page.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+            rows = list(page.values_list("pk", "created_at")[:batch_size])
+            if not rows:
+                break
+
+            pks = [pk for pk, _ in rows]
+            counts = delete_batch(pks)
+            cursor = (rows[-1][1], rows[-1][0])
+
+            batch_no += 1
+            for name, n in counts.items():
+                totals[name] = totals.get(name, 0) + n
+            rows_total = sum(totals.values())
+            rate = rows_total / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f"{label} batch {batch_no}: "
+                + ", ".join(f"{name}={n}" for name, n in counts.items())
+                + f" | total rows {rows_total} | {rate:.0f} rows/s"
+            )
+
+            if len(rows) < batch_size:
+                break
+            time.sleep(self.options["sleep"])
+
+        return totals
+
+    def with_retries(self, delete_batch, target) -> dict:
+        attempt = 0
+        while True:
+            try:
+                with transaction.atomic():
+                    self.set_timeouts()
+                    return delete_batch(target)
+            except OperationalError as exc:
+                attempt += 1
+                if attempt > self.options["max_retries"]:
+                    raise
+                delay = min(2 ** attempt * 0.5, 30)
+                self.stderr.write(f"batch hit {exc.__class__.__name__}: {exc}; retry in {delay:.1f}s")
+                time.sleep(delay)
+
+    def set_timeouts(self) -> None:
+        if connection.vendor != "postgresql":
+            return
+        with connection.cursor() as cur:
+            # SET LOCAL через set_config: действует до конца транзакции батча
+            cur.execute(
+                "SELECT set_config('lock_timeout', %s, true), set_config('statement_timeout', %s, true)",
+                [self.options["lock_timeout"], self.options["statement_timeout"]],
+            )
+
+    # ---------- batch deletes (set-based; дети — явно, до родителей) ----------
+    @staticmethod
+    def raw_delete(qs) -> int:
+        # QuerySet.delete() здесь не fast-delete: у SessionEvent/Session есть обратные CASCADE
+        # (DrawnCard, M2M, SessionState), и Collector грузит строки в Python вместе с payload.
+        # Каскады делаем сами, поэтому хватает одного DELETE ... WHERE по подзапросу
+        return qs._raw_delete(qs.db)
+
+    def delete_event_chunk(self, events) -> dict:
+        """Drawn cards, M2M rows and events of `events` (a pk subquery), one transaction."""
+        CardLink = SessionEvent.cards.through
+        return {
+            # DrawnCard без FK-constraint в БД: каскад базы его не удалит — удаляем сами
+            "drawn_cards": self.raw_delete(DrawnCard.objects.filter(event_id__in=events)),
+            "event_cards": self.raw_delete(CardLink.objects.filter(sessionevent_id__in=events)),
+            "events": self.raw_delete(SessionEvent.objects.filter(pk__in=events)),
+        }
+
+    def delete_sessions(self, session_ids) -> dict:
+        batch_size = self.options["batch_size"]
+        totals = {"drawn_cards": 0, "event_cards": 0, "events": 0}
+        # у долгих сессий событий сколько угодно: не больше batch_size событий на транзакцию
+        chunk = (
+            SessionEvent.objects.filter(session_id__in=session_ids)
+            .order_by("pk")
+            .values("pk")[:batch_size]
+        )
+        while True:
+            counts = self.with_retries(self.delete_event_chunk, chunk)
+            for name, n in counts.items():
+                totals[name] += n
+            if counts["events"] < batch_size:
+                break
+
+        def delete_rows(ids):
+            return {
+                "states": self.raw_delete(SessionState.objects.filter(session_id__in=ids)),
+                "sessions": self.raw_delete(Session.objects.filter(pk__in=ids)),
+            }
+
+        return {**totals, **self.with_retries(delete_rows, session_ids)}
+
+    def delete_events(self, event_ids) -> dict:
+        # страница run_batches — уже не больше batch_size событий
+        return self.with_retries(self.delete_event_chunk, event_ids)
@@ -0,0 +1,48 @@
+# metadeck/session/management/commands/export_sessions.py
+from django.core.management.base import BaseCommand, CommandError
+
+from session.export import FORMATS, KINDS, export_rows, parse_filters, serialize
+from session.models import SessionMode
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream session history as NDJSON or CSV to stdout (or --output), with flat memory. "
+        "Example: python manage.py export_sessions --kind events --deck 1 --since 2026-01-01 > events.ndjson"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kind", choices=KINDS, default="events", help="events (default) or sessions.")
+        parser.add_argument("--format", choices=list(FORMATS), default="ndjson", help="ndjson (default) or csv.")
+        parser.add_argument("--deck", type=int, help="Only sessions of this deck.")
+        parser.add_argument("--mode", choices=SessionMode.values, help="Only sessions in this mode.")
+        parser.add_argument("--since", help="From this date/datetime (inclusive).")
+        parser.add_argument("--until", help="Up to this date/datetime (exclusive).")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Rows per DB fetch / card lookup (default: 2000).",
+        )
+        parser.add_argument("--output", help="Write to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        try:
+            filters = parse_filters(options)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        rows, fields = export_rows(options["kind"], filters, options["chunk_size"])
+        lines = serialize(options["format"], rows, fields)
+
+        if options["output"]:
+            count = 0
+            with open(options["output"], "w", newline="", encoding="utf-8") as f:
+                for line in lines:
+                    f.write(line)
+                    count += 1
+            self.stderr.write(self.style.SUCCESS(f"Wrote {count} lines to {options['output']}"))
+            return
+
+        for line in lines:
+            self.stdout.write(line, ending="")
@@ -0,0 +1,347 @@
+# metadeck/session/management/commands/loadtest_sessions.py
+import asyncio
+import json
+import statistics
+import subprocess
+import threading
+import time
+import tracemalloc
+import uuid
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+
+from cards.models import Card, Deck
+from metadeck import metrics
+from session import audit, consumers, flips, journal, repository, throttle
+from session.models import Session, SessionMode
+from session.routing import websocket_urlpatterns
+from session.wsclient import WSClient, WebSocketClosed
+
+
+class QueryCounter:
+    """execute_wrapper counting queries on every DB connection (all threads)."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def _attach(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def install(self):
+        connection_created.connect(self._attach)
+        for conn in connections.all(initialized_only=True):
+            self._attach(None, conn)
+
+
+class LocalConnection:
+    """In-process connection through channels.testing (no sockets)."""
+
+    def __init__(self, communicator):
+        self.communicator = communicator
+
+    async def send_json(self, payload: dict) -> None:
+        await self.communicator.send_json_to(payload)
+
+    async def recv_json(self, timeout: float) -> dict:
+        return json.loads(await self.communicator.receive_from(timeout))
+
+    async def close(self) -> None:
+        await self.communicator.disconnect()
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    if len(ordered) > 1:
+        q = statistics.quantiles(ordered, n=100, method="inclusive")
+        p50, p95, p99 = q[49], q[94], q[98]
+    else:
+        p50 = p95 = p99 = ordered[0]
+    return {
+        "count": len(ordered),
+        "p50": round(p50, 3),
+        "p95": round(p95, 3),
+        "p99": round(p99, 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test SessionConsumer (in-process, or running workers with --url): N rooms, each with a host and a client doing "
+        "draws, flips and reconnects. Reports latency percentiles, messages/s, DB queries per "
+        "action and memory per connection as JSON (compare runs between commits)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rooms", type=int, default=100, help="Simulated rooms (default: 100).")
+        parser.add_argument("--rounds", type=int, default=10, help="Draw+flip rounds per room (default: 10).")
+        parser.add_argument(
+            "--reconnect-every",
+            type=int,
+            default=5,
+            help="Client reconnects with last_seq every N rounds (default: 5, 0 = never).",
+        )
+        parser.add_argument(
+            "--layer",
+            choices=["inmemory", "redis"],
+            default="inmemory",
+            help="inmemory: InMemoryChannelLayer + local stores/cache; redis: configured Redis.",
+        )
+        parser.add_argument(
+            "--url",
+            help="Drive running workers over real sockets instead (e.g. ws://127.0.0.1:8000); "
+            "DB queries and memory are then not measured.",
+        )
+        parser.add_argument("--deck", type=int, help="Deck to draw from (default: temporary deck).")
+        parser.add_argument("--cards", type=int, default=60, help="Cards in the temporary deck (default: 60).")
+        parser.add_argument(
+            "--db-workers",
+            type=int,
+            help="Override SESSION_DB_WORKERS (0 = thread-sensitive executor) to compare DB paths.",
+        )
+        parser.add_argument("--concurrency", type=int, default=500, help="Rooms running at once (default: 500).")
+        parser.add_argument("--timeout", type=float, default=10, help="Seconds to wait per message (default: 10).")
+        parser.add_argument("--output", help="Write JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.timeout = options["timeout"]
+        if options["rooms"] < 1 or options["rounds"] < 1:
+            raise CommandError("--rooms and --rounds must be positive.")
+
+        overrides = {"SESSION_RATE_LIMITS": {}}
+        if options["db_workers"] is not None:
+            overrides["SESSION_DB_WORKERS"] = options["db_workers"]
+        if options["layer"] == "inmemory" and not options["url"]:
+            overrides.update(
+                CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+                CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+                SESSION_STORE_BACKEND="local",
+                SESSION_AUDIT_BACKEND="memory",
+            )
+
+        deck, temp_deck = self.get_deck(options)
+        sessions = Session.objects.bulk_create(
+            [Session(deck=deck, mode=SessionMode.PICK_ONE_OF_SIX) for _ in range(options["rooms"])]
+        )
+
+        try:
+            with override_settings(**overrides):
+                self.reset_process_singletons()
+                report = asyncio.run(self.run([str(s.id) for s in sessions]))
+                # дописываем хвост аудита, пока сессии ещё существуют
+                audit.get_audit_writer().stop()
+            self.reset_process_singletons()
+        finally:
+            Session.objects.filter(id__in=[s.id for s in sessions]).delete()
+            if temp_deck:
+                deck.delete()
+
+        report["config"] = {
+            k: options[k] for k in ("rooms", "rounds", "reconnect_every", "layer", "url", "db_workers", "concurrency")
+        }
+        if options["db_workers"] is None:
+            report["config"]["db_workers"] = settings.SESSION_DB_WORKERS
+        report["git_commit"] = git_commit()
+
+        text = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(text)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(text)
+
+    @staticmethod
+    def reset_process_singletons():
+        for getter in (
+            flips.get_flip_store,
+            journal.get_journal,
+            throttle.get_throttle_store,
+            consumers.get_flip_coalescer,
+            consumers.get_connect_semaphore,
+            repository.get_db_executor,
+            audit.get_audit_writer,
+        ):
+            getter.cache_clear()
+        metrics.reset()
+
+    def get_deck(self, options):
+        if options["deck"]:
+            deck = Deck.objects.filter(id=options["deck"]).first()
+            if deck is None:
+                raise CommandError(f"Deck {options['deck']} not found.")
+            return deck, False
+
+        deck = Deck.objects.create(title=f"loadtest-{uuid.uuid4().hex[:8]}", is_active=False)
+        Card.objects.bulk_create(
+            [Card(deck=deck, title=f"card {i}", position=i) for i in range(options["cards"])]
+        )
+        return deck, True
+
+    # ---------- run ----------
+    async def run(self, session_ids: list[str]) -> dict:
+        self.app = URLRouter(websocket_urlpatterns)
+        self.latency = {"draw_to_broadcast": [], "flip_to_peer": [], "reconnect": []}
+        self.received = 0
+        self.errors = 0
+        self.actions = 0
+
+        remote = bool(self.options["url"])
+        counter = QueryCounter()
+        counter.install()
+
+        # 1) connect everyone; in-process это и память consumer'ов, и память клиентов
+        tracemalloc.start()
+        base_mem = tracemalloc.get_traced_memory()[0]
+        rooms = await asyncio.gather(*(self.open_room(sid) for sid in session_ids))
+        mem_per_conn = (tracemalloc.get_traced_memory()[0] - base_mem) / max(1, 2 * len(rooms))
+        tracemalloc.stop()
+
+        # 2) exact queries per action on one room, serially
+        queries_per_action = None if remote else await self.probe_queries(rooms[0], counter)
+
+        # 3) concurrent load
+        queries_before = counter.count
+        semaphore = asyncio.Semaphore(self.options["concurrency"])
+
+        async def limited(room):
+            async with semaphore:
+                await self.drive_room(room)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(limited(room) for room in rooms))
+        elapsed = time.perf_counter() - started
+
+        for room in rooms:
+            await room["host"].close()
+            await room["client"].close()
+
+        return {
+            "latency_ms": {name: percentiles(values) for name, values in self.latency.items()},
+            "messages_per_second": round(self.received / elapsed, 1) if elapsed else 0,
+            "actions_per_second": round(self.actions / elapsed, 1) if elapsed else 0,
+            "elapsed_seconds": round(elapsed, 3),
+            "db_queries_per_action": queries_per_action,
+            "db_queries_per_action_under_load": None
+            if remote
+            else round((counter.count - queries_before) / max(1, self.actions), 3),
+            "memory_per_connection_bytes": None if remote else int(mem_per_conn),
+            "errors": self.errors,
+            "metrics": metrics.snapshot(),
+        }
+
+    async def connect(self, session_id: str, last_seq=None):
+        path = f"/ws/s/{session_id}/"
+        if last_seq is not None:
+            path += f"?last_seq={last_seq}"
+        if self.options["url"]:
+            try:
+                return await WSClient.connect(self.options["url"].rstrip("/") + path, timeout=self.timeout)
+            except (OSError, WebSocketClosed) as exc:
+                raise CommandError(f"Could not connect to {path}: {exc}")
+
+        communicator = WebsocketCommunicator(self.app, path)
+        connected, _ = await communicator.connect(self.timeout)
+        if not connected:
+            raise CommandError(f"Could not connect to {path}")
+        return LocalConnection(communicator)
+
+    async def open_room(self, session_id: str) -> dict:
+        host = await self.connect(session_id)
+        client = await self.connect(session_id)
+        state = await self.expect(host, "state")
+        await self.expect(client, "state")
+        return {"session_id": session_id, "host": host, "client": client, "seq": state.get("seq", 0)}
+
+    async def expect(self, connection, types, predicate=None) -> dict:
+        types = (types,) if isinstance(types, str) else types
+        while True:
+            message = await connection.recv_json(self.timeout)
+            self.received += 1
+            if message.get("type") in types and (predicate is None or predicate(message)):
+                return message
+
+    async def probe_queries(self, room: dict, counter: QueryCounter) -> dict:
+        result = {}
+        steps = [
+            ("draw", {"action": "draw_six"}, "draw"),
+            ("flip", None, ("flip", "flips")),
+            ("reset", {"action": "reset"}, "reset"),
+        ]
+        card_id = None
+        for name, payload, expected in steps:
+            if name == "flip":
+                payload = {"action": "flip", "card_id": card_id, "flipped": True}
+            before = counter.count
+            await room["host"].send_json(payload)
+            message = await self.expect(room["client"], expected)
+            await self.expect(room["host"], expected)
+            if name == "draw":
+                card_id = message["cards"][0] if message.get("cards") else "0"
+            result[name] = counter.count - before
+
+        before = counter.count
+        await room["client"].close()
+        room["client"] = await self.connect(room["session_id"])
+        await self.expect(room["client"], "state")
+        result["connect"] = counter.count - before
+        return result
+
+    async def drive_room(self, room: dict):
+        host, client = room["host"], room["client"]
+        try:
+            for round_no in range(1, self.options["rounds"] + 1):
+                t0 = time.perf_counter()
+                await host.send_json({"action": "draw_three"})
+                self.actions += 1
+                drawn = await self.expect(client, "draw")
+                self.latency["draw_to_broadcast"].append((time.perf_counter() - t0) * 1000)
+                room["seq"] = drawn["seq"]
+                await self.expect(host, "draw", lambda m: m["seq"] == drawn["seq"])
+
+                if drawn.get("cards"):
+                    card_id = drawn["cards"][0]
+                    t0 = time.perf_counter()
+                    await client.send_json({"action": "flip", "card_id": card_id, "flipped": True})
+                    self.actions += 1
+                    await self.expect(
+                        host,
+                        ("flip", "flips"),
+                        lambda m: m.get("card_id") == card_id or card_id in m.get("flips", {}),
+                    )
+                    self.latency["flip_to_peer"].append((time.perf_counter() - t0) * 1000)
+
+                every = self.options["reconnect_every"]
+                if every and round_no % every == 0:
+                    await client.close()
+                    t0 = time.perf_counter()
+                    client = room["client"] = await self.connect(room["session_id"], room["seq"])
+                    self.latency["reconnect"].append((time.perf_counter() - t0) * 1000)
+                    self.actions += 1
+        except (asyncio.TimeoutError, CommandError, WebSocketClosed, KeyError, ValueError):
+            self.errors += 1
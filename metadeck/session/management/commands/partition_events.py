@@ -0,0 +1,321 @@
+# metadeck/session/management/commands/partition_events.py
+from datetime import date, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from cards.models import Card
+from session.models import DrawnCard, Session, SessionEvent
+
+
+def month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def add_months(d: date, n: int) -> date:
+    months = d.year * 12 + d.month - 1 + n
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def bound(d: date) -> str:
+    # литерал, а не параметр: в DDL (PARTITION OF ... FOR VALUES) параметры не работают
+    return f"'{d.isoformat()} 00:00:00+00'"
+
+
+class Command(BaseCommand):
+    help = (
+        "Optional PostgreSQL monthly range partitioning of SessionEvent and its M2M "
+        "through-table by created_at. Actions:\n"
+        "  convert — one-time: rebuild both tables as partitioned (takes an exclusive lock, "
+        "copies all rows; run in a maintenance window)\n"
+        "  create  — pre-create partitions for the next --months-ahead months (run from cron); "
+        "rows that landed in the DEFAULT partition meanwhile are moved into the new one\n"
+        "  drop    — detach and DROP partitions entirely older than --days (retention)\n"
+        "  status  — list partitions\n"
+        "Partitions are named <table>_pYYYY_MM, plus a <table>_pdefault DEFAULT partition that "
+        "catches rows of months without one, so a missed cron run never fails inserts "
+        "(`status` warns when it is not empty). The session/created_at indexes are declared "
+        "on the parent, so Postgres creates them on every partition. The through-table gets "
+        "a created_at column (DEFAULT now()) and loses its FK to the events table, which "
+        "Postgres cannot reference without the partition key."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["convert", "create", "drop", "status"])
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=3,
+            help="Future months to keep partitions for (default: 3).",
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=5,
+            help="drop: remove partitions whose whole month is older than this (default: 5).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Print the SQL instead of executing it.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Partitioning is supported on PostgreSQL only.")
+
+        self.dry_run = options["dry_run"]
+        self.events = SessionEvent._meta.db_table
+        self.through = SessionEvent.cards.through._meta.db_table
+
+        action = options["action"]
+        if action == "status":
+            self.status()
+            return
+
+        partitioned = self.is_partitioned(self.events)
+        if action == "convert":
+            if partitioned:
+                raise CommandError(f"{self.events} is already partitioned.")
+            self.convert(options["months_ahead"])
+        elif not partitioned:
+            raise CommandError(f"{self.events} is not partitioned; run `partition_events convert` first.")
+        elif action == "create":
+            self.create_ahead(options["months_ahead"])
+        else:
+            self.drop_expired(options["days"])
+
+    # ---------- helpers ----------
+    def q(self, name: str) -> str:
+        return connection.ops.quote_name(name)
+
+    def execute(self, sql: str, params=None):
+        if self.dry_run:
+            self.stdout.write(sql.strip() + ";")
+            return None
+        with connection.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall() if cur.description else None
+
+    def fetch(self, sql: str, params=None):
+        with connection.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+    def is_partitioned(self, table: str) -> bool:
+        return bool(
+            self.fetch(
+                "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+                "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+                [table],
+            )
+        )
+
+    def partitions(self, parent: str) -> list[tuple[str, int]]:
+        return self.fetch(
+            "SELECT c.relname, c.reltuples::bigint FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s AND pg_table_is_visible(p.oid) ORDER BY c.relname",
+            [parent],
+        )
+
+    @staticmethod
+    def partition_month(parent: str, name: str) -> date | None:
+        suffix = name[len(parent) + 2:]  # <parent>_pYYYY_MM
+        try:
+            year, month = suffix.split("_")
+            return date(int(year), int(month), 1)
+        except ValueError:
+            return None
+
+    def exists(self, table: str) -> bool:
+        return bool(self.fetch("SELECT to_regclass(%s)", [table])[0][0])
+
+    @staticmethod
+    def default_name(table_name: str) -> str:
+        return f"{table_name}_pdefault"
+
+    def create_default(self, parent: str, table_name: str | None = None) -> None:
+        self.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.q(self.default_name(table_name or parent))} "
+            f"PARTITION OF {self.q(parent)} DEFAULT"
+        )
+
+    def create_partition(self, parent: str, month: date, table_name: str | None = None) -> None:
+        name = f"{table_name or parent}_p{month:%Y_%m}"
+        values = f"FOR VALUES FROM ({bound(month)}) TO ({bound(add_months(month, 1))})"
+        default = self.default_name(table_name or parent)
+        rows_in_default = (
+            not self.exists(name)
+            and self.exists(default)
+            and self.fetch(
+                f"SELECT EXISTS (SELECT 1 FROM {self.q(default)} "
+                f"WHERE created_at >= {bound(month)} AND created_at < {bound(add_months(month, 1))})"
+            )[0][0]
+        )
+        if not rows_in_default:
+            self.execute(f"CREATE TABLE IF NOT EXISTS {self.q(name)} PARTITION OF {self.q(parent)} {values}")
+            return
+
+        # cron пропустил месяц и строки легли в DEFAULT: CREATE ... PARTITION OF упал бы
+        # (строки DEFAULT нарушили бы новую границу) — переносим их и подключаем партицию
+        self.stderr.write(f"moving rows of {month:%Y-%m} out of {default}")
+        self.execute(f"CREATE TABLE {self.q(name)} (LIKE {self.q(parent)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        self.execute(
+            f"WITH moved AS (DELETE FROM {self.q(default)} WHERE created_at >= {bound(month)} "
+            f"AND created_at < {bound(add_months(month, 1))} RETURNING *) "
+            f"INSERT INTO {self.q(name)} SELECT * FROM moved"
+        )
+        self.execute(f"ALTER TABLE {self.q(parent)} ATTACH PARTITION {self.q(name)} {values}")
+
+    def months(self, first: date, months_ahead: int) -> list[date]:
+        last = add_months(month_start(timezone.now().date()), months_ahead)
+        result, current = [], month_start(first)
+        while current <= last:
+            result.append(current)
+            current = add_months(current, 1)
+        return result
+
+    # ---------- actions ----------
+    def status(self):
+        for parent in (self.events, self.through):
+            if not self.is_partitioned(parent):
+                self.stdout.write(f"{parent}: not partitioned")
+                continue
+            self.stdout.write(f"{parent}:")
+            for name, rows in self.partitions(parent):
+                self.stdout.write(f"  {name}  ~{max(rows, 0)} rows")
+            default = self.default_name(parent)
+            if self.exists(default) and self.fetch(f"SELECT EXISTS (SELECT 1 FROM {self.q(default)})")[0][0]:
+                self.stdout.write(
+                    self.style.WARNING(f"  {default} has rows: a month is missing, run `partition_events create`")
+                )
+
+    def create_ahead(self, months_ahead: int):
+        first = month_start(timezone.now().date())
+        with transaction.atomic():
+            # таблицы, сконвертированные до появления DEFAULT-партиции, получают её здесь
+            self.create_default(self.events)
+            self.create_default(self.through)
+            for month in self.months(first, months_ahead):
+                self.create_partition(self.events, month)
+                self.create_partition(self.through, month)
+        self.stdout.write(self.style.SUCCESS(f"Partitions ensured up to {months_ahead} months ahead."))
+
+    def drop_expired(self, days: int):
+        cutoff = (timezone.now() - timedelta(days=days)).date()
+        dropped = 0
+        for parent in (self.through, self.events):
+            for name, _ in self.partitions(parent):
+                month = self.partition_month(parent, name)
+                # удаляем только месяц, который целиком старше cutoff
+                if month is None or add_months(month, 1) > cutoff:
+                    continue
+                with transaction.atomic():
+                    if parent == self.events:
+                        # DrawnCard ссылается на события без FK — чистим его явно
+                        self.execute(
+                            f"DELETE FROM {self.q(DrawnCard._meta.db_table)} "
+                            f"WHERE event_id IN (SELECT id FROM {self.q(name)})"
+                        )
+                    self.execute(f"ALTER TABLE {self.q(parent)} DETACH PARTITION {self.q(name)}")
+                    self.execute(f"DROP TABLE {self.q(name)}")
+                dropped += 1
+                self.stdout.write(f"dropped {name}")
+        self.stdout.write(self.style.SUCCESS(f"Dropped partitions: {dropped}"))
+
+    def convert(self, months_ahead: int):
+        ev, th = self.events, self.through
+        ev_new, th_new = f"{ev}_partitioned", f"{th}_partitioned"
+        ev_seq, th_seq = f"{ev}_id_part_seq", f"{th}_id_part_seq"
+        event_fk = SessionEvent.cards.field.m2m_column_name()
+        card_fk = SessionEvent.cards.field.m2m_reverse_name()
+
+        oldest = SessionEvent.objects.order_by("created_at").values_list("created_at", flat=True).first()
+        months = self.months((oldest or timezone.now()).astimezone(dt_timezone.utc).date(), months_ahead)
+
+        with transaction.atomic():
+            self.execute(f"LOCK TABLE {self.q(ev)}, {self.q(th)} IN ACCESS EXCLUSIVE MODE")
+
+            # 1) events: та же структура, PK (id, created_at), id из своей sequence
+            self.execute(
+                f"CREATE TABLE {self.q(ev_new)} (LIKE {self.q(ev)} INCLUDING DEFAULTS) "
+                f"PARTITION BY RANGE (created_at)"
+            )
+            self.execute(f"CREATE SEQUENCE {self.q(ev_seq)} OWNED BY {self.q(ev_new)}.id")
+            self.execute(
+                f"ALTER TABLE {self.q(ev_new)} ALTER COLUMN id SET DEFAULT nextval('{ev_seq}')"
+            )
+            self.execute(f"ALTER TABLE {self.q(ev_new)} ADD PRIMARY KEY (id, created_at)")
+            for month in months:
+                self.create_partition(ev_new, month, table_name=ev)
+            self.create_default(ev_new, table_name=ev)
+            self.execute(f"INSERT INTO {self.q(ev_new)} SELECT * FROM {self.q(ev)}")
+            self.execute(
+                f"SELECT setval('{ev_seq}', COALESCE((SELECT MAX(id) FROM {self.q(ev_new)}), 0) + 1, false)"
+            )
+
+            # 2) through: + created_at события (ключ партиционирования)
+            self.execute(
+                f"CREATE TABLE {self.q(th_new)} (LIKE {self.q(th)} INCLUDING DEFAULTS, "
+                f"created_at timestamp with time zone NOT NULL DEFAULT now()) "
+                f"PARTITION BY RANGE (created_at)"
+            )
+            self.execute(f"CREATE SEQUENCE {self.q(th_seq)} OWNED BY {self.q(th_new)}.id")
+            self.execute(
+                f"ALTER TABLE {self.q(th_new)} ALTER COLUMN id SET DEFAULT nextval('{th_seq}')"
+            )
+            self.execute(f"ALTER TABLE {self.q(th_new)} ADD PRIMARY KEY (id, created_at)")
+            self.execute(
+                f"ALTER TABLE {self.q(th_new)} ADD UNIQUE ({self.q(event_fk)}, {self.q(card_fk)}, created_at)"
+            )
+            for month in months:
+                self.create_partition(th_new, month, table_name=th)
+            self.create_default(th_new, table_name=th)
+            self.execute(
+                f"INSERT INTO {self.q(th_new)} SELECT t.*, e.created_at FROM {self.q(th)} t "
+                f"JOIN {self.q(ev)} e ON e.id = t.{self.q(event_fk)}"
+            )
+            self.execute(
+                f"SELECT setval('{th_seq}', COALESCE((SELECT MAX(id) FROM {self.q(th_new)}), 0) + 1, false)"
+            )
+
+            # 3) подмена таблиц
+            self.execute(f"DROP TABLE {self.q(th)}")
+            self.execute(f"DROP TABLE {self.q(ev)}")
+            self.execute(f"ALTER TABLE {self.q(ev_new)} RENAME TO {self.q(ev)}")
+            self.execute(f"ALTER TABLE {self.q(th_new)} RENAME TO {self.q(th)}")
+
+            # 4) FK на обычные таблицы (как у Django: DEFERRABLE INITIALLY DEFERRED)
+            fks = [
+                (ev, "session_id", Session._meta.db_table),
+                (ev, "chosen_card_id", Card._meta.db_table),
+                (th, card_fk, Card._meta.db_table),
+            ]
+            for table, column, target in fks:
+                self.execute(
+                    f"ALTER TABLE {self.q(table)} ADD CONSTRAINT {self.q(f'{table}_{column}_fk')} "
+                    f"FOREIGN KEY ({self.q(column)}) REFERENCES {self.q(target)} (id) "
+                    f"DEFERRABLE INITIALLY DEFERRED"
+                )
+
+            # 5) индексы на родителе => на каждой партиции
+            if self.dry_run:
+                self.stdout.write("-- + Meta.indexes of SessionEvent and FK column indexes")
+            else:
+                with connection.schema_editor() as editor:
+                    for index in SessionEvent._meta.indexes:
+                        editor.add_index(SessionEvent, index)
+            for table, column in ((ev, "chosen_card_id"), (th, event_fk), (th, card_fk)):
+                self.execute(
+                    f"CREATE INDEX {self.q(f'{table}_{column}_part_idx')} "
+                    f"ON {self.q(table)} ({self.q(column)})"
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{ev} and {th} are now partitioned by month "
+                f"({months[0]:%Y-%m} .. {months[-1]:%Y-%m})."
+            )
+        )
@@ -0,0 +1,94 @@
+# metadeck/session/management/commands/runworkers.py
+import os
+import signal
+import subprocess
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Run N daphne ASGI workers on consecutive ports (base-port .. base-port+N-1) "
+        "and restart any that exit. nginx balances across them (see nginx/metadeck.conf); "
+        "rooms work across workers because state and groups live in Redis."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=int(os.getenv("WEB_WORKERS", os.cpu_count() or 1)),
+            help="Number of worker processes (default: $WEB_WORKERS or CPU count).",
+        )
+        parser.add_argument(
+            "--bind",
+            default="0.0.0.0",
+            help="Address to bind workers to (default: 0.0.0.0).",
+        )
+        parser.add_argument(
+            "--base-port",
+            type=int,
+            default=8000,
+            help="Port of the first worker (default: 8000).",
+        )
+        parser.add_argument(
+            "--app",
+            default="metadeck.asgi:application",
+            help="ASGI application path (default: metadeck.asgi:application).",
+        )
+
+    def handle(self, *args, **options):
+        workers = max(1, options["workers"])
+        self.bind = options["bind"]
+        self.base_port = options["base_port"]
+        self.app = options["app"]
+        self.stopping = False
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        # index -> [process, started_at, restart_delay, restart_at (None — работает)]
+        procs = {i: [self.spawn(i), time.monotonic(), 1.0, None] for i in range(workers)}
+
+        while not self.stopping:
+            time.sleep(1)
+            now = time.monotonic()
+            for i, state in procs.items():
+                proc, started_at, delay, restart_at = state
+                if restart_at is not None:
+                    # ждём свой дедлайн, не блокируя присмотр за остальными
+                    if now >= restart_at and not self.stopping:
+                        procs[i] = [self.spawn(i), now, delay, None]
+                    continue
+                if proc.poll() is None:
+                    continue
+
+                uptime = now - started_at
+                # долго прожил — значит падение не циклическое, backoff сбрасываем
+                delay = 1.0 if uptime > 60 else min(delay * 2, 30.0)
+                self.stderr.write(
+                    f"worker {i} (port {self.base_port + i}) exited with {proc.returncode}, "
+                    f"restarting in {delay:.0f}s"
+                )
+                procs[i] = [proc, started_at, delay, now + delay]
+
+        for proc, *_ in procs.values():
+            if proc.poll() is None:
+                proc.terminate()
+        deadline = time.monotonic() + 10
+        for proc, *_ in procs.values():
+            try:
+                proc.wait(timeout=max(0.1, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+        self.stdout.write(self.style.SUCCESS("All workers stopped."))
+
+    def spawn(self, index: int) -> subprocess.Popen:
+        port = self.base_port + index
+        self.stdout.write(f"starting worker {index} on {self.bind}:{port}")
+        return subprocess.Popen(["daphne", "-b", self.bind, "-p", str(port), self.app])
+
+    def stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,28 @@
+# metadeck/session/management/commands/throttle_stats.py
+from django.core.management.base import BaseCommand
+
+from session.throttle import get_throttle_store
+
+
+class Command(BaseCommand):
+    help = "Show how often SessionConsumer rate limits fired (shared counters)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Reset counters after printing.",
+        )
+
+    def handle(self, *args, **options):
+        store = get_throttle_store()
+        stats = store.stats()
+
+        if not stats:
+            self.stdout.write(self.style.NOTICE("No throttling recorded."))
+        for name, count in sorted(stats.items()):
+            self.stdout.write(f"{name}: {count}")
+
+        if options["reset"]:
+            store.reset_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
@@ -0,0 +1,47 @@
+# metadeck/session/management/commands/update_draw_stats.py
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from session.stats import rebuild_rollups, update_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold new SessionEvent rows into the per-day card/deck/mode draw statistics "
+        "(high-water mark, exactly once). Run every few minutes from cron; --rebuild "
+        "recounts the days the event log still fully holds (up to the high-water mark) "
+        "and keeps the totals of older, already cleaned-up days. On a fresh install "
+        "either one counts the whole log up to the current max(id)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Recount rollups of fully retained days from the event log (backfill).",
+        )
+        parser.add_argument(
+            "--since",
+            type=date.fromisoformat,
+            help="--rebuild: first day to recount, YYYY-MM-DD (default: first fully retained day).",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Events per transaction (default: 5000).",
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            try:
+                recounted = rebuild_rollups(options["chunk_size"], options["since"], log=self.stdout.write)
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(self.style.SUCCESS(f"Recounted events: {recounted}"))
+        elif options["since"]:
+            raise CommandError("--since only applies to --rebuild.")
+
+        counted = update_rollups(options["chunk_size"], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f"Counted events: {counted}"))
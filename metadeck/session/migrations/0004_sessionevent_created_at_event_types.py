@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-17 12:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('session', '0003_sessionstate'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sessionevent',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='sessionevent',
+            name='event_type',
+            field=models.CharField(choices=[('draw', 'draw'), ('pick', 'pick'), ('flip', 'flip'), ('reset', 'reset'), ('join', 'join'), ('leave', 'leave')], max_length=16),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0.1 on 2026-10-17 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('session', '0004_sessionevent_created_at_event_types'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['created_at', 'id'], name='session_ses_created_1b956b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sessionevent',
+            index=models.Index(fields=['created_at', 'id'], name='session_ses_created_d44d0a_idx'),
+        ),
+    ]
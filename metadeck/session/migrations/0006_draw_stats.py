@@ -0,0 +1,56 @@
+# Generated by Django 6.0.1 on 2026-10-17 14:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0002_card_art_original_deck_frame_color_and_more'),
+        ('session', '0005_cleanup_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsCursor',
+            fields=[
+                ('name', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('next_event_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DeckDrawStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('mode', models.CharField(choices=[('random_one', '1 random card'), ('pick_one_of_six', 'Pick 1 of 6'), ('past_present_future', 'Past-Present-Future (3)'), ('resource_block_action', 'Resource-Block-Action (3)'), ('emotion_plus_card', 'Emotion + Card'), ('blind_choice', 'Blind choice')], max_length=32)),
+                ('draws', models.PositiveIntegerField(default=0)),
+                ('cards_drawn', models.PositiveIntegerField(default=0)),
+                ('flips', models.PositiveIntegerField(default=0)),
+                ('resets', models.PositiveIntegerField(default=0)),
+                ('deck', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='draw_stats', to='cards.deck')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('deck', 'day', 'mode'), name='unique_deck_stats_day_mode')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CardDrawStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('mode', models.CharField(choices=[('random_one', '1 random card'), ('pick_one_of_six', 'Pick 1 of 6'), ('past_present_future', 'Past-Present-Future (3)'), ('resource_block_action', 'Resource-Block-Action (3)'), ('emotion_plus_card', 'Emotion + Card'), ('blind_choice', 'Blind choice')], max_length=32)),
+                ('draws', models.PositiveIntegerField(default=0)),
+                ('flips', models.PositiveIntegerField(default=0)),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='draw_stats', to='cards.card')),
+                ('deck', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='card_draw_stats', to='cards.deck')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['deck', 'day'], name='session_car_deck_id_308309_idx')],
+                'constraints': [models.UniqueConstraint(fields=('card', 'day', 'mode'), name='unique_card_stats_day_mode')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-17 15:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0002_card_art_original_deck_frame_color_and_more'),
+        ('session', '0006_draw_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DrawnCard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField()),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='draws', to='cards.card')),
+                ('event', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='drawn_cards', to='session.sessionevent')),
+            ],
+            options={
+                'ordering': ['event', 'position'],
+                'indexes': [models.Index(fields=['card', 'event'], name='session_dra_card_id_6f53b9_idx')],
+                'constraints': [models.UniqueConstraint(fields=('event', 'position'), name='unique_drawn_card_position')],
+            },
+        ),
+    ]
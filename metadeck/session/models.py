@@ -2,6 +2,7 @@
 import secrets
 import uuid
 from django.db import models
+from django.utils import timezone
 
 from cards.models import Deck, Card
 
@@ -34,20 +35,62 @@ class Session(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # keyset-пагинация cleanup_sessions по (created_at, pk)
+            models.Index(fields=["created_at", "id"]),
+        ]
 
     def __str__(self):
         return f"{self.deck_id} | {self.mode} | {self.id}"
 
 
+class SessionState(models.Model):
+    """
+    Current draw of a session: one row per session, read by primary key.
+
+    card_ids repeats the DrawnCard rows of the latest draw on purpose: it is
+    the pointer a snapshot reload reads (one PK lookup, no join over the
+    event log, which is written later and asynchronously); DrawnCard is the
+    history.
+    """
+    session = models.OneToOneField(
+        Session, on_delete=models.CASCADE, primary_key=True, related_name="state"
+    )
+
+    # ordered ids of the cards on the table (strings, as in the WS protocol)
+    card_ids = models.JSONField(default=list, blank=True)
+    # bumped on every draw/reset; doubles as the cached snapshot version (session/state.py)
+    revision = models.PositiveIntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.session_id} | rev {self.revision}"
+
+
 class SessionEventType(models.TextChoices):
     DRAW = "draw", "draw"
     PICK = "pick", "pick"
     FLIP = "flip", "flip"
     RESET = "reset", "reset"
+    JOIN = "join", "join"
+    LEAVE = "leave", "leave"
 
 
 class SessionEvent(models.Model):
-    """History of actions inside a session (useful for syncing + audit)."""
+    """
+    History of actions inside a session (useful for syncing + audit).
+
+    After `manage.py partition_events convert` the database differs from the
+    migration state on purpose: this table and the `cards` through-table are
+    partitioned by month (plus a DEFAULT partition), their primary keys are
+    (id, created_at), the through-table has an extra created_at column and no
+    FK to this table. makemigrations only compares models with migration
+    state, so it sees nothing; but any migration that alters these two tables
+    (their id, FKs, indexes) must be hand-written as SeparateDatabaseAndState:
+    state_operations as generated, database_operations as RunSQL that works
+    on both the plain and the partitioned layout.
+    """
     session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name="events")
     event_type = models.CharField(max_length=16, choices=SessionEventType.choices)
 
@@ -62,14 +105,94 @@ class SessionEvent(models.Model):
     # Store extra info (positions, who clicked, etc.)
     payload = models.JSONField(default=dict, blank=True)
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    # время самого действия: события пишутся пачками позже (session/audit.py)
+    created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ["created_at"]
         indexes = [
             models.Index(fields=["session", "created_at"]),
             models.Index(fields=["session", "event_type"]),
+            models.Index(fields=["created_at", "id"]),
         ]
 
     def __str__(self):
         return f"{self.session_id} | {self.event_type} | {self.created_at}"
+
+
+class DrawnCard(models.Model):
+    """Card dealt by a draw event, in table order (the only copy; see session/audit.py)."""
+    # без FK-constraint в БД: events может быть партиционирована (partition_events),
+    # а на партиционированную таблицу без ключа партиции ссылаться нельзя
+    event = models.ForeignKey(
+        SessionEvent, on_delete=models.CASCADE, related_name="drawn_cards", db_constraint=False
+    )
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name="draws")
+    position = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ["event", "position"]
+        constraints = [
+            models.UniqueConstraint(fields=["event", "position"], name="unique_drawn_card_position"),
+        ]
+        indexes = [
+            # "события, где выпала карта X"
+            models.Index(fields=["card", "event"]),
+        ]
+
+    def __str__(self):
+        return f"{self.event_id} | #{self.position} | card {self.card_id}"
+
+
+class CardDrawStats(models.Model):
+    """Per-day rollup of one card's draws/flips in one mode (see update_draw_stats)."""
+    day = models.DateField()
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name="draw_stats")
+    deck = models.ForeignKey(Deck, on_delete=models.CASCADE, related_name="card_draw_stats")
+    mode = models.CharField(max_length=32, choices=SessionMode.choices)
+
+    draws = models.PositiveIntegerField(default=0)
+    flips = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["card", "day", "mode"], name="unique_card_stats_day_mode"),
+        ]
+        indexes = [
+            models.Index(fields=["deck", "day"]),
+        ]
+
+    def __str__(self):
+        return f"{self.day} | card {self.card_id} | {self.mode}"
+
+
+class DeckDrawStats(models.Model):
+    """Per-day rollup of a deck's activity in one mode (see update_draw_stats)."""
+    day = models.DateField()
+    deck = models.ForeignKey(Deck, on_delete=models.CASCADE, related_name="draw_stats")
+    mode = models.CharField(max_length=32, choices=SessionMode.choices)
+
+    draws = models.PositiveIntegerField(default=0)
+    cards_drawn = models.PositiveIntegerField(default=0)
+    flips = models.PositiveIntegerField(default=0)
+    resets = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["deck", "day", "mode"], name="unique_deck_stats_day_mode"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} | deck {self.deck_id} | {self.mode}"
+
+
+class StatsCursor(models.Model):
+    """High-water mark of the SessionEvent ids already counted into the rollups."""
+    name = models.CharField(max_length=32, primary_key=True)
+    last_event_id = models.BigIntegerField(default=0)
+    # граница следующего прогона: события до неё точно уже закоммичены
+    next_event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_event_id}"
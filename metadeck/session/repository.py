@@ -0,0 +1,136 @@
+# metadeck/session/repository.py
+"""
+Async data access for SessionConsumer.
+
+Each public coroutine is ONE hop off the event loop that does all the sync
+work of an action (cache, Redis stores, ORM), instead of one sync_to_async
+hop per helper. Nothing in the consumer talks to Redis or the DB directly:
+a blocking round trip on the event loop stalls every socket of the worker.
+
+Hops go to a dedicated pool of SESSION_DB_WORKERS threads (each with its own
+DB connection), not to asgiref's thread-sensitive executor, which is a single
+thread shared by every socket of the worker and serializes all DB work.
+Django's async queryset methods (aget/acreate/...) are wrappers over that same
+thread-sensitive executor, so they are not used here.
+
+SESSION_DB_WORKERS = 0 restores the old thread-sensitive behaviour; compare with
+    python manage.py loadtest_sessions --db-workers 0
+    python manage.py loadtest_sessions --db-workers 8
+"""
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from cards.sampler import sample_cards
+from . import audit
+from .flips import get_flip_store
+from .journal import get_journal
+from .state import drawn_ids_of, get_snapshot, record_draw, state_payload
+
+
+@lru_cache(maxsize=None)
+def get_db_executor() -> ThreadPoolExecutor | None:
+    workers = settings.SESSION_DB_WORKERS
+    if workers <= 0:
+        return None
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="metadeck-db")
+
+
+def db_task(func):
+    """Run `func` off the event loop in the bounded DB pool (or thread-sensitive if disabled)."""
+
+    @functools.wraps(func)
+    def job(*args, **kwargs):
+        # в пуле нет request_started/finished — старые/битые соединения закрываем сами
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    @functools.wraps(func)
+    async def run(*args, **kwargs):
+        executor = get_db_executor()
+        if executor is None:
+            return await sync_to_async(func)(*args, **kwargs)
+        return await sync_to_async(job, thread_sensitive=False, executor=executor)(*args, **kwargs)
+
+    return run
+
+
+@db_task
+def resume(session_id: str, last_seq) -> list[dict] | None:
+    """
+    Messages that catch a client up: missed deltas if still journaled, else
+    one full state. None if the session does not exist.
+    """
+    session_id = str(session_id)
+    journal = get_journal()
+    if last_seq is not None:
+        try:
+            missed = journal.since(session_id, int(last_seq))
+        except (TypeError, ValueError):
+            missed = None
+        if missed is not None:
+            return missed
+
+    # seq читаем ДО snapshot: всё, что случится после, придёт через группу
+    seq = journal.current_seq(session_id)
+    snapshot = get_snapshot(session_id)
+    if snapshot is None:
+        return None
+    return [state_payload(snapshot, get_flip_store().get(session_id), seq=seq)]
+
+
+@db_task
+def append_journal(session_id: str, message: dict) -> int:
+    """Journal a broadcast; returns its seq."""
+    return get_journal().append(str(session_id), message)
+
+
+@db_task
+def draw(session_id: str, count: int) -> tuple[dict, dict] | None:
+    """
+    Sample `count` cards and persist the draw. Returns the new snapshot and
+    its flips (pruned to the new cards), None if the session does not exist.
+    """
+    session_id = str(session_id)
+    snapshot = get_snapshot(session_id)
+    if snapshot is None:
+        return None
+    drawn_ids = [str(i) for i in sample_cards(snapshot["deck_id"], count)]
+    snapshot = record_draw(session_id, snapshot, drawn_ids)
+    return snapshot, get_flip_store().replace(session_id, drawn_ids_of(snapshot))
+
+
+@db_task
+def reset(session_id: str) -> dict | None:
+    """Record an empty draw and clear flips. Returns the new (empty) snapshot, None if no session."""
+    session_id = str(session_id)
+    snapshot = get_snapshot(session_id)
+    if snapshot is None:
+        return None
+    snapshot = record_draw(session_id, snapshot, [], event_type="reset")
+    get_flip_store().clear(session_id)
+    return snapshot
+
+
+@db_task
+def flip(session_id: str, card_id: str, flipped: bool) -> bool:
+    """Store a flip of a currently drawn card and queue its audit event. False if not drawn."""
+    session_id = str(session_id)
+    if card_id not in set(drawn_ids_of(get_snapshot(session_id))):
+        return False
+    get_flip_store().set(session_id, card_id, flipped)
+    audit.record(session_id, "flip", {"card_id": card_id, "flipped": flipped})
+    return True
+
+
+@db_task
+def record_event(session_id: str, event_type: str, payload: dict | None = None) -> None:
+    """Queue an audit event (a Redis push, or the INSERT itself with the "sync" backend)."""
+    audit.record(str(session_id), event_type, payload)
@@ -0,0 +1,253 @@
+# metadeck/session/state.py
+"""
+Hot per-session state snapshot kept in the shared cache.
+
+The snapshot holds everything a room needs to render (mode, deck back,
+ordered drawn cards with resolved front URLs and responsive srcsets) and is
+rewritten only on draw/reset. Readers (connect, flip validation, the room view) hit the cache;
+the DB is used only as a fallback when the snapshot is missing or stale.
+
+The DB source of truth for the current draw is SessionState (one row per
+session, read by primary key); SessionEvent is an append-only audit log.
+
+The snapshot "version" is SessionState.revision. A draw/reset stores its
+snapshot and queues its audit event from `transaction.on_commit`, so a
+rolled-back draw leaves neither behind, and the store is conditional
+(`store_snapshot`): concurrent draws may commit in one order and reach the
+cache in the other, but an older revision never overwrites a newer one.
+
+Flips are NOT part of the snapshot (they change on every click) and are
+merged in by `state_payload`.
+
+Client messages carry only card ids and the deck `manifest_version`; URLs
+come from the deck asset manifest (cards/manifest.py). Resolved images stay
+in the snapshot for the server-rendered room page.
+"""
+import functools
+import threading
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+
+from cards.manifest import manifest_version
+from cards.sampler import card_image, get_card_images
+from cards.utils import file_url, srcsets
+from .audit import record
+
+
+CACHE_TTL_SECONDS = 60 * 60 * 6  # 6 часов
+
+
+def state_cache_key(session_id: str) -> str:
+    return f"metadeck:session:{session_id}:state"
+
+
+def state_version_key(session_id: str) -> str:
+    return f"metadeck:session:{session_id}:state_version"
+
+
+# кэш без set_if_newer (LocMemCache в dev/тестах) — один процесс, хватает лока
+_store_lock = threading.Lock()
+
+
+def store_snapshot(snapshot: dict) -> bool:
+    """
+    Cache `snapshot` unless a newer revision is already cached (equal is
+    rewritten: same state). Returns True if stored.
+    """
+    session_id = snapshot["session_id"]
+    key, version_key = state_cache_key(session_id), state_version_key(session_id)
+    revision = snapshot["version"]
+
+    set_if_newer = getattr(cache, "set_if_newer", None)
+    if set_if_newer is not None:
+        return set_if_newer(key, snapshot, version_key, revision, CACHE_TTL_SECONDS)
+
+    with _store_lock:
+        current = cache.get(version_key)
+        if current is not None and current > revision:
+            return False
+        cache.set_many({key: snapshot, version_key: revision}, CACHE_TTL_SECONDS)
+        return True
+
+
+def resolve_cards(deck_id: int, drawn_ids) -> list[dict]:
+    """
+    Ordered [{id, front_url, front_srcset}] for drawn ids (unknown ids are
+    skipped). Images come from the cached per-deck map; only cards missing
+    there (e.g. deactivated since the draw) are looked up in the DB.
+    """
+    if not drawn_ids:
+        return []
+
+    images = get_card_images(deck_id)
+    missing = [cid for cid in drawn_ids if str(cid) not in images]
+    if missing:
+        Card = apps.get_model("cards", "Card")
+        images = dict(images)
+        for c in Card.objects.filter(id__in=missing):
+            images[str(c.id)] = card_image(c)
+
+    return [{"id": str(cid), **images[str(cid)]} for cid in drawn_ids if str(cid) in images]
+
+
+def build_snapshot(session_id: str, base: dict, drawn_ids, revision: int | None = None) -> dict:
+    """
+    Snapshot for `drawn_ids` at `revision`, reusing deck/mode info from `base`
+    (an older snapshot), so no Session/Deck query is needed on draw/reset.
+    """
+    return {
+        "session_id": str(session_id),
+        "deck_id": base["deck_id"],
+        "mode": base["mode"],
+        "back_url": base["back_url"],
+        # back_* — для серверного рендера комнаты (клиент берёт картинки из манифеста)
+        "back_srcset": base.get("back_srcset", {}),
+        "cards": resolve_cards(base["deck_id"], drawn_ids),
+        "manifest_version": manifest_version(base["deck_id"]),
+        "version": revision,
+    }
+
+
+def record_draw(session_id: str, base: dict, drawn_ids, event_type: str = "draw") -> dict:
+    """
+    Persist a draw/reset: move the SessionState pointer (synchronously, it is
+    the source of truth); after commit, store the snapshot of the new
+    revision and queue the audit event (session/audit.py).
+    Returns the new snapshot.
+    """
+    SessionState = apps.get_model("session", "SessionState")
+
+    drawn_ids = [str(cid) for cid in drawn_ids]
+    # картинки резолвим до блокировки строки: под локом — только UPDATE
+    snapshot = build_snapshot(session_id, base, drawn_ids)
+    with transaction.atomic():
+        state, _ = SessionState.objects.select_for_update().get_or_create(session_id=session_id)
+        state.card_ids = drawn_ids
+        state.revision += 1
+        state.save(update_fields=["card_ids", "revision", "updated_at"])
+
+        snapshot["version"] = state.revision
+        transaction.on_commit(functools.partial(store_snapshot, snapshot))
+        transaction.on_commit(
+            functools.partial(
+                record, session_id, event_type, {"drawn_ids": drawn_ids, "revision": state.revision}
+            )
+        )
+    return snapshot
+
+
+def _last_drawn_ids_from_events(session) -> list[str]:
+    # сессии без SessionState (до backfill_session_state) — по-старому, из журнала
+    SessionEvent = apps.get_model("session", "SessionEvent")
+    last = (
+        SessionEvent.objects.filter(session=session, event_type="draw")
+        .order_by("-created_at")
+        .first()
+    )
+    if last is None:
+        return []
+    ids = [str(cid) for cid in last.drawn_cards.order_by("position").values_list("card_id", flat=True)]
+    # старые события, ещё не разобранные backfill_drawn_cards, — из payload
+    return ids or [str(cid) for cid in last.payload.get("drawn_ids", [])]
+
+
+def load_snapshot_from_db(session_id: str) -> dict | None:
+    Session = apps.get_model("session", "Session")
+    SessionState = apps.get_model("session", "SessionState")
+
+    # одна PK-выборка: Session + Deck + SessionState
+    session = Session.objects.select_related("deck", "state").filter(id=session_id).first()
+    if session is None:
+        return None
+
+    try:
+        drawn_ids, revision = session.state.card_ids, session.state.revision
+    except SessionState.DoesNotExist:
+        drawn_ids, revision = _last_drawn_ids_from_events(session), 0
+
+    base = {
+        "deck_id": session.deck_id,
+        "mode": session.mode,
+        "back_url": file_url(session.deck.back_full),
+        "back_srcset": srcsets(session.deck.back_variants),
+    }
+    snapshot = build_snapshot(str(session_id), base, drawn_ids, revision)
+    # параллельная раздача могла успеть положить более новую ревизию — тогда она и выиграет
+    store_snapshot(snapshot)
+    return snapshot
+
+
+def get_cached_snapshot(session_id: str) -> dict | None:
+    """
+    Cache-only read: the snapshot if present and not older than the current
+    version counter, else None (caller decides whether to go to the DB).
+    """
+    session_id = str(session_id)
+    key = state_cache_key(session_id)
+    version_key = state_version_key(session_id)
+
+    found = cache.get_many([key, version_key])
+    snapshot = found.get(key)
+    version = found.get(version_key)
+
+    if snapshot and version is not None and snapshot.get("version") == version:
+        return snapshot
+    return None
+
+
+def get_snapshot(session_id: str) -> dict | None:
+    """Cached snapshot with DB fallback. Returns None if the session does not exist."""
+    snapshot = get_cached_snapshot(session_id)
+    if snapshot is None:
+        snapshot = load_snapshot_from_db(str(session_id))
+    return snapshot
+
+
+def drawn_ids_of(snapshot: dict | None) -> list[str]:
+    return [c["id"] for c in (snapshot or {}).get("cards", [])]
+
+
+def _flips_for(snapshot: dict, flips: dict) -> dict:
+    return {cid: bool((flips or {}).get(cid, False)) for cid in drawn_ids_of(snapshot)}
+
+
+def state_payload(snapshot: dict, flips: dict, seq: int = 0) -> dict:
+    """
+    Client-facing full "state" message: drawn card ids + flips limited to them.
+    Images are looked up by id in the deck manifest of `manifest_version`.
+    """
+    return {
+        "type": "state",
+        "seq": seq,
+        "version": snapshot["version"],
+        "mode": snapshot["mode"],
+        "manifest_version": snapshot.get("manifest_version", ""),
+        "cards": drawn_ids_of(snapshot),
+        "flips": _flips_for(snapshot, flips),
+    }
+
+
+def draw_delta(snapshot: dict, flips: dict) -> dict:
+    """Delta after a draw: new card ids + pruned flips."""
+    return {
+        "type": "draw",
+        "version": snapshot["version"],
+        "manifest_version": snapshot.get("manifest_version", ""),
+        "cards": drawn_ids_of(snapshot),
+        "flips": _flips_for(snapshot, flips),
+    }
+
+
+def reset_delta(snapshot: dict) -> dict:
+    return {"type": "reset", "version": snapshot["version"]}
+
+
+def flip_delta(card_id: str, flipped: bool) -> dict:
+    return {"type": "flip", "card_id": card_id, "flipped": flipped}
+
+
+def flips_delta(flips: dict) -> dict:
+    """Coalesced batch of flips {card_id: flipped} (see session/coalesce.py)."""
+    return {"type": "flips", "flips": flips}
@@ -21,11 +21,30 @@
 //   let zoomLevel = 1;
 
   const scheme = window.location.protocol === "https:" ? "wss" : "ws";
-  const wsUrl = `${scheme}://${window.location.host}/ws/s/${sessionId}/`;
+  const wsBaseUrl = `${scheme}://${window.location.host}/ws/s/${sessionId}/`;
 
   let ws = null;
   let reconnectTimer = null;
 
+  // exponential backoff + full jitter: после рестарта воркера клиенты не ломятся все разом
+  const RECONNECT_BASE_MS = 500;
+  const RECONNECT_MAX_MS = 30000;
+  let reconnectAttempt = 0;
+
+  // сервер шлёт ping каждые ~25с; если тишина дольше — считаем сокет мёртвым
+  const SILENCE_TIMEOUT_MS = 70000;
+  let lastMessageAt = 0;
+  let watchdogTimer = null;
+
+  // последний применённый seq: при реконнекте сервер досылает только пропущенное
+  let lastSeq = null;
+  // ревизия раздачи (SessionState.revision): параллельные раздачи могут прийти не по порядку
+  let stateVersion = null;
+
+  function wsUrl() {
+    return lastSeq == null ? wsBaseUrl : `${wsBaseUrl}?last_seq=${lastSeq}`;
+  }
+
   function setWsStatus(text, ok) {
     if (!wsStatus) return;
     wsStatus.textContent = text;
@@ -40,6 +59,19 @@
     }
   }
 
+  // бинарный msgpack, если декодер подключён; сервер без поддержки ответит JSON
+  const msgpack = window.MetadeckMsgpack;
+  const subprotocols = msgpack ? ["metadeck.msgpack", "metadeck.json"] : ["metadeck.json"];
+
+  function decodeFrame(raw) {
+    if (typeof raw === "string") return safeJson(raw);
+    try {
+      return msgpack.decode(new Uint8Array(raw));
+    } catch {
+      return null;
+    }
+  }
+
   function send(payload) {
     if (!ws || ws.readyState !== WebSocket.OPEN) return;
     ws.send(JSON.stringify(payload));
@@ -49,33 +81,93 @@
     send({ action });
   }
 
+  function scheduleReconnect() {
+    const cap = Math.min(RECONNECT_MAX_MS, RECONNECT_BASE_MS * 2 ** reconnectAttempt);
+    const delay = Math.max(250, Math.random() * cap);
+    reconnectAttempt += 1;
+    reconnectTimer = setTimeout(connect, delay);
+  }
+
+  function watchdog() {
+    if (ws && ws.readyState === WebSocket.OPEN && Date.now() - lastMessageAt > SILENCE_TIMEOUT_MS) {
+      ws.close(); // onclose -> scheduleReconnect
+    }
+  }
+
   function connect() {
     if (reconnectTimer) clearTimeout(reconnectTimer);
     setWsStatus("WS: connecting...", false);
 
-    ws = new WebSocket(wsUrl);
+    ws = new WebSocket(wsUrl(), subprotocols);
+    ws.binaryType = "arraybuffer";
 
-    ws.onopen = () => setWsStatus("WS: connected", true);
+    ws.onopen = () => {
+      setWsStatus("WS: connected", true);
+      lastMessageAt = Date.now();
+      if (!watchdogTimer) watchdogTimer = setInterval(watchdog, 10000);
+    };
 
     ws.onclose = () => {
       setWsStatus("WS: disconnected", false);
-      reconnectTimer = setTimeout(connect, 700);
+      scheduleReconnect();
     };
 
     ws.onerror = () => setWsStatus("WS: error", false);
 
     ws.onmessage = (event) => {
-      const data = safeJson(event.data);
+      const data = decodeFrame(event.data);
       if (!data) return;
 
+      lastMessageAt = Date.now();
+      // backoff сбрасываем только когда сервер реально ответил (а не просто открыл сокет)
+      reconnectAttempt = 0;
+
+      if (data.type === "ping") {
+        send({ action: "pong" });
+        return;
+      }
+
       if (data.type === "state") {
-        renderCards(data.cards || [], data.flips || {});
-      } else if (data.type === "flip") {
-        applyFlip(data.card_id, data.flipped);
+        ensureManifest(data.manifest_version);
+        renderCards(cardIds(data.cards), data.flips || {});
+        lastSeq = data.seq ?? null;
+        stateVersion = data.version ?? null;
+        return;
+      }
+
+      if (data.seq == null) return;
+      if (lastSeq != null && data.seq <= lastSeq) return; // уже применено
+
+      if (lastSeq != null && data.seq > lastSeq + 1) {
+        // дыра в последовательности — просим досылку
+        send({ action: "resync", last_seq: lastSeq });
+        return;
       }
+
+      applyDelta(data);
+      lastSeq = data.seq;
     };
   }
 
+  function applyDelta(data) {
+    if (data.type === "draw" || data.type === "reset") {
+      // более старая ревизия, чем уже показанная, — её перекрыла закоммиченная позже раздача
+      if (data.version != null && stateVersion != null && data.version < stateVersion) return;
+      stateVersion = data.version ?? stateVersion;
+    }
+
+    if (data.type === "draw") {
+      ensureManifest(data.manifest_version);
+      renderCards(cardIds(data.cards), data.flips || {});
+    } else if (data.type === "reset") {
+      renderCards([], {});
+    } else if (data.type === "flip") {
+      applyFlip(data.card_id, data.flipped);
+    } else if (data.type === "flips") {
+      applyFlips(data.flips || {});
+    }
+  }
+
   function esc(s) {
     return String(s ?? "")
       .replaceAll("&", "&amp;")
@@ -84,10 +176,103 @@
       .replaceAll('"', "&quot;");
   }
 
-  function renderCards(cards, flips) {
+  // ширина карточки в сетке (room.css): браузер выбирает подходящий вариант из srcset
+  const CARD_SIZES = "(max-width: 820px) 50vw, (max-width: 1100px) 25vw, 17vw";
+  const MIME_TYPES = { avif: "image/avif", webp: "image/webp" };
+
+  // <picture>: AVIF/WebP-варианты по ширинам, исходный файл — fallback (и для zoom)
+  function pictureHtml(url, srcsets, alt) {
+    const sources = Object.entries(srcsets || {})
+      .filter(([fmt, srcset]) => MIME_TYPES[fmt] && srcset)
+      .map(
+        ([fmt, srcset]) =>
+          `<source type="${MIME_TYPES[fmt]}" srcset="${esc(srcset)}" sizes="${CARD_SIZES}">`
+      )
+      .join("");
+    return `<picture>${sources}<img src="${esc(url)}" alt="${esc(alt)}" decoding="async"></picture>`;
+  }
+
+  // -------------------------
+  // Deck manifest: id карты -> картинки (cards/manifest.py); сообщения несут только id
+  // -------------------------
+  const manifestUrl = window.__MANIFEST_URL__;
+  let manifest = null;
+  let manifestLoading = null;
+
+  // текущая раздача: перерисовываем её, когда манифест загрузился/обновился
+  let current = { ids: [], flips: {} };
+
+  function cardIds(cards) {
+    // дельты из журнала до перехода на id-only могут содержать объекты {id, front_url}
+    return (cards || []).map((c) => String(c && typeof c === "object" ? c.id : c));
+  }
+
+  function loadManifest() {
+    if (!manifestUrl) return Promise.resolve(null);
+    if (manifestLoading) return manifestLoading;
+
+    // no-cache: браузер шлёт If-None-Match, неизменившийся манифест приходит как 304
+    manifestLoading = fetch(manifestUrl, { cache: "no-cache", credentials: "same-origin" })
+      .then((r) => (r.ok ? r.json() : null))
+      .then((m) => {
+        if (m) {
+          manifest = m;
+          renderCards(current.ids, current.flips);
+          warmDeck();
+        }
+        return m;
+      })
+      .catch(() => null)
+      .finally(() => {
+        manifestLoading = null;
+      });
+    return manifestLoading;
+  }
+
+  function ensureManifest(version) {
+    if (!manifest || (version && version !== manifest.version)) loadManifest();
+  }
+
+  // -------------------------
+  // Prefetch: рубашка сразу, карты колоды — в idle, чтобы flip не показывал пустую грань
+  // -------------------------
+  const WARM_LIMIT = 120;
+  const WARM_BATCH = 4;
+  const warmed = new Set();
+  const warmHolders = [];
+
+  function warm(entry) {
+    if (!entry || !entry.url || warmed.has(entry.url)) return;
+    warmed.add(entry.url);
+    // вне DOM, но <picture> с тем же sizes: браузер качает тот же вариант, что потом покажет
+    const holder = document.createElement("div");
+    holder.innerHTML = pictureHtml(entry.url, entry.srcset, "");
+    warmHolders.push(holder);
+  }
+
+  function slowConnection() {
+    const c = navigator.connection;
+    return !!c && (c.saveData || /(^|-)2g$/.test(c.effectiveType || ""));
+  }
+
+  function warmDeck() {
+    warm(manifest.back);
+    if (slowConnection()) return;
+
+    const queue = Object.values(manifest.cards || {}).slice(0, WARM_LIMIT);
+    const idle = window.requestIdleCallback || ((fn) => setTimeout(fn, 200));
+    const step = () => {
+      queue.splice(0, WARM_BATCH).forEach(warm);
+      if (queue.length) idle(step);
+    };
+    idle(step);
+  }
+
+  function renderCards(ids, flips) {
+    current = { ids, flips: { ...flips } };
     if (!grid) return;
 
-    if (!cards.length) {
+    if (!ids.length) {
       grid.innerHTML = `
         <div class="panel empty wide">
           No cards yet. Click “Draw 1” or “Draw 6”.
@@ -96,9 +281,13 @@
       return;
     }
 
-    const html = cards
-      .map((c) => {
-        const cid = String(c.id);
+    const back = (manifest && manifest.back) || {};
+    // пока манифест грузится — пустые грани без подписи
+    const missing = manifest ? "No card image" : "";
+
+    const html = ids
+      .map((cid) => {
+        const front = (manifest && manifest.cards && manifest.cards[cid]) || {};
         const flipped = !!flips[cid];
 
         return `
@@ -108,29 +297,29 @@
             <div class="flip-card ${flipped ? "is-flipped" : ""}"
                  data-flip
                  data-card-id="${esc(cid)}"
-                 data-back="${esc(c.back_url)}"
-                 data-front="${esc(c.front_url)}">
+                 data-back="${esc(back.url)}"
+                 data-front="${esc(front.url)}">
 
               <div class="flip-face flip-front">
                 ${
-                  c.back_url
-                    ? `<img src="${esc(c.back_url)}" alt="back">`
-                    : `<div class="empty">No back image</div>`
+                  back.url
+                    ? pictureHtml(back.url, back.srcset, "back")
+                    : `<div class="empty">${manifest ? "No back image" : ""}</div>`
                 }
               </div>
 
               <div class="flip-face flip-back">
                 ${
-                  c.front_url
-                    ? `<img src="${esc(c.front_url)}" alt="card">`
-                    : `<div class="empty">No card image</div>`
+                  front.url
+                    ? pictureHtml(front.url, front.srcset, "card")
+                    : `<div class="empty">${missing}</div>`
                 }
               </div>
             </div>
 
             ${
               debug
-                ? `<div class="debug">back: ${esc(c.back_url)}<br>front: ${esc(c.front_url)}</div>`
+                ? `<div class="debug">back: ${esc(back.url)}<br>front: ${esc(front.url)}</div>`
                 : ``
             }
           </div>
@@ -144,6 +333,7 @@
   function applyFlip(cardId, flipped) {
     if (!grid || cardId == null) return;
     const selector = `.flip-card[data-card-id="${CSS.escape(String(cardId))}"]`;
+    current.flips[String(cardId)] = !!flipped;
     const el = grid.querySelector(selector);
     if (!el) return;
 
@@ -151,6 +341,17 @@
     else el.classList.remove("is-flipped");
   }
 
+  // пачка flips от сервера — один проход по DOM
+  function applyFlips(flips) {
+    Object.assign(current.flips, flips);
+    if (!grid) return;
+    grid.querySelectorAll(".flip-card[data-card-id]").forEach((el) => {
+      const flipped = flips[el.dataset.cardId];
+      if (flipped === undefined) return;
+      el.classList.toggle("is-flipped", !!flipped);
+    });
+  }
+
   // -------------------------
   // Zoom modal logic (ВАЖНО: zoom через реальную ширину картинки)
   // -------------------------
@@ -252,6 +453,7 @@ function zoomBy(delta) {
 
     if (nextFlipped) card.classList.add("is-flipped");
     else card.classList.remove("is-flipped");
+    current.flips[String(cardId)] = nextFlipped;
 
     send({
       action: "flip",
@@ -260,5 +462,13 @@ function zoomBy(delta) {
     });
   });
 
+  // опционально: service worker кэширует content-hashed медиа колоды (CARD_SERVICE_WORKER)
+  const swUrl = window.__SERVICE_WORKER_URL__;
+  if (swUrl && "serviceWorker" in navigator) {
+    navigator.serviceWorker.register(swUrl).catch(() => {});
+  }
+
+  // манифест (и prefetch) — сразу, не дожидаясь первого state по WS
+  loadManifest();
   connect();
 })();
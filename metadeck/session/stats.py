@@ -0,0 +1,275 @@
+# metadeck/session/stats.py
+"""
+Per-day draw/flip rollups per card, deck and mode.
+
+`update_rollups` folds new SessionEvent rows into CardDrawStats and
+DeckDrawStats, chunk by chunk, each chunk in one transaction together with
+the StatsCursor high-water mark, so every event is counted exactly once even
+if the job is interrupted. Run it periodically (update_draw_stats).
+
+Event ids are assigned at insert time but rows become visible at commit, so
+a run only goes up to the max id seen by the PREVIOUS run: anything below it
+has had a whole run interval to commit. A new cursor (fresh install) has no
+previous run: its first run, or a --rebuild, counts the whole log up to the
+current max(id) and starts the cursor there.
+
+`rebuild_rollups` recounts whole days from the event log, only up to the
+high-water mark (newer events are left to `update_rollups`) and only for
+days the log still fully holds: cleanup_sessions / partition_events drop old
+events, and their totals exist only in the rollups.
+
+Readers (admin Card/Deck pages) sum a bounded number of rollup rows and
+never touch the event log.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+
+CURSOR_NAME = "draw_stats"
+
+
+def _card_id(value) -> int | None:
+    return int(value) if str(value).isdigit() else None
+
+
+def _fold(events, drawn: dict, card_decks: dict) -> tuple[dict, dict]:
+    """
+    Aggregate events into {(card, day, mode): counts} and {(deck, day, mode): counts}.
+    `drawn` is {event_id: [card_id, ...]} from DrawnCard, `card_decks` maps flipped card ids.
+    """
+    cards = defaultdict(lambda: {"draws": 0, "flips": 0})
+    decks = defaultdict(lambda: {"draws": 0, "cards_drawn": 0, "flips": 0, "resets": 0})
+
+    for e in events:
+        day = timezone.localdate(e["created_at"])
+        mode = e["session__mode"]
+        deck_key = (e["session__deck_id"], day, mode)
+
+        if e["event_type"] == "draw":
+            ids = drawn.get(e["id"], [])
+            decks[deck_key]["draws"] += 1
+            decks[deck_key]["cards_drawn"] += len(ids)
+            for cid in ids:
+                cards[(cid, day, mode)]["draws"] += 1
+        elif e["event_type"] == "reset":
+            decks[deck_key]["resets"] += 1
+        elif e["event_type"] == "flip" and (e["payload"] or {}).get("flipped"):
+            # считаем открытия лицом вверх
+            decks[deck_key]["flips"] += 1
+            cid = _card_id(e["payload"].get("card_id"))
+            if cid in card_decks:
+                cards[(cid, day, mode)]["flips"] += 1
+    return cards, decks
+
+
+def _apply(model, key_fields: tuple, counters: dict, extra=None) -> None:
+    """Add counters to existing rows (read-modify-write under the cursor lock)."""
+    if not counters:
+        return
+
+    keys = list(counters)
+    first = key_fields[0]
+    existing = {
+        tuple(getattr(row, f) for f in key_fields): row
+        for row in model.objects.filter(
+            **{f"{first}__in": {k[0] for k in keys}},
+            day__in={k[1] for k in keys},
+            mode__in={k[2] for k in keys},
+        )
+    }
+
+    to_create, to_update = [], []
+    fields = list(next(iter(counters.values())))
+    for key, values in counters.items():
+        row = existing.get(key)
+        if row is None:
+            row = model(**dict(zip(key_fields, key)), **(extra(key) if extra else {}))
+            to_create.append(row)
+        else:
+            to_update.append(row)
+        for name, value in values.items():
+            setattr(row, name, getattr(row, name) + value)
+
+    model.objects.bulk_create(to_create)
+    model.objects.bulk_update(to_update, fields)
+
+
+def _count(events) -> None:
+    """Fold a chunk of events (dicts from `_event_values`) into the rollup tables."""
+    CardDrawStats = apps.get_model("session", "CardDrawStats")
+    DeckDrawStats = apps.get_model("session", "DeckDrawStats")
+    DrawnCard = apps.get_model("session", "DrawnCard")
+    Card = apps.get_model("cards", "Card")
+
+    # карты раздач — из DrawnCard (индекс), без разбора JSON
+    drawn = defaultdict(list)
+    card_decks = {}
+    for event_id, card_id, deck_id in (
+        DrawnCard.objects.filter(event_id__in=[e["id"] for e in events if e["event_type"] == "draw"])
+        .order_by("event_id", "position")
+        .values_list("event_id", "card_id", "card__deck_id")
+    ):
+        drawn[event_id].append(card_id)
+        card_decks[card_id] = deck_id
+
+    flipped = {
+        _card_id((e["payload"] or {}).get("card_id")) for e in events if e["event_type"] == "flip"
+    }
+    flipped -= set(card_decks) | {None}
+    if flipped:
+        card_decks.update(Card.objects.filter(id__in=flipped).values_list("id", "deck_id"))
+
+    cards, decks = _fold(events, drawn, card_decks)
+    _apply(CardDrawStats, ("card_id", "day", "mode"), cards, lambda k: {"deck_id": card_decks[k[0]]})
+    _apply(DeckDrawStats, ("deck_id", "day", "mode"), decks)
+
+
+def _event_values(qs, chunk_size: int) -> list[dict]:
+    return list(
+        qs.filter(event_type__in=["draw", "reset", "flip"])
+        .order_by("id")
+        .values("id", "event_type", "created_at", "payload", "session__deck_id", "session__mode")[:chunk_size]
+    )
+
+
+def _max_event_id() -> int:
+    SessionEvent = apps.get_model("session", "SessionEvent")
+    return SessionEvent.objects.aggregate(m=Max("id"))["m"] or 0
+
+
+def update_rollups(chunk_size: int = 5000, log=None) -> int:
+    """Fold committed events above the high-water mark into the rollups. Returns events counted."""
+    SessionEvent = apps.get_model("session", "SessionEvent")
+    StatsCursor = apps.get_model("session", "StatsCursor")
+
+    cursor, _ = StatsCursor.objects.get_or_create(name=CURSOR_NAME)
+    # новый курсор: прошлого прогона не было — считаем весь журнал до текущего max(id)
+    upper = cursor.next_event_id or _max_event_id()
+    counted = 0
+
+    while True:
+        with transaction.atomic():
+            cursor = StatsCursor.objects.select_for_update().get(name=CURSOR_NAME)
+            events = _event_values(
+                SessionEvent.objects.filter(id__gt=cursor.last_event_id, id__lte=upper), chunk_size
+            )
+            if not events:
+                # дошли до границы: следующий прогон пойдёт до сегодняшнего max(id)
+                cursor.last_event_id = max(cursor.last_event_id, upper)
+                cursor.next_event_id = _max_event_id()
+                cursor.save(update_fields=["last_event_id", "next_event_id", "updated_at"])
+                return counted
+
+            _count(events)
+            cursor.last_event_id = events[-1]["id"]
+            cursor.save(update_fields=["last_event_id", "updated_at"])
+
+        counted += len(events)
+        if log:
+            log(f"counted {counted} events (up to id {events[-1]['id']})")
+
+
+def first_complete_day() -> date | None:
+    """
+    First day whose events are all still in the log. The day of the oldest
+    retained event may have been cut by retention, so it is excluded.
+    """
+    SessionEvent = apps.get_model("session", "SessionEvent")
+    oldest = SessionEvent.objects.order_by("created_at").values_list("created_at", flat=True).first()
+    return timezone.localdate(oldest) + timedelta(days=1) if oldest else None
+
+
+def rebuild_rollups(chunk_size: int = 5000, since: date | None = None, log=None) -> int:
+    """
+    Recount the rollups of days >= `since` (default: first complete day) from
+    events up to the high-water mark; older days keep their totals. With a
+    new cursor there are no older totals: every retained event up to the
+    current max(id) is counted (from `since` if given) and the cursor starts
+    there. One transaction: an interrupted rebuild leaves the old rollups
+    untouched. Raises ValueError if events of `since` were already cleaned up.
+    """
+    SessionEvent = apps.get_model("session", "SessionEvent")
+    StatsCursor = apps.get_model("session", "StatsCursor")
+    CardDrawStats = apps.get_model("session", "CardDrawStats")
+    DeckDrawStats = apps.get_model("session", "DeckDrawStats")
+
+    complete = first_complete_day()
+    if complete is None:
+        return 0
+
+    counted = 0
+    with transaction.atomic():
+        # под локом курсора update_rollups не вклинится между удалением и пересчётом
+        cursor, _ = StatsCursor.objects.select_for_update().get_or_create(name=CURSOR_NAME)
+        fresh = not cursor.last_event_id
+        upper = cursor.last_event_id or _max_event_id()
+        if not fresh:
+            since = since or complete
+            if since < complete:
+                raise ValueError(
+                    f"Events before {complete} were cleaned up: rebuilding from {since} would lose their totals."
+                )
+
+        # события выше high-water mark ещё не учтены — их досчитает update_rollups
+        qs = SessionEvent.objects.filter(id__lte=upper)
+        if since:
+            qs = qs.filter(created_at__gte=timezone.make_aware(datetime.combine(since, time.min)))
+            CardDrawStats.objects.filter(day__gte=since).delete()
+            DeckDrawStats.objects.filter(day__gte=since).delete()
+        else:
+            CardDrawStats.objects.all().delete()
+            DeckDrawStats.objects.all().delete()
+
+        last_id = 0
+        while True:
+            events = _event_values(qs.filter(id__gt=last_id), chunk_size)
+            if not events:
+                break
+            _count(events)
+            last_id = events[-1]["id"]
+            counted += len(events)
+            if log:
+                log(f"recounted {counted} events (up to id {last_id})")
+
+        if fresh:
+            cursor.last_event_id = cursor.next_event_id = upper
+            cursor.save(update_fields=["last_event_id", "next_event_id", "updated_at"])
+    return counted
+
+
+# ---------- readers (admin) ----------
+def _summary(qs, fields: list[str], days: int) -> dict:
+    since = timezone.localdate() - timedelta(days=days - 1)
+    sums = {f: Sum(f) for f in fields}
+    return {
+        "total": qs.aggregate(**sums),
+        "recent": qs.filter(day__gte=since).aggregate(**sums),
+        "by_mode": list(qs.values("mode").annotate(**sums).order_by("mode")),
+    }
+
+
+def card_summary(card_id: int, days: int = 30) -> dict:
+    CardDrawStats = apps.get_model("session", "CardDrawStats")
+    return _summary(CardDrawStats.objects.filter(card_id=card_id), ["draws", "flips"], days)
+
+
+def deck_summary(deck_id: int, days: int = 30) -> dict:
+    DeckDrawStats = apps.get_model("session", "DeckDrawStats")
+    return _summary(
+        DeckDrawStats.objects.filter(deck_id=deck_id), ["draws", "cards_drawn", "flips", "resets"], days
+    )
+
+
+def deck_top_cards(deck_id: int, top: int = 10) -> list[dict]:
+    CardDrawStats = apps.get_model("session", "CardDrawStats")
+    return list(
+        CardDrawStats.objects.filter(deck_id=deck_id)
+        .values("card_id", "card__title")
+        .annotate(draws=Sum("draws"), flips=Sum("flips"))
+        .order_by("-draws")[:top]
+    )
@@ -1,3 +1,531 @@
-from django.test import TestCase
+# metadeck/session/tests.py
+import asyncio
+import json
+import shutil
+import subprocess
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from cards.models import Card, Deck
+from cards.sampler import bump_deck_version, get_card_pool, sample_cards
+from metadeck.channel_layers import HashRingChannelLayer
+from session import audit, consumers, flips, journal, repository, throttle
+from session.codecs import CBOR, CODECS, JSON, MSGPACK, encode_all, negotiate
+from session.journal import LocalJournal, _missed
+from session.management.commands.bench_codecs import js_fixtures, sample_messages
+from session.models import DeckDrawStats, DrawnCard, Session, SessionEvent, SessionState, StatsCursor
+from session.routing import websocket_urlpatterns
+from session.stats import rebuild_rollups, update_rollups
+from session.throttle import ActionThrottle, TokenBucket
+
+
+JSTESTS_DIR = Path(__file__).resolve().parent / "jstests"
+
+# всё горячее состояние — в процессе: тестам не нужен Redis
+LOCAL_STORES = dict(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    SESSION_STORE_BACKEND="local",
+    SESSION_AUDIT_BACKEND="sync",
+    SESSION_DB_WORKERS=0,
+    SESSION_FLIP_COALESCE_MS=0,
+)
+
+
+def reset_stores() -> None:
+    # синглтоны под lru_cache созданы по настройкам прошлого теста
+    for factory in (
+        journal.get_journal,
+        flips.get_flip_store,
+        throttle.get_throttle_store,
+        audit.get_audit_writer,
+        repository.get_db_executor,
+        consumers.get_flip_coalescer,
+        consumers.get_connect_semaphore,
+    ):
+        factory.cache_clear()
+    cache.clear()
+
+
+def make_deck(cards: int = 6, title: str = "Test deck") -> Deck:
+    deck = Deck.objects.create(title=title)
+    Card.objects.bulk_create(
+        Card(deck=deck, title=f"card {i}", code=f"card-{i}", position=i) for i in range(1, cards + 1)
+    )
+    return deck
+
+
+class CodecTests(SimpleTestCase):
+    def test_round_trip(self):
+        for codec in CODECS.values():
+            for name, message in sample_messages().items():
+                with self.subTest(codec=codec.name, message=name):
+                    frame = codec.encode(message)
+                    self.assertIsInstance(frame, bytes if codec.binary else str)
+                    self.assertEqual(codec.decode(frame), message)
+
+    def test_encode_all_has_a_frame_per_codec(self):
+        message = sample_messages()["flip"]
+        frames = encode_all(message)
+        self.assertEqual(set(frames), set(CODECS))
+        for name, frame in frames.items():
+            self.assertEqual(CODECS[name].decode(frame), message)
+
+    def test_decode_rejects_garbage(self):
+        with self.assertRaises(ValueError):
+            JSON.decode("{not json")
+
+    def test_negotiate_offers_only_codecs_with_a_client_decoder(self):
+        self.assertEqual(negotiate(["metadeck.cbor", "metadeck.msgpack"]), (MSGPACK, "metadeck.msgpack"))
+        self.assertEqual(negotiate(["metadeck.cbor"]), (JSON, None))
+        self.assertEqual(negotiate(None), (JSON, None))
+        self.assertNotIn(CBOR.name, encode_all({"type": "ping"}))
+
+    def test_js_fixtures_match_server_codec(self):
+        # фикстуры JS-тестов должны быть сгенерированы текущим кодеком
+        with open(JSTESTS_DIR / "msgpack_fixtures.json", encoding="utf-8") as f:
+            self.assertEqual(json.load(f), js_fixtures())
+
+    @skipUnless(shutil.which("node"), "node is not installed")
+    def test_js_decoder(self):
+        result = subprocess.run(
+            ["node", "--test", str(JSTESTS_DIR)], capture_output=True, text=True, timeout=60
+        )
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+
+
+class JournalTests(SimpleTestCase):
+    def setUp(self):
+        self.journal = LocalJournal(size=3)
+        for i in range(5):
+            self.journal.append("s", {"type": "flip", "n": i})
+
+    def seqs(self, last_seq):
+        missed = self.journal.since("s", last_seq)
+        return None if missed is None else [m["seq"] for m in missed]
+
+    def test_up_to_date(self):
+        self.assertEqual(self.journal.current_seq("s"), 5)
+        self.assertEqual(self.seqs(5), [])
+
+    def test_missed_deltas_inside_the_buffer(self):
+        self.assertEqual(self.seqs(4), [5])
+        # буфер держит 3..5: last_seq=2 — ровно на границе, ещё догоняется дельтами
+        self.assertEqual(self.seqs(2), [3, 4, 5])
+
+    def test_fell_out_of_the_buffer(self):
+        self.assertIsNone(self.seqs(1))
+        self.assertIsNone(self.seqs(0))
+
+    def test_client_ahead_of_the_counter(self):
+        # счётчик сброшен (TTL/flush), клиент из прошлой "эпохи" — нужен полный state
+        self.assertIsNone(self.seqs(6))
+
+    def test_new_session(self):
+        self.assertEqual(self.journal.since("other", 0), [])
+        self.assertEqual(self.journal.current_seq("other"), 0)
+
+    def test_missed(self):
+        events = [{"seq": 3}, {"seq": 4}]
+        self.assertEqual(_missed(events, 4, 2), events)
+        self.assertIsNone(_missed(events, 4, 1))
+        self.assertIsNone(_missed([], 4, 2))
+        self.assertEqual(_missed([], 4, 4), [])
+
+
+@override_settings(**LOCAL_STORES)
+class ThrottleTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("session.throttle.time.monotonic", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        reset_stores()
+        self.addCleanup(reset_stores)
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=2, burst=2)
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        self.assertAlmostEqual(bucket.take(), 0.5)
+        self.now += 0.5
+        self.assertEqual(bucket.take(), 0)
+        # запас не копится выше burst
+        self.now += 60
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        self.assertGreater(bucket.take(), 0)
+
+    @override_settings(SESSION_RATE_LIMITS={"draw": {"connection": (1, 2), "session": (1, 3)}})
+    async def test_connection_and_session_buckets(self):
+        first, second = ActionThrottle("s1"), ActionThrottle("s1")
+        # draw_one / draw_three делят одно ведро соединения
+        self.assertEqual(await first.take("draw_one"), 0)
+        self.assertEqual(await first.take("draw_three"), 0)
+        self.assertGreater(await first.take("draw_six"), 0)
+        # второе соединение той же комнаты упирается в общее ведро сессии (3 на комнату)
+        self.assertEqual(await second.take("draw_one"), 0)
+        self.assertGreater(await second.take("draw_one"), 0)
+        # другая комната — свой лимит
+        self.assertEqual(await ActionThrottle("s2").take("draw_one"), 0)
+
+        self.assertEqual(
+            throttle.get_throttle_store().stats(),
+            {"throttle.connection.draw": 1, "throttle.session.draw": 1},
+        )
+
+    @override_settings(SESSION_RATE_LIMITS={"draw": {"connection": (1, 1)}})
+    async def test_unlimited_actions(self):
+        limiter = ActionThrottle("s1")
+        for _ in range(10):
+            self.assertEqual(await limiter.take("flip"), 0)
+            self.assertEqual(await limiter.take(None), 0)
+
+
+class ChannelLayerTests(SimpleTestCase):
+    groups = [f"session_{i}" for i in range(2000)]
+
+    def placement(self, hosts) -> dict:
+        layer = HashRingChannelLayer(hosts=hosts)
+        return {group: layer.hosts[layer.consistent_hash(group)]["host"] for group in self.groups}
+
+    def test_adding_a_host_moves_only_its_share(self):
+        before = self.placement([("redis1", 6379), ("redis2", 6379), ("redis3", 6379)])
+        after = self.placement([("redis1", 6379), ("redis2", 6379), ("redis3", 6379), ("redis4", 6379)])
+        moved = [group for group in self.groups if before[group] != after[group]]
+        # переезжают только группы нового хоста: ~1/4, а не большинство
+        self.assertTrue(all(after[group] == "redis4" for group in moved))
+        self.assertLess(len(moved), len(self.groups) * 0.35)
+        self.assertGreater(min(list(after.values()).count(h) for h in set(after.values())), len(self.groups) * 0.15)
+
+    def test_placement_does_not_depend_on_host_order(self):
+        hosts = [("redis1", 6379), ("redis2", 6379)]
+        self.assertEqual(self.placement(hosts), self.placement(hosts[::-1]))
+
+
+@override_settings(**LOCAL_STORES)
+class ConsumerTests(TransactionTestCase):
+    def setUp(self):
+        reset_stores()
+        self.addCleanup(reset_stores)
+        self.deck = make_deck()
+        self.session = Session.objects.create(deck=self.deck, mode="pick_one_of_six")
+        self.application = URLRouter(websocket_urlpatterns)
+
+    def communicator(self, query: str = "", subprotocols=None) -> WebsocketCommunicator:
+        return WebsocketCommunicator(
+            self.application, f"/ws/s/{self.session.id}/{query}", subprotocols=subprotocols
+        )
+
+    async def connect(self, query: str = "", subprotocols=None):
+        ws = self.communicator(query, subprotocols)
+        connected, _ = await ws.connect()
+        self.assertTrue(connected)
+        return ws
+
+    async def test_connect_sends_state(self):
+        ws = await self.connect()
+        state = await ws.receive_json_from()
+        self.assertEqual(state["type"], "state")
+        self.assertEqual((state["seq"], state["cards"], state["flips"]), (0, [], {}))
+        await ws.disconnect()
+
+    async def test_msgpack_subprotocol(self):
+        ws = await self.connect(subprotocols=["metadeck.msgpack"])
+        self.assertEqual(ws.scope["subprotocols"], ["metadeck.msgpack"])
+        frame = await ws.receive_from()
+        self.assertIsInstance(frame, bytes)
+        self.assertEqual(MSGPACK.decode(frame)["type"], "state")
+        await ws.disconnect()
+
+    async def test_unknown_session_is_closed(self):
+        ws = WebsocketCommunicator(self.application, "/ws/s/00000000-0000-0000-0000-000000000000/")
+        await ws.connect()
+        self.assertEqual((await ws.receive_output())["type"], "websocket.close")
+
+    async def test_draw_flip_and_resume(self):
+        ws = await self.connect()
+        await ws.receive_json_from()
+
+        await ws.send_json_to({"action": "draw_three"})
+        draw = await ws.receive_json_from()
+        self.assertEqual((draw["type"], draw["seq"], draw["version"]), ("draw", 1, 1))
+        self.assertEqual(len(draw["cards"]), 3)
+        card_id = draw["cards"][0]
+
+        # карту не со стола перевернуть нельзя: рассылки нет
+        await ws.send_json_to({"action": "flip", "card_id": "999999", "flipped": True})
+        await ws.send_json_to({"action": "flip", "card_id": card_id, "flipped": True})
+        flip = await ws.receive_json_from()
+        self.assertEqual(flip, {"type": "flip", "card_id": card_id, "flipped": True, "seq": 2})
+        await ws.disconnect()
+
+        # переподключение с last_seq: только пропущенные дельты
+        ws = await self.connect("?last_seq=1")
+        self.assertEqual(await ws.receive_json_from(), flip)
+        self.assertTrue(await ws.receive_nothing())
+        await ws.disconnect()
+
+        # без last_seq — полный state с флипами
+        ws = await self.connect()
+        state = await ws.receive_json_from()
+        self.assertEqual((state["seq"], state["cards"]), (2, draw["cards"]))
+        self.assertEqual(state["flips"][card_id], True)
+        await ws.disconnect()
+
+        flip_event = await SessionEvent.objects.aget(session=self.session, event_type="flip")
+        self.assertEqual(flip_event.payload, {"card_id": card_id, "flipped": True})
+
+    @override_settings(SESSION_RATE_LIMITS={"flip": {"session": (100, 100)}})
+    async def test_stores_are_not_called_on_the_event_loop(self):
+        on_loop = []
+
+        def spy(cls, name):
+            method = getattr(cls, name)
+
+            def call(*args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                    on_loop.append(f"{cls.__name__}.{name}")
+                except RuntimeError:
+                    pass
+                return method(*args, **kwargs)
+
+            patcher = mock.patch.object(cls, name, call)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        for name in ("append", "since", "current_seq"):
+            spy(LocalJournal, name)
+        for name in ("get", "set", "replace", "clear"):
+            spy(flips.LocalFlipStore, name)
+        spy(throttle.LocalThrottleStore, "take")
+
+        ws = await self.connect()
+        await ws.receive_json_from()
+        await ws.send_json_to({"action": "draw_one"})
+        card_id = (await ws.receive_json_from())["cards"][0]
+        await ws.send_json_to({"action": "flip", "card_id": card_id, "flipped": True})
+        await ws.receive_json_from()
+        await ws.send_json_to({"action": "reset"})
+        await ws.receive_json_from()
+        await ws.send_json_to({"action": "resync", "last_seq": 0})
+        self.assertEqual(len([await ws.receive_json_from() for _ in range(3)]), 3)
+        await ws.disconnect()
+        self.assertEqual(on_loop, [])
+
+    async def test_draw_is_recorded(self):
+        ws = await self.connect()
+        await ws.receive_json_from()
+        await ws.send_json_to({"action": "draw_one"})
+        draw = await ws.receive_json_from()
+        await ws.disconnect()
+
+        state = await SessionState.objects.aget(session=self.session)
+        self.assertEqual((state.card_ids, state.revision), (draw["cards"], 1))
+        event = await SessionEvent.objects.aget(session=self.session, event_type="draw")
+        # карты раздачи — только в DrawnCard
+        self.assertNotIn("drawn_ids", event.payload)
+        drawn = [str(cid) async for cid in event.drawn_cards.order_by("position").values_list("card_id", flat=True)]
+        self.assertEqual(drawn, draw["cards"])
+
+    @override_settings(SESSION_RATE_LIMITS={"draw": {"connection": (1, 1)}})
+    async def test_throttled(self):
+        ws = await self.connect()
+        await ws.receive_json_from()
+        await ws.send_json_to({"action": "draw_one"})
+        await ws.receive_json_from()
+        await ws.send_json_to({"action": "draw_one"})
+        reply = await ws.receive_json_from()
+        self.assertEqual((reply["type"], reply["action"]), ("throttled", "draw_one"))
+        await ws.disconnect()
+
+
+class DrawStatsTests(TestCase):
+    def setUp(self):
+        self.deck = make_deck()
+        session = Session.objects.create(deck=self.deck, mode="pick_one_of_six")
+        cards = list(Card.objects.filter(deck=self.deck))
+        for i in range(3):
+            event = SessionEvent.objects.create(session=session, event_type="draw", payload={})
+            DrawnCard.objects.bulk_create(DrawnCard(event=event, card=c, position=p) for p, c in enumerate(cards[:2]))
+        self.max_id = SessionEvent.objects.order_by("-id").values_list("id", flat=True).first()
+
+    def totals(self) -> tuple:
+        row = DeckDrawStats.objects.get(deck=self.deck)
+        return row.draws, row.cards_drawn
+
+    def test_first_run_on_a_fresh_install_counts_everything(self):
+        self.assertEqual(update_rollups(), 3)
+        self.assertEqual(self.totals(), (3, 6))
+        self.assertEqual(StatsCursor.objects.get().last_event_id, self.max_id)
+        # ничего не посчитано дважды
+        self.assertEqual(update_rollups(), 0)
+        self.assertEqual(self.totals(), (3, 6))
+
+    def test_rebuild_on_a_fresh_install_counts_everything(self):
+        # свежая установка: старейший день не отрезается, курсор встаёт на max(id)
+        self.assertEqual(rebuild_rollups(), 3)
+        self.assertEqual(self.totals(), (3, 6))
+        cursor = StatsCursor.objects.get()
+        self.assertEqual((cursor.last_event_id, cursor.next_event_id), (self.max_id, self.max_id))
+        self.assertEqual(update_rollups(), 0)
+        self.assertEqual(self.totals(), (3, 6))
+
+
+@override_settings(**LOCAL_STORES)
+class SamplerCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_pool_follows_card_changes(self):
+        deck = make_deck(cards=3)
+        ids = set(Card.objects.filter(deck=deck).values_list("id", flat=True))
+        self.assertEqual(set(get_card_pool(deck.id)), ids)
+
+        card = Card.objects.filter(deck=deck).first()
+        card.is_active = False
+        with self.captureOnCommitCallbacks() as callbacks:
+            card.save()
+            # до коммита версия старая: пул из незакоммиченных строк под новой версией не закэшируется
+            self.assertEqual(set(get_card_pool(deck.id)), ids)
+        for callback in callbacks:
+            callback()  # post_save поднимает версию колоды после коммита
+        self.assertEqual(set(get_card_pool(deck.id)), ids - {card.id})
+
+        # update() без сигналов: версию поднимает вызывающий
+        Card.objects.filter(deck=deck).update(is_active=True)
+        self.assertEqual(set(get_card_pool(deck.id)), ids - {card.id})
+        bump_deck_version(deck.id)
+        self.assertEqual(set(get_card_pool(deck.id)), ids)
+
+        self.assertEqual(len(set(sample_cards(deck.id, 2))), 2)
+        self.assertEqual(len(sample_cards(deck.id, 10)), 3)
+
+
+@override_settings(**LOCAL_STORES)
+class CleanupSessionsTests(TestCase):
+    def setUp(self):
+        self.deck = make_deck(cards=2)
+        self.cards = list(Card.objects.filter(deck=self.deck))
+        old = timezone.now() - timedelta(days=10)
+
+        self.old_sessions = [self.session_with_draw(old) for _ in range(5)]
+        self.recent = self.session_with_draw(timezone.now())
+        # старое событие недавней сессии удаляется, сама сессия остаётся
+        self.stale_event = SessionEvent.objects.create(session=self.recent, event_type="join", created_at=old)
+
+    def session_with_draw(self, created_at) -> Session:
+        session = Session.objects.create(deck=self.deck, mode="random_one")
+        Session.objects.filter(pk=session.pk).update(created_at=created_at)
+        event = SessionEvent.objects.create(session=session, event_type="draw", created_at=created_at)
+        event.cards.set(self.cards)
+        DrawnCard.objects.bulk_create(DrawnCard(event=event, card=c, position=i) for i, c in enumerate(self.cards))
+        SessionState.objects.create(session=session, card_ids=[str(c.id) for c in self.cards], revision=1)
+        return session
+
+    def test_dry_run(self):
+        out = StringIO()
+        call_command("cleanup_sessions", dry_run=True, stdout=out)
+        self.assertIn("sessions: 5 | events: 6", out.getvalue())
+        self.assertEqual(Session.objects.count(), 6)
+
+    def test_batches(self):
+        out = StringIO()
+        call_command("cleanup_sessions", batch_size=2, sleep=0, stdout=out)
+        output = out.getvalue()
+
+        # 5 сессий по 2 за батч — 3 батча; затем 1 событие недавней сессии
+        self.assertIn("sessions batch 3: drawn_cards=2, event_cards=2, events=1, states=1, sessions=1", output)
+        self.assertNotIn("sessions batch 4", output)
+        self.assertIn("events batch 1: drawn_cards=0, event_cards=0, events=1", output)
+
+        self.assertEqual(list(Session.objects.all()), [self.recent])
+        self.assertFalse(SessionEvent.objects.filter(pk=self.stale_event.pk).exists())
+        self.assertEqual(SessionEvent.objects.count(), 1)
+        self.assertEqual(DrawnCard.objects.count(), 2)
+        self.assertEqual(SessionEvent.cards.through.objects.count(), 2)
+        self.assertEqual(list(SessionState.objects.values_list("session_id", flat=True)), [self.recent.id])
+
+        # повторный прогон ничего не находит
+        call_command("cleanup_sessions", batch_size=2, sleep=0, stdout=StringIO())
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_long_session_is_deleted_in_event_chunks_without_loading_rows(self):
+        long_session = self.old_sessions[0]
+        SessionEvent.objects.bulk_create(
+            SessionEvent(session=long_session, event_type="flip", created_at=long_session.created_at)
+            for _ in range(7)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            call_command("cleanup_sessions", batch_size=2, sleep=0, stdout=StringIO())
+
+        self.assertEqual(list(Session.objects.all()), [self.recent])
+        self.assertEqual(SessionEvent.objects.count(), 1)
+        # set-based DELETE: строки событий (с JSON payload) в Python не читаются
+        self.assertFalse([q for q in queries if "payload" in q["sql"]])
+        # у каждого DELETE событий — подзапрос с LIMIT batch_size, а не список всех id
+        event_deletes = [q["sql"] for q in queries if q["sql"].startswith('DELETE FROM "session_sessionevent"')]
+        self.assertTrue(event_deletes)
+        self.assertTrue(all("LIMIT 2" in sql for sql in event_deletes if "session_id" in sql))
+
+
+@override_settings(**LOCAL_STORES)
+class SessionEventAdminTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(user)
+        self.deck = make_deck(cards=6)
+        self.cards = list(Card.objects.filter(deck=self.deck))
+
+    def add_events(self, n: int) -> None:
+        for _ in range(n):
+            session = Session.objects.create(deck=self.deck, mode="random_one")
+            event = SessionEvent.objects.create(session=session, event_type="draw", chosen_card=self.cards[0])
+            DrawnCard.objects.bulk_create(DrawnCard(event=event, card=c, position=i) for i, c in enumerate(self.cards))
+
+    def assertQueriesDoNotGrow(self, url: str, add) -> None:
+        self.client.get(url)  # первый запрос после логина пишет сессию
+        with CaptureQueriesContext(connection) as baseline:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        add()
+        with self.assertNumQueries(len(baseline)):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_changelist(self):
+        self.add_events(2)
+        self.assertQueriesDoNotGrow(reverse("admin:session_sessionevent_changelist"), lambda: self.add_events(20))
+
+    def test_change_page_with_drawn_cards(self):
+        self.add_events(1)
+        event = SessionEvent.objects.get()
+        url = reverse("admin:session_sessionevent_change", args=[event.pk])
+
+        def more_cards():
+            cards = [Card(deck=self.deck, title=f"extra {i}", position=100 + i) for i in range(10)]
+            Card.objects.bulk_create(cards)
+            DrawnCard.objects.bulk_create(
+                DrawnCard(event=event, card=c, position=len(self.cards) + i) for i, c in enumerate(cards)
+            )
+
+        self.assertQueriesDoNotGrow(url, more_cards)
+
+    def test_search_by_exact_card_code(self):
+        self.add_events(1)
+        url = reverse("admin:session_sessionevent_changelist")
+        self.assertContains(self.client.get(url, {"q": "card-2"}), "1 result")
+        # только точный код: по части кода не ищется
+        self.assertContains(self.client.get(url, {"q": "card"}), "0 results")
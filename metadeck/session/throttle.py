@@ -0,0 +1,184 @@
+# metadeck/session/throttle.py
+"""
+Token-bucket rate limiting for SessionConsumer actions.
+
+Two layers, both configured in SESSION_RATE_LIMITS:
+- per connection: TokenBucket kept in the consumer instance (in memory);
+- per session: a shared bucket (Redis hash updated by one Lua call, or an
+  in-process stand-in with SESSION_STORE_BACKEND = "local").
+
+`await take()` returns 0 when the action is allowed, otherwise seconds
+until a token is available. The connection bucket is checked on the event
+loop; the shared bucket (and the shared refusal counter) are Redis round
+trips, so they run as one session/repository.py `db_task` hop. Every
+refusal is counted (process metrics + shared hash, see `throttle_stats`
+command).
+"""
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+
+from metadeck import metrics
+from .repository import db_task
+
+
+# draw_one / draw_three / draw_six делят один лимит
+ACTION_KINDS = {
+    "draw_one": "draw",
+    "draw_three": "draw",
+    "draw_six": "draw",
+    "reset": "reset",
+    "flip": "flip",
+    "resync": "resync",
+}
+
+
+def bucket_cache_key(session_id: str, kind: str) -> str:
+    return f"metadeck:session:{session_id}:bucket:{kind}"
+
+
+STATS_KEY = "metadeck:throttle:fired"
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+# Тот же алгоритм, что TokenBucket.take, но атомарно в Redis (время — redis TIME)
+TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(b[1]) or burst
+local ts = tonumber(b[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local retry = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  retry = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(retry)
+"""
+
+
+class RedisThrottleStore:
+    def __init__(self, client):
+        self.client = client
+        self._take = client.register_script(TAKE_SCRIPT)
+
+    def take(self, session_id: str, kind: str, rate: float, burst: int) -> float:
+        return float(self._take(keys=[bucket_cache_key(session_id, kind)], args=[rate, burst]))
+
+    def record(self, name: str) -> None:
+        self.client.hincrby(STATS_KEY, name, 1)
+
+    def stats(self) -> dict:
+        return {k.decode(): int(v) for k, v in self.client.hgetall(STATS_KEY).items()}
+
+    def reset_stats(self) -> None:
+        self.client.delete(STATS_KEY)
+
+
+class LocalThrottleStore:
+    def __init__(self):
+        self._buckets: dict[str, TokenBucket] = {}
+        self._stats: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def take(self, session_id: str, kind: str, rate: float, burst: int) -> float:
+        with self._lock:
+            key = bucket_cache_key(session_id, kind)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate, burst)
+            return bucket.take()
+
+    def record(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] = self._stats.get(name, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+@lru_cache(maxsize=None)
+def get_throttle_store():
+    if settings.SESSION_STORE_BACKEND == "local":
+        return LocalThrottleStore()
+
+    from metadeck.redis_client import get_redis
+
+    return RedisThrottleStore(get_redis())
+
+
+@db_task
+def take_shared(session_id: str, kind: str, rate: float, burst: int) -> float:
+    store = get_throttle_store()
+    retry_after = store.take(session_id, kind, rate, burst)
+    if retry_after:
+        store.record(f"throttle.session.{kind}")
+    return retry_after
+
+
+@db_task
+def record_shared(name: str) -> None:
+    get_throttle_store().record(name)
+
+
+class ActionThrottle:
+    """Per-connection limiter; also consults the shared per-session bucket."""
+
+    def __init__(self, session_id: str):
+        self.session_id = str(session_id)
+        self.buckets: dict[str, TokenBucket] = {}
+
+    async def take(self, action: str) -> float:
+        kind = ACTION_KINDS.get(action)
+        limits = settings.SESSION_RATE_LIMITS.get(kind) if kind else None
+        if not limits:
+            return 0.0
+
+        per_connection = limits.get("connection")
+        if per_connection:
+            bucket = self.buckets.get(kind)
+            if bucket is None:
+                bucket = self.buckets[kind] = TokenBucket(*per_connection)
+            retry_after = bucket.take()
+            if retry_after:
+                metrics.incr(f"throttle.connection.{kind}")
+                await record_shared(f"throttle.connection.{kind}")
+                return retry_after
+
+        per_session = limits.get("session")
+        if per_session:
+            retry_after = await take_shared(self.session_id, kind, *per_session)
+            if retry_after:
+                metrics.incr(f"throttle.session.{kind}")
+                return retry_after
+
+        return 0.0
@@ -1,11 +1,17 @@
 # metadeck/session/views.py
-import random
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.http import require_POST
-from .models import SessionEventType
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.http import require_GET, require_POST
 
-from cards.models import Deck, Card
+from cards.models import Deck
+from cards.sampler import sample_cards
+from .export import FORMATS, KINDS, aiter_sync, export_rows, parse_filters, serialize
 from .models import Session
+from .state import get_snapshot
 
 
 @require_POST
@@ -52,17 +58,18 @@ def room(request, session_id):
     k = request.GET.get("k")
     is_client = (k == session.client_key)
 
-    last = session.events.filter(event_type=SessionEventType.DRAW).order_by("-created_at").first()
-    drawn_ids = (last.payload.get("drawn_ids", []) if last else [])
-
-    cards = Card.objects.filter(id__in=drawn_ids)
-    cards_map = {str(c.id): c for c in cards}
-    drawn_cards = [cards_map.get(cid) for cid in drawn_ids if cid in cards_map]
+    # карты берём из кэшированного snapshot (DB только при промахе кэша)
+    snapshot = get_snapshot(str(session.id)) or {}
 
     return render(request, "session/room.html", {
         "session": session,
         "is_client": is_client,
-        "drawn_cards": drawn_cards,
+        "drawn_cards": snapshot.get("cards", []),
+        "back_url": snapshot.get("back_url", ""),
+        "back_srcset": snapshot.get("back_srcset", {}),
+        # room.js берёт картинки из манифеста колоды, сообщения несут только id карт
+        "manifest_url": reverse("cards:deck_manifest", args=[session.deck_id]),
+        "service_worker_url": reverse("cards:service_worker") if settings.CARD_SERVICE_WORKER else "",
         "client_link": request.build_absolute_uri(f"/s/{session.id}/?k={session.client_key}"),
         "host_link": request.build_absolute_uri(f"/s/{session.id}/"),
     })
@@ -72,12 +79,8 @@ def room(request, session_id):
 def draw_one(request, session_id):
     session = get_object_or_404(Session, id=session_id)
 
-    card = (
-        Card.objects.filter(deck=session.deck, is_active=True)
-        .order_by("?")
-        .first()
-    )
-    request.session[f"drawn_{session_id}"] = [str(card.id)] if card else []
+    chosen = [str(i) for i in sample_cards(session.deck_id, 1)]
+    request.session[f"drawn_{session_id}"] = chosen
     return redirect("session:room", session_id=session.id)
 
 
@@ -85,12 +88,31 @@ def draw_one(request, session_id):
 def draw_six(request, session_id):
     session = get_object_or_404(Session, id=session_id)
 
-    ids = list(
-        Card.objects.filter(deck=session.deck, is_active=True)
-        .values_list("id", flat=True)
-    )
-    random.shuffle(ids)
-    chosen = [str(i) for i in ids[:6]]
+    chosen = [str(i) for i in sample_cards(session.deck_id, 6)]
     request.session[f"drawn_{session_id}"] = chosen
 
     return redirect("session:room", session_id=session.id)
+
+
+@staff_member_required
+@require_GET
+def export(request):
+    """
+    Stream session history for supervision/analytics:
+    /s/export/?kind=events|sessions&format=ndjson|csv&deck=&mode=&since=&until=
+    """
+    fmt = request.GET.get("format", "ndjson")
+    kind = request.GET.get("kind", "events")
+    if fmt not in FORMATS or kind not in KINDS:
+        return HttpResponseBadRequest("format: ndjson|csv, kind: events|sessions")
+
+    try:
+        filters = parse_filters(request.GET)
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    rows, fields = export_rows(kind, filters)
+    response = StreamingHttpResponse(aiter_sync(serialize(fmt, rows, fields)), content_type=FORMATS[fmt])
+    filename = f"metadeck-{kind}-{timezone.now():%Y%m%d-%H%M}.{fmt}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
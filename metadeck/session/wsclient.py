@@ -0,0 +1,68 @@
+# metadeck/session/wsclient.py
+"""
+Small asyncio WebSocket client on top of the `websockets` library.
+
+Used by management commands that talk to running workers over a real
+socket (check_workers, loadtest_sessions --url). Framing, fragmented
+messages, ping/pong and the close handshake are handled by `websockets`;
+this wrapper only negotiates the codec: text frames are JSON, binary frames
+are decoded with the negotiated codec (session/codecs.py).
+"""
+import asyncio
+from urllib.parse import urlsplit
+
+from websockets.asyncio.client import connect as ws_connect
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+
+from .codecs import JSON, SUBPROTOCOLS
+
+
+class WebSocketClosed(Exception):
+    pass
+
+
+class WSClient:
+    def __init__(self, connection, codec):
+        self.connection = connection
+        self.codec = codec
+
+    @classmethod
+    async def connect(cls, url: str, subprotocols=None, timeout: float = 10):
+        parts = urlsplit(url)
+        # Origin как у браузера: ASGI-приложение проверяет его по ALLOWED_HOSTS
+        origin = f"{'https' if parts.scheme == 'wss' else 'http'}://{parts.netloc}"
+        try:
+            connection = await ws_connect(
+                url,
+                origin=origin,
+                subprotocols=subprotocols,
+                open_timeout=timeout,
+                # keepalive-ping сервера (type "ping") достаточно; протокольные ping/pong — на библиотеке
+                ping_interval=None,
+                compression=None,
+            )
+        except InvalidHandshake as exc:
+            raise WebSocketClosed(f"handshake rejected: {exc}") from exc
+        except asyncio.TimeoutError as exc:
+            raise WebSocketClosed(f"handshake timed out after {timeout}s") from exc
+        return cls(connection, SUBPROTOCOLS.get(connection.subprotocol, JSON))
+
+    # ---------- API ----------
+    async def send_json(self, payload: dict) -> None:
+        try:
+            await self.connection.send(JSON.encode(payload))
+        except ConnectionClosed as exc:
+            raise WebSocketClosed(str(exc)) from exc
+
+    async def recv_json(self, timeout: float | None = None) -> dict:
+        try:
+            data = await asyncio.wait_for(self.connection.recv(), timeout)
+        except ConnectionClosed as exc:
+            code = exc.rcvd.code if exc.rcvd else None
+            raise WebSocketClosed(f"closed by server (code={code})") from exc
+        if isinstance(data, str):
+            return JSON.decode(data)
+        return self.codec.decode(data)
+
+    async def close(self) -> None:
+        await self.connection.close()